@@ -3,8 +3,11 @@
 from __future__ import annotations
 
 from . import obs_suite  # noqa
+from .dataset import write_metadata  # noqa
+from .history import query_tasks  # noqa
 from .merge import merge  # noqa
 from .pre_processing import pre_processing  # noqa
+from .quicklooks import plot_quicklooks  # noqa
 from .split import split  # noqa
 
 __author__ = """Ludwig Lierhammer"""
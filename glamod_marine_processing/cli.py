@@ -229,11 +229,49 @@ class Options:
             is_flag=True,
             help="Run tasks per job script interactively in parallel. This is mainly for BASTION machine.",
         )
+        self.worker_pool = click.option(
+            "-pool",
+            "--worker_pool",
+            is_flag=True,
+            help="Run tasks per job in a pool of long-lived worker processes instead of one python process per task (obs_suite).",
+        )
         self.n_max_jobs = click.option(
             "-n_max",
             "--n_max_jobs",
             default="12",
-            help="Maximum number of jobs running in parallel. Use only with parallel_jobs.",
+            help="Maximum number of jobs running in parallel. Use only with parallel_jobs or parallel_tasks.",
+        )
+        self.task_retries = click.option(
+            "-retries",
+            "--task_retries",
+            default=0,
+            type=int,
+            help="Number of retries of failed tasks run interactively in parallel (obs_suite).",
+        )
+        self.limit_memory = click.option(
+            "-limit_memory",
+            "--limit_memory",
+            is_flag=True,
+            help="Limit memory of tasks run interactively in parallel to the job memory (obs_suite).",
+        )
+        self.pack_tasks = click.option(
+            "-pack",
+            "--pack_tasks",
+            is_flag=True,
+            help="Estimate memory and time of submitted tasks from their input size and pack them into node-sized jobs (obs_suite).",
+        )
+        self.fuse_levels = click.option(
+            "-fuse",
+            "--fuse_levels",
+            is_flag=True,
+            help="Run level1b to level1d of a source-deck month in one process with CDM tables "
+            "passed in memory. Use only with level_end (obs_suite).",
+        )
+        self.write_intermediate = click.option(
+            "-write_intermediate",
+            "--write_intermediate",
+            is_flag=True,
+            help="Write CDM tables of intermediate levels run with fuse_levels (obs_suite).",
         )
         self.nohup = click.option(
             "-nohup",
@@ -255,6 +293,11 @@ class Options:
             * level2: Make data ready to ingest in the database.
             """,
         )
+        self.level_end = click.option(
+            "-le",
+            "--level_end",
+            help="Last step of observation suite process. Run all steps from level to level_end as one pipeline of source-deck monthly tasks.",
+        )
         self.level_source = click.option(
             "-ls",
             "--level_source",
@@ -345,6 +388,17 @@ class Options:
             default=["excluded", "invalid"],
             help="Merge data in additional directories too (post_proc).",
         )
+        self.split_mapping = click.option(
+            "-mapping",
+            "--split_mapping",
+            help="JSON or table file mapping report_id to sid-dck (split_suite).",
+        )
+        self.split_column = click.option(
+            "-column",
+            "--split_column",
+            default="source_id",
+            help="Header column holding sid-dck if no mapping is given (split_suite).",
+        )
         self.overwrite = click.option(
             "-o",
             "--overwrite",
@@ -0,0 +1,41 @@
+"""
+===========================================
+Dataset suite Command Line Interface module
+===========================================
+"""
+
+from __future__ import annotations
+
+import os
+from types import SimpleNamespace
+
+import click
+
+from .cli import CONTEXT_SETTINGS, Cli, add_options
+from .dataset import write_metadata
+
+
+@click.command(context_settings=CONTEXT_SETTINGS)
+@add_options()
+def dataset_cli(
+    machine,
+    release,
+    update,
+    dataset,
+    data_directory,
+):
+    """Entry point for the level3 dataset command line interface."""
+    config = Cli(
+        machine=machine,
+        level="level3",
+        release=release,
+        update=update,
+        dataset=dataset,
+        data_directory=data_directory,
+        suite="obs_suite",
+    ).initialize()
+    p = SimpleNamespace(**config["paths"])
+
+    write_metadata(
+        os.path.join(p.data_directory, release, dataset, "level3", "dataset")
+    )
@@ -0,0 +1,64 @@
+"""
+===========================================
+Task history Command Line Interface module
+===========================================
+"""
+
+from __future__ import annotations
+
+import os
+
+import click
+
+from .cli import CONTEXT_SETTINGS, Cli, add_options
+from .history import query_tasks
+from .obs_suite.lotus_scripts.task_recorder import history_file
+
+
+@click.command(context_settings=CONTEXT_SETTINGS)
+@add_options()
+def history_cli(
+    machine,
+    level,
+    release,
+    dataset,
+    process_list,
+    year_init,
+    year_end,
+    data_directory,
+):
+    """Entry point for the task history command line interface."""
+    config = Cli(
+        machine=machine,
+        level=level,
+        release=release,
+        dataset=dataset,
+        data_directory=data_directory,
+        suite="obs_suite",
+    ).build_configuration()
+    db_file = os.path.join(
+        config["paths"]["data_directory"], release, dataset, "log", history_file
+    )
+
+    years = None
+    if year_init or year_end:
+        year_init = int(year_init or year_end)
+        year_end = int(year_end or year_init)
+        years = list(range(year_init, year_end + 1))
+
+    df = query_tasks(
+        db_file, level=level, sid_dck=list(process_list) or None, year=years
+    )
+    if len(df) == 0:
+        click.echo(f"No tasks recorded in {db_file}.")
+        return
+    click.echo(df.to_string(index=False))
+    summary = df.groupby(["sid_dck", "status"]).agg(
+        tasks=("status", "size"),
+        wall_time=("wall_time", "sum"),
+        cpu_time=("cpu_time", "sum"),
+        max_rss_mb=("max_rss_mb", "max"),
+        input_bytes=("input_bytes", "sum"),
+        output_bytes=("output_bytes", "sum"),
+    )
+    click.echo(summary.to_string())
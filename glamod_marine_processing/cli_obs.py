@@ -14,6 +14,7 @@ from types import SimpleNamespace
 import click
 
 from .cli import CONTEXT_SETTINGS, Cli, add_options
+from .obs_suite.lotus_scripts.slurm_preferences import level_source as level_sources
 from .utilities import add_to_config, load_json, save_json
 
 
@@ -22,6 +23,7 @@ from .utilities import add_to_config, load_json, save_json
 def obs_cli(
     machine,
     level,
+    level_end,
     level_source,
     level_destination,
     release,
@@ -47,88 +49,129 @@ def obs_cli(
     run_jobs,
     parallel_jobs,
     parallel_tasks,
+    worker_pool,
+    task_retries,
+    limit_memory,
+    pack_tasks,
+    fuse_levels,
+    write_intermediate,
     nohup,
     n_max_jobs,
     overwrite,
 ):
     """Entry point for the obs_suite command line interface."""
-    config = Cli(
-        machine=machine,
-        level=level,
-        level_source=level_source,
-        level_destination=level_destination,
-        release=release,
-        release_source=release_source,
-        release_destination=release_destination,
-        update=update,
-        dataset=dataset,
-        dataset_source=dataset_source,
-        dataset_destination=dataset_destination,
-        cdm_tables=cdm_tables,
-        data_directory=data_directory,
-        work_directory=work_directory,
-        config_file=config_file,
-        suite="obs_suite",
-        deck_list=process_list,
-        overwrite=overwrite,
-    ).initialize()
-
-    p = SimpleNamespace(**config["paths"])
-    slurm_script = "level_slurm.py"
-    slurm_script_ = f"{level}_slurm.py"
-    slurm_script_tmp = os.path.join(p.lotus_scripts_directory, slurm_script)
-    slurm_script_new = os.path.join(p.release_directory, slurm_script_)
-    shutil.copyfile(slurm_script_tmp, slurm_script_new)
-
-    level_config_file = f"{level}.json"
-    level_config_file = os.path.join(p.config_files_path, level_config_file)
-
-    config = add_to_config(
-        config,
-        slurm_script=slurm_script_new,
-        level_config_file=level_config_file,
-        machine=machine,
-        key="scripts",
-    )
+    levels = [level]
+    if level_end:
+        all_levels = list(level_sources.keys())
+        levels = all_levels[all_levels.index(level) : all_levels.index(level_end) + 1]
+        if len(levels) == 0:
+            raise ValueError(f"level_end {level_end} is previous to level {level}.")
 
-    config = add_to_config(
-        config,
-        noc_version=noc_version,
-        noc_path=noc_path,
-        pub47_path=pub47_path,
-        key="corrections_mod",
-    )
+    level_config_files = []
+    for i, level_i in enumerate(levels):
+        first = i == 0
+        last = i == len(levels) - 1
+        config = Cli(
+            machine=machine,
+            level=level_i,
+            level_source=level_source if first else "",
+            level_destination=level_destination if last else "",
+            release=release,
+            release_source=release_source if first else release_destination,
+            release_destination=release_destination,
+            update=update,
+            dataset=dataset,
+            dataset_source=dataset_source if first else dataset_destination,
+            dataset_destination=dataset_destination,
+            cdm_tables=cdm_tables,
+            data_directory=data_directory,
+            work_directory=work_directory,
+            config_file=config_file,
+            suite="obs_suite",
+            deck_list=process_list,
+            overwrite=overwrite,
+        ).initialize()
+
+        p = SimpleNamespace(**config["paths"])
+        slurm_script = "level_slurm.py"
+        slurm_script_ = f"{level_i}_slurm.py"
+        slurm_script_tmp = os.path.join(p.lotus_scripts_directory, slurm_script)
+        slurm_script_new = os.path.join(p.release_directory, slurm_script_)
+        shutil.copyfile(slurm_script_tmp, slurm_script_new)
+
+        level_config_file = f"{level_i}.json"
+        level_config_file = os.path.join(p.config_files_path, level_config_file)
+
+        config = add_to_config(
+            config,
+            slurm_script=slurm_script_new,
+            level_config_file=level_config_file,
+            machine=machine,
+            key="scripts",
+        )
+
+        config = add_to_config(
+            config,
+            noc_version=noc_version,
+            noc_path=noc_path,
+            pub47_path=pub47_path,
+            key="corrections_mod",
+        )
 
-    level_config = load_json(level_config_file)
-    level_config["submit_jobs"] = submit_jobs
-    level_config["run_jobs"] = run_jobs
-    level_config["parallel_jobs"] = parallel_jobs
-    level_config["parallel_tasks"] = parallel_tasks
-    level_config["n_max_jobs"] = n_max_jobs
-    level_config["nohup"] = nohup
-    level_config["level"] = level
-    level_config["overwrite"] = overwrite
-    if isinstance(process_list, str):
-        process_list = [process_list]
-    level_config["process_list"] = process_list
-    level_config["year_init"] = year_init
-    level_config["year_end"] = year_end
-    if source_pattern:
-        level_config["source_pattern"] = source_pattern
-    if prev_file_id:
-        if prev_file_id[0] != "*":
-            prev_file_id = f"*{prev_file_id}"
-        if prev_file_id[-1] != "*":
-            prev_file_id = f"{prev_file_id}*"
-        level_config["prev_fileID"] = prev_file_id
-
-    for key, value in config.items():
-        level_config[key] = value
-
-    current_time = datetime.datetime.now()
-    current_time = current_time.strftime("%Y%m%dT%H%M%S")
-
-    new_config = f"{level}_{current_time}.json"
-    new_config = os.path.join(p.release_directory, new_config)
-    save_json(level_config, new_config)
-    os.system(f"python {slurm_script_new} {new_config}")
+        level_config = load_json(level_config_file)
+        level_config["submit_jobs"] = submit_jobs
+        level_config["run_jobs"] = run_jobs
+        level_config["parallel_jobs"] = parallel_jobs
+        level_config["parallel_tasks"] = parallel_tasks
+        level_config["worker_pool"] = worker_pool
+        level_config["task_retries"] = task_retries
+        level_config["limit_memory"] = limit_memory
+        level_config["pack_tasks"] = pack_tasks
+        level_config["n_max_jobs"] = n_max_jobs
+        level_config["nohup"] = nohup
+        level_config["level"] = level_i
+        level_config["overwrite"] = overwrite
+        if isinstance(process_list, str):
+            process_list = [process_list]
+        level_config["process_list"] = process_list
+        level_config["year_init"] = year_init
+        level_config["year_end"] = year_end
+        if source_pattern and first:
+            level_config["source_pattern"] = source_pattern
+        if prev_file_id and first:
+            if prev_file_id[0] != "*":
+                prev_file_id = f"*{prev_file_id}"
+            if prev_file_id[-1] != "*":
+                prev_file_id = f"{prev_file_id}*"
+            level_config["prev_fileID"] = prev_file_id
+
+        for key, value in config.items():
+            level_config[key] = value
+
+        current_time = datetime.datetime.now()
+        current_time = current_time.strftime("%Y%m%dT%H%M%S")
+
+        new_config = f"{level_i}_{current_time}.json"
+        new_config = os.path.join(p.release_directory, new_config)
+        save_json(level_config, new_config)
+        level_config_files.append(new_config)
+
+    if len(levels) == 1:
+        os.system(f"python {slurm_script_new} {new_config}")
+        return
+
+    pipeline_file = f"pipeline_{levels[0]}_{levels[-1]}_{current_time}.json"
+    pipeline_file = os.path.join(p.release_directory, pipeline_file)
+    save_json(
+        {
+            "levels": level_config_files,
+            "fuse_levels": fuse_levels,
+            "write_intermediate": write_intermediate,
+        },
+        pipeline_file,
+    )
+    pipeline_script = os.path.join(p.lotus_scripts_directory, "pipeline.py")
+    command = f"python {pipeline_script} {pipeline_file}"
+    if nohup is True and submit_jobs is not True:
+        command = f"nohup {command} > {pipeline_file}.out 2>&1 &"
+    os.system(command)
@@ -0,0 +1,49 @@
+"""
+=============================================
+Quicklook suite Command Line Interface module
+=============================================
+"""
+
+from __future__ import annotations
+
+import os
+from types import SimpleNamespace
+
+import click
+
+from .cli import CONTEXT_SETTINGS, Cli, add_options
+from .quicklooks import plot_quicklooks
+
+
+@click.command(context_settings=CONTEXT_SETTINGS)
+@add_options()
+def quicklook_cli(
+    machine,
+    level,
+    release,
+    update,
+    dataset,
+    data_directory,
+    process_list,
+    n_max_jobs,
+    overwrite,
+):
+    """Entry point for the quicklook plotting command line interface."""
+    config = Cli(
+        machine=machine,
+        level=level,
+        release=release,
+        update=update,
+        dataset=dataset,
+        data_directory=data_directory,
+        suite="obs_suite",
+        deck_list=process_list,
+    ).initialize()
+    p = SimpleNamespace(**config["paths"])
+
+    ql_dir = os.path.join(p.data_directory, release, dataset, level, "quicklooks")
+    if isinstance(process_list, str):
+        process_list = [process_list]
+    ql_dirs = [os.path.join(ql_dir, sid_dck) for sid_dck in process_list] or [ql_dir]
+    for ql_dir in ql_dirs:
+        plot_quicklooks(ql_dir, n_jobs=n_max_jobs, overwrite=overwrite)
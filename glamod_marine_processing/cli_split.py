@@ -13,7 +13,7 @@ import click
 
 from .cli import CONTEXT_SETTINGS, Cli, add_options
 from .split import split
-from .utilities import load_json, mkdir, read_txt
+from .utilities import load_json, read_txt
 
 
 def open_deck_list_file(config_files_path, level_config_file):
@@ -36,11 +36,12 @@ def split_cli(
     dataset,
     data_directory,
     additional_directories,
-    available_date_information,
+    split_mapping,
+    split_column,
     parallel_jobs,
     overwrite,
 ):
-    """Entry point for the pre-processing command line interface."""
+    """Entry point for the split command line interface."""
     config = Cli(
         machine=machine,
         level=level,
@@ -52,37 +53,24 @@ def split_cli(
     ).initialize()
     p = SimpleNamespace(**config["paths"])
 
-    future_deck = open_deck_list_file(p.config_files_path, f"{level}.json")
-    prev_deck_list = open_deck_list_file(p.config_files_path, f"{level_source}.json")
+    deck_list = open_deck_list_file(p.config_files_path, f"{level}.json")
+    prev_deck = open_deck_list_file(p.config_files_path, f"{level_source}.json")[0]
     input_dir = os.path.join(p.data_directory, release, dataset, level_source)
-    output_dir = os.path.join(input_dir, future_deck[0])
-    mkdir(output_dir)
-    split(
-        idir=input_dir,
-        odir=output_dir,
-        release=release,
-        update=update,
-        prev_deck_list=prev_deck_list,
-        date_avail=available_date_information,
-        parallel=parallel_jobs,
-        overwrite=overwrite,
-    )
 
     if isinstance(additional_directories, str):
         additional_directories = [additional_directories]
-    for additional_directory in additional_directories:
-        input_dir = os.path.join(
-            p.data_directory, release, dataset, level_source, additional_directory
-        )
-        output_dir = os.path.join(input_dir, future_deck[0])
-        mkdir(output_dir)
+    for data_dir in [input_dir] + [
+        os.path.join(input_dir, additional_directory)
+        for additional_directory in additional_directories
+    ]:
+        if not os.path.isdir(os.path.join(data_dir, prev_deck)):
+            continue
         split(
-            idir=input_dir,
-            odir=output_dir,
-            release=release,
-            update=update,
-            prev_deck_list=prev_deck_list,
-            date_avail=available_date_information,
-            cdm_tables=False,
+            idir=os.path.join(data_dir, prev_deck),
+            odir=data_dir,
+            deck_list=deck_list,
+            mapping=split_mapping,
+            column=split_column,
+            parallel=parallel_jobs,
             overwrite=overwrite,
         )
@@ -0,0 +1,5 @@
+"""GLAMOD marine processing partitioned dataset package."""
+
+from __future__ import annotations
+
+from .dataset import write_metadata, write_partitions  # noqa
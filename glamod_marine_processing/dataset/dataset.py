@@ -0,0 +1,84 @@
+"""Write hive-partitioned parquet datasets and their summary metadata."""
+
+from __future__ import annotations
+
+import glob
+import logging
+import os
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+partition_schema = pa.schema(
+    [
+        ("year", pa.int16()),
+        ("month", pa.int8()),
+        ("observed_variable", pa.int64()),
+    ]
+)
+
+metadata_file = "_metadata"
+common_metadata_file = "_common_metadata"
+max_rows_per_group = 65536
+
+
+def remove_partitions(root, basename):
+    """Remove files of basename from all partitions of a dataset."""
+    pattern = os.path.join(root, "**", f"{basename}-*.parquet")
+    for filename in glob.glob(pattern, recursive=True):
+        os.remove(filename)
+
+
+def write_partitions(table, root, basename, sort_by="report_timestamp"):
+    """Write table to a hive-partitioned parquet dataset.
+
+    Rows are sorted by sort_by, so the row group statistics allow
+    predicate pushdown on time. Existing files with other basenames
+    are kept.
+    """
+    table = table.sort_by(sort_by)
+    ds.write_dataset(
+        table,
+        root,
+        format="parquet",
+        partitioning=ds.partitioning(partition_schema, flavor="hive"),
+        basename_template=f"{basename}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        max_rows_per_group=max_rows_per_group,
+        min_rows_per_group=min(max_rows_per_group, len(table)),
+        preserve_order=True,
+    )
+    logging.info(f"Output written to dataset: {root}/**/{basename}-*.parquet")
+
+
+def write_metadata(root):
+    """Write _metadata and _common_metadata summary files of a dataset.
+
+    Files with a schema other than the first file's are left out.
+    """
+    filenames = sorted(glob.glob(os.path.join(root, "**", "*.parquet"), recursive=True))
+    if len(filenames) == 0:
+        logging.warning(f"No parquet files found in dataset: {root}")
+        return
+
+    metadata = None
+    for filename in filenames:
+        file_metadata = pq.read_metadata(filename)
+        file_metadata.set_file_path(
+            os.path.relpath(filename, root).replace(os.sep, "/")
+        )
+        if metadata is None:
+            metadata = file_metadata
+        elif not file_metadata.schema.equals(metadata.schema):
+            logging.warning(f"Schema differs from dataset schema. Skip: {filename}")
+        else:
+            metadata.append_row_groups(file_metadata)
+
+    pq.write_metadata(
+        metadata.schema.to_arrow_schema(), os.path.join(root, common_metadata_file)
+    )
+    metadata.write_metadata_file(os.path.join(root, metadata_file))
+    logging.info(
+        f"Summary metadata of {metadata.num_row_groups} row groups written: {root}"
+    )
@@ -0,0 +1,6 @@
+"""GLAMOD marine processing task history package."""
+
+from __future__ import annotations
+
+from ..obs_suite.lotus_scripts.task_recorder import record_task  # noqa
+from .history import fit_task_model, get_task_limits, query_tasks  # noqa
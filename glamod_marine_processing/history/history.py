@@ -0,0 +1,78 @@
+"""Query and fit wall time, CPU time, memory and sizes of level tasks."""
+
+from __future__ import annotations
+
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from ..obs_suite.lotus_scripts.task_recorder import columns, connect
+
+
+def query_tasks(db_file, level=None, sid_dck=None, year=None, status=None):
+    """Query task history, optionally by level, sid-dck(s), year(s) and status."""
+    if not os.path.isfile(db_file):
+        logging.warning(f"Task history not found: {db_file}")
+        return pd.DataFrame(columns=list(columns.keys()))
+    conditions = []
+    params = []
+    for name, value in [
+        ("level", level),
+        ("sid_dck", sid_dck),
+        ("year", year),
+        ("status", status),
+    ]:
+        if value is None or value == [] or value == ():
+            continue
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+        conditions.append(f"{name} IN ({', '.join('?' for _ in value)})")
+        params.extend(value)
+    query = "SELECT * FROM tasks"
+    if len(conditions) > 0:
+        query = f"{query} WHERE {' AND '.join(conditions)}"
+    con = connect(db_file)
+    try:
+        return pd.read_sql_query(f"{query} ORDER BY start", con, params=params)
+    finally:
+        con.close()
+
+
+def fit_line(x, y):
+    """Fit line to y(x) shifted to cover all observations."""
+    if len(np.unique(x)) < 2:
+        return [float(np.max(y)), 0.0]
+    slope, intercept = np.polyfit(x, y, 1)
+    slope = max(slope, 0.0)
+    intercept = float(np.max(y - slope * x))
+    return [max(intercept, 0.0), float(slope)]
+
+
+def fit_task_model(db_file, level, margin=1.2, min_tasks=3):
+    """Fit memory (MB) and time (min) of successful tasks to input size (MB).
+
+    The fitted lines are shifted to cover all recorded tasks and scaled
+    by margin. Tasks without peak memory (later tasks of pool workers) are
+    ignored. Returns None with less than min_tasks recorded tasks.
+    """
+    df = query_tasks(db_file, level=level, status="success")
+    df = df[df["max_rss_mb"].notna()]
+    if len(df) < min_tasks:
+        return
+    size_mb = df["input_bytes"].to_numpy(dtype=float) / 1024**2
+    memory_mb = df["max_rss_mb"].to_numpy(dtype=float)
+    time_min = df["wall_time"].to_numpy(dtype=float) / 60
+    return {
+        "memory_mb": [v * margin for v in fit_line(size_mb, memory_mb)],
+        "time_min": [v * margin for v in fit_line(size_mb, time_min)],
+    }
+
+
+def get_task_limits(db_file, level, sid_dck, margin=1.2):
+    """Get maximum memory (MB) and time (min) of successful sid-dck tasks."""
+    df = query_tasks(db_file, level=level, sid_dck=sid_dck, status="success")
+    if df["max_rss_mb"].notna().sum() == 0:
+        return
+    return df["max_rss_mb"].max() * margin, df["wall_time"].max() / 60 * margin
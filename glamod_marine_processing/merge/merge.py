@@ -4,14 +4,29 @@ from __future__ import annotations
 
 import glob
 import itertools
+import logging
 import os
+import shutil
+import tempfile
 from pathlib import Path
+from warnings import warn
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from cdm_reader_mapper import read_tables
 from cdm_reader_mapper.cdm_mapper import properties
 from joblib import Parallel, delayed
 
+data_formats = {
+    ".pq": "parquet",
+    ".parquet": "parquet",
+    ".psv": "csv",
+    ".csv": "csv",
+}
+
+copy_buffer_size = 16 * 1024 * 1024
+
 
 def get_year_month(df, time_axis):
     """Group dataframe by year-month."""
@@ -32,37 +47,161 @@ def get_file_dict(file_list):
     return file_dict
 
 
-def concat_unknow_date_files(idir, odir, table, release, update, prev_deck_list):
-    """Open files and concat them."""
+def read_deck_table(idir, prev_deck, table):
+    """Read all files of table of one deck."""
+    df_list = []
+    for ifile in sorted(glob.glob(os.path.join(idir, prev_deck, f"{table}-*"))):
+        suffix = Path(ifile).suffix
+        if suffix not in data_formats.keys():
+            continue
+        try:
+            db = read_tables(ifile, data_format=data_formats[suffix], cdm_subset=table)
+        except ValueError:
+            logging.warning(f"Skipping unreadable CDM file: {ifile}.")
+            continue
+        df_list.append(db.data)
+    if len(df_list) == 0:
+        return pd.DataFrame()
+    return pd.concat(df_list, ignore_index=True)
+
+
+def write_deck_partitions(idir, tmp_dir, table, prev_deck, i):
+    """Write table of one deck to one temporary file per month."""
     if table == "header":
         time_axis = "report_timestamp"
     else:
         time_axis = "date_time"
-    for prev_deck in prev_deck_list:
-        table_dir = os.path.join(idir, prev_deck)
-        table_df = read_tables(table_dir, cdm_subset=table)
-        if table_df.empty:
-            continue
-        next = False
-        try:
-            table_df = table_df[table]
-        except KeyError:
-            next = True
-        if next is True:
-            continue
-        year_month = get_year_month(table_df, time_axis)
-        for ym, df in table_df.groupby(year_month):
-            oname = os.path.join(odir, f"{table}-{ym}-{release}-{update}.psv")
-            header = None
-            mode = "a"
-            if not os.path.isfile(oname):
-                mode = "w"
-                header = df.columns
-            df.to_csv(oname, sep="|", header=header, mode=mode, index=False)
+    table_df = read_deck_table(idir, prev_deck, table)
+    if table_df.empty:
+        return []
+    partitions = []
+    year_month = get_year_month(table_df, time_axis)
+    for ym, df in table_df.groupby(year_month):
+        oname = os.path.join(tmp_dir, f"{table}-{ym}-{i:04d}.pq")
+        df.to_parquet(oname, index=False)
+        partitions.append((table, str(ym), oname))
+    return partitions
+
+
+def write_month(partitions, oname):
+    """Concat temporary deck files of one month and table.
+
+    Object columns of mixed types across decks are written as strings.
+    """
+    df = pd.concat([pd.read_parquet(ifile) for ifile in partitions], ignore_index=True)
+    try:
+        df.to_parquet(oname, index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        columns = df.select_dtypes("object").columns
+        df[columns] = df[columns].astype("string")
+        df.to_parquet(oname, index=False)
+
+
+def concat_unknow_date_files(
+    idir, odir, tables, release, update, prev_deck_list, n_jobs=1
+):
+    """Open files and concat them by month.
+
+    Tables of all decks are read and split into months in parallel.
+    Each output file is written by one worker afterwards, with the decks
+    in order of prev_deck_list.
+    """
+    for table in [table for table in tables if table not in properties.cdm_tables]:
+        warn(f"Table {table} is not a CDM table. Skip merging.")
+    tables = [table for table in tables if table in properties.cdm_tables]
+
+    os.makedirs(odir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".merge-", dir=odir)
+    try:
+        partitions = Parallel(n_jobs=n_jobs)(
+            delayed(write_deck_partitions)(idir, tmp_dir, table, prev_deck, i)
+            for table in tables
+            for i, prev_deck in enumerate(prev_deck_list)
+        )
+        month_dict = {}
+        for table, ym, ifile in itertools.chain(*partitions):
+            month_dict.setdefault((table, ym), []).append(ifile)
+        Parallel(n_jobs=n_jobs)(
+            delayed(write_month)(
+                ifiles, os.path.join(odir, f"{table}-{ym}-{release}-{update}.pq")
+            )
+            for (table, ym), ifiles in month_dict.items()
+        )
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def copy_remaining(fsrc, fdst):
+    """Copy binary file fsrc from its current position to the end of fdst.
+
+    Data is copied within the kernel if possible.
+    """
+    offset = fsrc.tell()
+    size = os.fstat(fsrc.fileno()).st_size - offset
+    fdst.flush()
+    try:
+        while size > 0:
+            n = os.copy_file_range(
+                fsrc.fileno(), fdst.fileno(), size, offset_src=offset
+            )
+            if n == 0:
+                break
+            offset += n
+            size -= n
+    except (AttributeError, OSError):
+        fsrc.seek(offset)
+        shutil.copyfileobj(fsrc, fdst, copy_buffer_size)
+
+
+def concat_text_files(ifiles, oname):
+    """Concat text files, skip the header line of all but the first file."""
+    with open(oname, "wb") as fdst:
+        for i, ifile in enumerate(ifiles):
+            with open(ifile, "rb") as fsrc:
+                if i > 0:
+                    fsrc.readline()
+                copy_remaining(fsrc, fdst)
+
+
+def conform_table(table, schema):
+    """Conform arrow table to schema, missing columns are set to null."""
+    columns = [
+        (
+            table[field.name].cast(field.type)
+            if field.name in table.column_names
+            else pa.nulls(table.num_rows, field.type)
+        )
+        for field in schema
+    ]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def concat_parquet_files(ifiles, oname):
+    """Concat parquet files row group by row group."""
+    pfiles = [pq.ParquetFile(ifile) for ifile in ifiles]
+    try:
+        schema = pa.unify_schemas(
+            [pfile.schema_arrow for pfile in pfiles], promote_options="permissive"
+        )
+        with pq.ParquetWriter(oname, schema) as writer:
+            for pfile in pfiles:
+                for i in range(pfile.num_row_groups):
+                    writer.write_table(conform_table(pfile.read_row_group(i), schema))
+    finally:
+        for pfile in pfiles:
+            pfile.close()
+
+
+def concat_files(ifiles, oname):
+    """Concat files, choose method from file extension."""
+    if data_formats.get(Path(oname).suffix) == "parquet":
+        concat_parquet_files(ifiles, oname)
+    else:
+        concat_text_files(ifiles, oname)
 
 
 def concat_known_date_files(idir, odir, table, release, update, prev_deck_list):
-    """Concat file with subprocess."""
+    """Concat files of same name of all decks."""
     file_list = [
         glob.glob(os.path.join(idir, prev_deck, f"{table}-*"))
         for prev_deck in prev_deck_list
@@ -70,17 +209,7 @@ def concat_known_date_files(idir, odir, table, release, update, prev_deck_list):
     file_list = list(itertools.chain(*file_list))
     file_dict = get_file_dict(file_list)
     for name, flist in file_dict.items():
-        with open(os.path.join(odir, name), "w") as outfile:
-            i = 0
-            for fname in flist:
-                if i > 0:
-                    skip = 1
-                else:
-                    skip = 0
-                with open(fname) as infile:
-                    for line in itertools.islice(infile, skip, None):
-                        outfile.write(line)
-                i += 1
+        concat_files(flist, os.path.join(odir, name))
 
 
 def merge(
@@ -113,7 +242,8 @@ def merge(
     cdm_tables: bool
         Use cdm table names.
     parallel: bool
-        Compute tables in parallel.
+        Compute tables in parallel. If date information is not in file
+        names, compute decks and tables in parallel.
     overwrite: bool
         If True, overwrite already existing files.
     """
@@ -127,11 +257,6 @@ def merge(
         tables = ["*"]
         parallel = False
 
-    if date_avail is True:
-        concat_func = concat_known_date_files
-    else:
-        concat_func = concat_unknow_date_files
-
     kwargs = {
         "idir": idir,
         "odir": odir,
@@ -140,9 +265,12 @@ def merge(
         "prev_deck_list": prev_deck_list,
     }
 
-    if parallel is True:
+    if date_avail is not True:
+        n_jobs = -1 if parallel is True else 1
+        concat_unknow_date_files(tables=tables, n_jobs=n_jobs, **kwargs)
+    elif parallel is True:
         Parallel(n_jobs=len(tables))(
-            delayed(concat_func)(table=table, **kwargs) for table in tables
+            delayed(concat_known_date_files)(table=table, **kwargs) for table in tables
         )
     else:
-        [concat_func(table=table, **kwargs) for table in tables]
+        [concat_known_date_files(table=table, **kwargs) for table in tables]
@@ -0,0 +1,406 @@
+"""Common functions of the LOTUS scripts."""
+
+from __future__ import annotations
+
+import fnmatch
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+from functools import lru_cache
+from importlib.metadata import PackageNotFoundError, version
+
+import pandas as pd
+
+from glamod_marine_processing.obs_suite.lotus_scripts import slurm_preferences
+from glamod_marine_processing.utilities import load_json, manifest_file
+
+DATE_REGEX = r"([1-2][0-9]{3})-(0[1-9]|1[0-2])"
+SID_DCK_REGEX = r"[0-9]{3}-[0-9]{3}"
+
+
+def check_file_exist(files):
+    """Check whether file exists."""
+    files = [files] if not isinstance(files, list) else files
+    for filei in files:
+        if not os.path.isfile(filei):
+            logging.error(f"File {filei} does not exist. Exiting")
+            sys.exit(1)
+
+
+def check_dir_exit(dirs):
+    """Check whether directory exists."""
+    dirs = [dirs] if not isinstance(dirs, list) else dirs
+    for diri in dirs:
+        if not os.path.isdir(diri):
+            logging.error(f"Directory {diri} does not exist. Exiting")
+            sys.exit(1)
+
+
+def launch_process(process):
+    """Launch process."""
+    proc = subprocess.Popen(
+        [process], shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    jid_by, err = proc.communicate()
+    if len(err) > 0:
+        logging.error("Error launching process. Exiting")
+        logging.info(f"Error is: {err}")
+        sys.exit(1)
+    jid = jid_by.decode("UTF-8").rstrip()
+
+    return jid.split(" ")[-1]
+
+
+def source_dataset(level, release):
+    """Get source dataset."""
+    if level == "level1a":
+        return "datasets"
+    return release
+
+
+def get_yyyymm(filename):
+    """Extract date from filename."""
+    yyyy_mm = re.search(DATE_REGEX, os.path.basename(filename))
+    if not (yyyy_mm):
+        logging.warning(f"Could not extract date from filename {filename}")
+        return (None, None)
+    return yyyy_mm.group().split("-")
+
+
+def is_in_range(yyyy, mm, year_init, year_end):
+    """Check whether date is in time period range."""
+    add = False
+    if not all((yyyy, mm)):
+        add = True
+    elif int(yyyy) >= year_init and int(yyyy) <= year_end:
+        add = True
+    elif (int(yyyy) == year_init - 1 and int(mm) == 12) or (
+        int(yyyy) == year_end + 1 and int(mm) == 1
+    ):
+        add = True
+    return add
+
+
+def scan_source(source_dir, process_list, source_pattern):
+    """Scan source directories of all sid-dcks once.
+
+    Returns a table of source files with columns sid_dck, yyyy, mm,
+    filename and the index of the first source pattern the file name
+    matches. Selection manifests are resolved to their source directory.
+    """
+    matches = [re.compile(fnmatch.translate(p)).match for p in source_pattern]
+    rows = []
+    for sid_dck in process_list:
+        path = os.path.join(source_dir, sid_dck)
+        try:
+            with os.scandir(path) as entries:
+                files = {e.name: e.path for e in entries if e.name[0] != "."}
+        except (FileNotFoundError, NotADirectoryError):
+            logging.warning(f"{sid_dck}: Source directory {path} does not exist")
+            continue
+        if manifest_file in files:
+            manifest = load_json(files[manifest_file])
+            path = manifest["source_directory"]
+            files = {name: os.path.join(path, name) for name in manifest["included"]}
+        for name, filename in files.items():
+            for i, match in enumerate(matches):
+                if match(name):
+                    rows.append((sid_dck, filename, name, i))
+                    break
+    table = pd.DataFrame(rows, columns=["sid_dck", "filename", "name", "pattern"])
+    dates = table["name"].astype(object).str.extract(DATE_REGEX)
+    table["yyyy"] = dates[0].astype(object).where(dates[0].notna(), None)
+    table["mm"] = dates[1].astype(object).where(dates[1].notna(), None)
+    return table[["sid_dck", "yyyy", "mm", "filename", "pattern"]]
+
+
+def select_source(table, periods, one_task=False):
+    """Select source files within the release periods.
+
+    With one_task, only the first file of the first matching source
+    pattern is selected per sid-dck.
+    """
+    table = table.sort_values(["sid_dck", "pattern", "filename"], kind="stable")
+    if one_task is True:
+        table = table.groupby("sid_dck", sort=False).head(1)
+    sid_dcks = table["sid_dck"]
+    year_init = sid_dcks.map(lambda s: int(get_year(periods, s, "year_init")))
+    year_end = sid_dcks.map(lambda s: int(get_year(periods, s, "year_end")))
+    yyyy = pd.to_numeric(table["yyyy"])
+    mm = pd.to_numeric(table["mm"])
+    in_range = (
+        yyyy.isna()
+        | mm.isna()
+        | ((yyyy >= year_init) & (yyyy <= year_end))
+        | ((yyyy == year_init - 1) & (mm == 12))
+        | ((yyyy == year_end + 1) & (mm == 1))
+    )
+    return table[in_range]
+
+
+def get_pattern(yyyy, mm, sid_dck):
+    """Get SIDDCK_YEAR-MONTH pattern."""
+    date = []
+    if yyyy is not None:
+        date += [yyyy]
+    if mm is not None:
+        date += [mm]
+    date = "-".join(date)
+    if len(date) > 0:
+        date = f"_{date}"
+    return f"{sid_dck}{date}"
+
+
+def get_year(periods, sid_dck, yr_str):
+    """Get period year."""
+    if sid_dck in periods.keys():
+        return periods[sid_dck].get(yr_str)
+    return periods.get(yr_str)
+
+
+def shift_month(yyyy, mm, shift):
+    """Shift month by number of months."""
+    n = int(yyyy) * 12 + int(mm) - 1 + shift
+    return f"{n // 12:04d}", f"{n % 12 + 1:02d}"
+
+
+def get_task_command(pycommand, log_diri, pattern, table_file=None):
+    """Get taskfarm line running one task and writing its marker file.
+
+    The task configuration is read from the task table, if any, or from
+    its input file. The success marker is a copy of the task fingerprint.
+    """
+    if table_file is not None:
+        pycommand = f"{pycommand} {table_file} {pattern}"
+    else:
+        pycommand = f"{pycommand} {log_diri}/{pattern}.input"
+    return (
+        "{0} > {1}/{2}.out 2> {1}/{2}.out; if [ $? -eq 0 ]; "
+        "then rm -f {1}/{2}.failure; "
+        "cp {1}/{2}.fingerprint {1}/{2}.success; "
+        "else touch {1}/{2}.failure; exit 1; fi".format(pycommand, log_diri, pattern)
+    )
+
+
+def get_job_memory(config, sid_dck):
+    """Get job memory in MB, optionally per sid-dck."""
+    memi = config.get(sid_dck, {}).get("job_memo_mb")
+    return config["job_memo_mb"] if not memi else memi
+
+
+def get_job_time(config, sid_dck, level):
+    """Get job time as HH:MM:SS, optionally per sid-dck."""
+    if level in slurm_preferences.ti.keys():
+        return slurm_preferences.ti[level]
+    t_hhi = config.get(sid_dck, {}).get("job_time_hr")
+    t_mmi = config.get(sid_dck, {}).get("job_time_min")
+    if t_hhi and t_mmi:
+        return ":".join([t_hhi, t_mmi, "00"])
+    return ":".join([config["job_time_hr"], config["job_time_min"], "00"])
+
+
+def get_task_workers(config, sid_dck, level):
+    """Get number of CPUs a task uses, optionally per sid-dck.
+
+    A sharded level1a task runs at most shard_workers shards at a time,
+    or all of a fixed number of shards.
+    """
+    if level != "level1a":
+        return 1
+    options = []
+    for opt in ["shard_workers", "shards"]:
+        value = config.get(sid_dck, {}).get(opt) or config.get(opt)
+        if value:
+            options.append(int(value))
+    workers = min(options) if len(options) > 0 else 1
+    return min(workers, slurm_preferences.node_tasks)
+
+
+def get_tasks_per_node(level, memi, workers=1):
+    """Get number of tasks per node, each using workers CPUs."""
+    if level in slurm_preferences.TaskPNi.keys():
+        return slurm_preferences.TaskPNi[level]
+    return min(
+        int(slurm_preferences.node_memory_mb / float(memi)),
+        slurm_preferences.node_tasks // workers,
+    )
+
+
+def get_input_files(filename):
+    """Get task input files, all CDM tables of a header file."""
+    basename = os.path.basename(filename)
+    if basename.startswith("header"):
+        suffix = basename[len("header") :]
+        return glob.glob(os.path.join(os.path.dirname(filename), f"*{suffix}"))
+    return [filename]
+
+
+def get_input_size(filename):
+    """Get size of task input in MB, summed over all CDM tables."""
+    files = get_input_files(filename)
+    return sum(os.path.getsize(f) for f in files if os.path.isfile(f)) / 1024**2
+
+
+def estimate_task(level, size_mb, task_model=None):
+    """Estimate memory (MB) and time (min) of task from its input size."""
+    if not task_model:
+        task_model = slurm_preferences.task_model.get(
+            level, slurm_preferences.task_model["default"]
+        )
+    memory_mb = task_model["memory_mb"][0] + task_model["memory_mb"][1] * size_mb
+    time_min = task_model["time_min"][0] + task_model["time_min"][1] * size_mb
+    return min(memory_mb, slurm_preferences.node_memory_mb), time_min
+
+
+def pack_tasks(tasks, memory_mb=None, n_tasks=None):
+    """Pack tasks into node-sized bins, first-fit decreasing by memory.
+
+    A task counts as its number of workers (default 1) towards n_tasks.
+    """
+    memory_mb = memory_mb or slurm_preferences.node_memory_mb
+    n_tasks = n_tasks or slurm_preferences.node_tasks
+    bins = []
+    for task in sorted(tasks, key=lambda t: t["memory_mb"], reverse=True):
+        workers = task.get("workers", 1)
+        for bin_ in bins:
+            if bin_["workers"] + workers > n_tasks:
+                continue
+            if bin_["memory_mb"] + task["memory_mb"] > memory_mb:
+                continue
+            bin_["tasks"].append(task)
+            bin_["memory_mb"] += task["memory_mb"]
+            bin_["time_min"] = max(bin_["time_min"], task["time_min"])
+            bin_["workers"] += workers
+            break
+        else:
+            bins.append(
+                {
+                    "tasks": [task],
+                    "memory_mb": task["memory_mb"],
+                    "time_min": task["time_min"],
+                    "workers": workers,
+                }
+            )
+    return bins
+
+
+@lru_cache
+def get_versions():
+    """Get versions of the packages a task result depends on."""
+    versions = {}
+    for package in slurm_preferences.fingerprint_packages:
+        try:
+            versions[package] = version(package)
+        except PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def get_context_files(config):
+    """Get source files a task reads in addition to its input files.
+
+    Level1e reads the previous and next month of its sid-dck and the
+    previous, current and next month of the buoy sid-dck (qc_settings:
+    grouped_reports), each from the level1d tables and the level1d QC
+    context.
+    """
+    level = config["level"]
+    source_dir = os.path.dirname(config["filename"])
+    if level in slurm_preferences.one_task or level == "level1c":
+        return glob.glob(os.path.join(source_dir, "header-*"))
+    if level != "level1e":
+        return []
+
+    source_root = config["paths"]["source_directory"]
+    context_dirs = {
+        source_dir: [-1, 1],
+        os.path.join(source_root, "context", config["sid_dck"]): [-1, 1],
+    }
+    qc_dict = (config.get("qc_settings") or {}).get("grouped_reports") or {}
+    buoy_dataset = qc_dict.get("buoy_dataset")
+    buoy_dck = qc_dict.get("buoy_dck")
+    if config.get("no_qc_suite") is not True and buoy_dataset and buoy_dck:
+        dataset = config["abbreviations"]["dataset"]
+        buoy_root = source_root.replace(dataset, buoy_dataset)
+        for buoy_dir in [buoy_root, os.path.join(buoy_root, "context")]:
+            context_dirs[os.path.join(buoy_dir, buoy_dck)] = [-1, 0, 1]
+
+    files = []
+    for context_dir, shifts in context_dirs.items():
+        for shift in shifts:
+            yyyy, mm = shift_month(config["yyyy"], config["mm"], shift)
+            pattern = os.path.join(context_dir, f"*-{yyyy}-{mm}-*")
+            files.extend(glob.glob(pattern))
+    return files
+
+
+def get_leak_files(config):
+    """Get datetime leak files of other months into the month of a task."""
+    source_dir = os.path.dirname(config["filename"])
+    files = []
+    for ext in ["psv", "feather"]:
+        pattern = f"*-{config['yyyy']}-{config['mm']}-*-????-??.{ext}"
+        files += glob.glob(os.path.join(source_dir, pattern))
+    return files
+
+
+def get_file_hash(filename):
+    """Get sha256 hash of file content."""
+    with open(filename, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def get_fingerprint(config, upstream=None):
+    """Get fingerprint of task inputs, effective configuration and versions.
+
+    Input files are identified by path, size and modification time. Options
+    not affecting the task result and configurations of other sid-dcks are
+    ignored. A task fused to the previous level reads its
+    input in memory: it is identified by the upstream fingerprint instead
+    and by the content of the datetime leak files of its month, which are
+    rewritten by the fused tasks of other months.
+    """
+    inputs = []
+    if upstream is None:
+        files = set(get_input_files(config["filename"]))
+        files.update(get_context_files(config))
+        for f in sorted(files):
+            if os.path.isfile(f):
+                stat = os.stat(f)
+                inputs.append([f, stat.st_size, stat.st_mtime_ns])
+    else:
+        for f in sorted(get_leak_files(config)):
+            inputs.append([f, get_file_hash(f)])
+    settings = {
+        k: v
+        for k, v in config.items()
+        if k not in slurm_preferences.fingerprint_ignore
+        and (k == config.get("sid_dck") or not re.fullmatch(SID_DCK_REGEX, k))
+    }
+    add_file = config.get("cmd_add_file")
+    if add_file and os.path.isfile(add_file):
+        with open(add_file) as f:
+            settings["cmd_add_file"] = json.load(f)
+    content = {"inputs": inputs, "config": settings, "versions": get_versions()}
+    if upstream is not None:
+        content["upstream"] = upstream
+    content = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def is_up_to_date(success_file, fingerprint):
+    """Check whether successful task has the same fingerprint.
+
+    Empty success markers written before fingerprints were introduced
+    are stale.
+    """
+    if not os.path.isfile(success_file):
+        return False
+    with open(success_file) as f:
+        recorded = f.read().strip()
+    return recorded == fingerprint
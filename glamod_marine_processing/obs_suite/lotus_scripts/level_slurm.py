@@ -6,101 +6,80 @@ Created on Wed Jul 22 09:09:41 2020
 
 from __future__ import annotations
 
-import glob
 import logging
+import math
 import os
-import re
 import subprocess
 import sys
-from copy import deepcopy
 
-from glamod_marine_processing.obs_suite.lotus_scripts import slurm_preferences
-from glamod_marine_processing.utilities import load_json, mkdir, read_txt, save_json
+from glamod_marine_processing.history import fit_task_model, get_task_limits
+from glamod_marine_processing.obs_suite.lotus_scripts import (
+    slurm_preferences,
+    task_executor,
+)
+from glamod_marine_processing.obs_suite.lotus_scripts._utilities import (
+    check_file_exist,
+    estimate_task,
+    get_fingerprint,
+    get_input_size,
+    get_job_memory,
+    get_job_time,
+    get_pattern,
+    get_task_command,
+    get_task_workers,
+    get_tasks_per_node,
+    is_up_to_date,
+    launch_process,
+    pack_tasks,
+    scan_source,
+    select_source,
+    source_dataset,
+)
+from glamod_marine_processing.obs_suite.lotus_scripts.task_recorder import (
+    get_history_file,
+)
+from glamod_marine_processing.utilities import (
+    load_json,
+    mkdir,
+    read_txt,
+    save_json,
+    save_task_table,
+)
 
 
 # %%------------------------------------------------------------------------------
-def check_file_exist(files):
-    """Check whether file exists."""
-    files = [files] if not isinstance(files, list) else files
-    for filei in files:
-        if not os.path.isfile(filei):
-            logging.error(f"File {filei} does not exist. Exiting")
-            sys.exit(1)
-
-
-def check_dir_exit(dirs):
-    """Check whether directory exists."""
-    dirs = [dirs] if not isinstance(dirs, list) else dirs
-    for diri in dirs:
-        if not os.path.isdir(diri):
-            logging.error(f"Directory {diri} does not exist. Exiting")
-            sys.exit(1)
-
-
-def launch_process(process):
-    """Launch process."""
-    proc = subprocess.Popen(
-        [process], shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+def launch_executor(executor_file, tasks, nohup_prefix):
+    """Run tasks in local process pool, detached from terminal with nohup."""
+    save_json(
+        {
+            "n_jobs": int(script_config["n_max_jobs"]),
+            "retries": int(script_config.get("task_retries") or 0),
+            "backoff": script_config.get("task_backoff") or 30,
+            "tasks": tasks,
+        },
+        executor_file,
     )
-    jid_by, err = proc.communicate()
-    if len(err) > 0:
-        logging.error("Error launching process. Exiting")
-        logging.info(f"Error is: {err}")
-        sys.exit(1)
-    jid = jid_by.decode("UTF-8").rstrip()
-
-    return jid.split(" ")[-1]
-
-
-def source_dataset(level, release):
-    """Get source dataset."""
-    if level == "level1a":
-        return "datasets"
-    return release
-
-
-def get_yyyymm(filename):
-    """Extract date from filename."""
-    DATE_REGEX = r"([1-2]{1}[0-9]{3}\-(0[1-9]{1}|1[0-2]{1}))"
-    yyyy_mm = re.search(DATE_REGEX, os.path.basename(filename))
-    if not (yyyy_mm):
-        logging.warning(f"Could not extract date from filename {filename}")
-        return (None, None)
-    return yyyy_mm.group().split("-")
-
-
-def is_in_range(yyyy, mm, year_init, year_end):
-    """Check whether date is in time period range."""
-    add = False
-    if not all((yyyy, mm)):
-        add = True
-    elif int(yyyy) >= year_init and int(yyyy) <= year_end:
-        add = True
-    elif (int(yyyy) == year_init - 1 and int(mm) == 12) or (
-        int(yyyy) == year_end + 1 and int(mm) == 1
+    if script_config["nohup"] is not True:
+        task_executor.run_tasks(
+            tasks,
+            n_jobs=int(script_config["n_max_jobs"]),
+            retries=int(script_config.get("task_retries") or 0),
+            backoff=script_config.get("task_backoff") or 30,
+        )
+        return
+    cmd = ["python", os.path.join(lotus_dir, "task_executor.py"), executor_file]
+    with (
+        open(f"{nohup_prefix}.out", "w") as out,
+        open(f"{nohup_prefix}.err", "w") as err,
     ):
-        add = True
-    return add
-
-
-def get_pattern(yyyy, mm, sid_dck):
-    """Get SIDDCK_YEAR-MONTH pattern."""
-    date = []
-    if yyyy is not None:
-        date += [yyyy]
-    if mm is not None:
-        date += [mm]
-    date = "-".join(date)
-    if len(date) > 0:
-        date = f"_{date}"
-    return f"{sid_dck}{date}"
-
-
-def get_year(periods, sid_dck, yr_str):
-    """Get period year."""
-    if sid_dck in periods.keys():
-        return periods[sid_dck].get(yr_str)
-    return periods.get(yr_str)
+        proc = subprocess.Popen(
+            ["nohup"] + cmd,
+            stdout=out,
+            stderr=err,
+            preexec_fn=os.setpgrp,
+        )
+    with open(f"{nohup_prefix}.pid", "w") as pidf:
+        pidf.write(str(proc.pid))
 
 
 # %%------------------------------------------------------------------------------
@@ -151,6 +130,9 @@ if not isinstance(source_pattern, list):
 PYSCRIPT = f"{level}.py"
 MACHINE = script_config["scripts"]["machine"].lower()
 overwrite = script_config["overwrite"]
+worker_pool = script_config.get("worker_pool") is True
+limit_memory = script_config.get("limit_memory") is True
+pack = script_config.get("pack_tasks") is True
 
 # Get lotus paths
 lotus_dir = script_config["paths"]["lotus_scripts_directory"]
@@ -163,6 +145,7 @@ level_dir = os.path.join(data_dir, release_dest, dataset_dest, level_dest)
 release_source = source_dataset(level, release_source)
 level_source_dir = os.path.join(data_dir, release_source, dataset_source, level_source)
 log_dir = os.path.join(level_dir, "log")
+history_file = get_history_file(level_dir)
 script_config["paths"]["destination_directory"] = level_dir
 script_config["paths"]["source_directory"] = level_source_dir
 
@@ -192,19 +175,31 @@ if os.path.isfile(add_file):
 
 # Build jobs ------------------------------------------------------------------
 py_path = os.path.join(scripts_dir, PYSCRIPT)
-pycommand = f"python {py_path}"
+pycommand = f"python {os.path.join(lotus_dir, 'task_recorder.py')} {py_path}"
+task_runner = os.path.join(lotus_dir, "task_runner.py")
+task_model = script_config.get("task_model")
+if pack is True and not task_model:
+    task_model = fit_task_model(
+        history_file, level, margin=slurm_preferences.history_margin
+    )
+    if task_model:
+        logging.info(f"Task model fitted to task history: {task_model}")
 
-# Set default job params
-mem = script_config["job_memo_mb"]
-t_hh = script_config["job_time_hr"]
-t_mm = script_config["job_time_min"]
-t = ":".join([t_hh, t_mm, "00"])
+source_table = scan_source(level_source_dir, process_list, source_pattern)
+n_source_files = len(source_table)
+source_table = select_source(
+    source_table, release_periods, one_task=level in slurm_preferences.one_task
+)
+logging.info(f"{len(source_table)} tasks selected from {n_source_files} source files.")
+source_tables = dict(list(source_table.groupby("sid_dck")))
+task_keys = ["pattern", "sid_dck", "yyyy", "mm", "filename"]
 
 logging.info("SUBMITTING ARRAYS...")
 if script_config["parallel_jobs"] is True:
     taskfarm_files = os.path.join(log_dir, "taskfarm.tasks")
     with open(taskfarm_files, "w") as f:
         pass
+    executor_files_tasks = []
 
 for sid_dck in process_list:
 
@@ -222,139 +217,199 @@ for sid_dck in process_list:
         mode = "w"
 
     # check is separate configuration for this source / deck
-    config = deepcopy(script_config)
-    config_sid_dck = config.get(sid_dck)
-    if config_sid_dck is not None:
-        for k, v in config_sid_dck.items():
-            config[k] = v
-
-    year_init = int(get_year(release_periods, sid_dck, "year_init"))
-    year_end = int(get_year(release_periods, sid_dck, "year_end"))
-    source_files = []
-    for pattern in source_pattern:
-        sfiles = glob.glob(os.path.join(level_source_dir, sid_dck, pattern))
-        if len(sfiles) == 0:
-            continue
-        if level in slurm_preferences.one_task:
-            source_files = [sfiles[0]]
-            break
-        source_files.extend(sfiles)
+    config_sid_dck = script_config.get(sid_dck)
 
+    source_files = source_tables.get(sid_dck, source_table.iloc[:0])
     array_size = len(source_files)
     if array_size == 0:
         logging.info("No tasks to be calculated")
         continue
 
-    if level in slurm_preferences.TaskPNi.keys():
-        TaskPNi = slurm_preferences.TaskPNi[level]
-    else:
-        memi = script_config.get(sid_dck, {}).get("job_memo_mb")
-        memi = mem if not memi else memi
-        TaskPNi = min(int(190000.0 / float(memi)), 40)
+    memi = get_job_memory(script_config, sid_dck)
+    ti = get_job_time(script_config, sid_dck, level)
+    limits = None
+    if config_sid_dck is None:
+        limits = get_task_limits(
+            history_file, level, sid_dck, margin=slurm_preferences.history_margin
+        )
+    if limits is not None:
+        memi = max(math.ceil(limits[0]), slurm_preferences.history_min_memory_mb)
+        if level not in slurm_preferences.ti.keys():
+            ti = task_executor.format_seconds(
+                max(math.ceil(limits[1]), slurm_preferences.history_min_time_min) * 60
+            )
+        logging.info(f"{sid_dck}: {memi} MB and {ti} per task from task history.")
+    workers = get_task_workers(script_config, sid_dck, level)
+    TaskPNi = get_tasks_per_node(level, memi, workers)
 
     if level in slurm_preferences.nodesi.keys():
         nodesi = slurm_preferences.nodesi[level]
     else:
         nodesi = array_size // TaskPNi + (array_size % TaskPNi > 0)
 
-    if level in slurm_preferences.ti.keys():
-        ti = slurm_preferences.ti[level]
-    else:
-        t_hhi = script_config.get(sid_dck, {}).get("job_time_hr")
-        t_mmi = script_config.get(sid_dck, {}).get("job_time_min")
-        if t_hhi and t_mmi:
-            ti = ":".join([t_hhi, t_mmi, "00"])
-        else:
-            ti = t
-
+    n_workers = 1
+    n_pools = 1
+    if worker_pool is True:
+        if script_config["submit_jobs"] is True:
+            n_workers = TaskPNi
+            n_pools = nodesi
+        elif script_config["parallel_jobs"] is not True:
+            n_workers = int(script_config["n_max_jobs"])
+
+    memory_mb = int(memi) if limit_memory is True else None
+    pool_tasks = []
+    executor_tasks = []
+    packed_tasks = []
+    table_tasks = []
+    table_file = f"{file_}.input.jsonl"
     with open(taskfarm_file, mode) as fh:
-        for source_file in source_files:
-            yyyy, mm = get_yyyymm(source_file)
-            add = is_in_range(yyyy, mm, year_init, year_end)
-
-            if add is False:
-                logging.warning(f"{yyyy} out of range: {year_init} to {year_end}.")
-                continue
-
+        for yyyy, mm, source_file in source_files[
+            ["yyyy", "mm", "filename"]
+        ].itertuples(index=False):
             pattern = get_pattern(yyyy, mm, sid_dck)
 
-            config_file_ = os.path.join(sid_dck_log_dir, f"{pattern}.input")
             success_file_ = os.path.join(sid_dck_log_dir, f"{pattern}.success")
             failed_file_ = os.path.join(sid_dck_log_dir, f"{pattern}.failure")
+            fingerprint_file_ = os.path.join(sid_dck_log_dir, f"{pattern}.fingerprint")
 
-            if overwrite is not True and os.path.isfile(success_file_):
+            """Update configuration script."""
+            task = dict(zip(task_keys, [pattern, sid_dck, yyyy, mm, source_file]))
+            fingerprint = get_fingerprint({**script_config, **task})
+
+            if overwrite is not True and is_up_to_date(success_file_, fingerprint):
                 logging.info(
                     f"Task {pattern} was already successful. Skip calculating again."
                 )
                 continue
 
-            """Update configuration script."""
-            script_config.update({"sid_dck": sid_dck})
-            script_config.update({"yyyy": yyyy})
-            script_config.update({"mm": mm})
-            script_config.update({"filename": source_file})
-
             if os.path.isfile(failed_file_):
                 logging.info(f"Task {pattern} failed. Try calculating again.")
                 os.remove(failed_file_)
 
             if os.path.isfile(success_file_):
-                logging.info(
-                    f"Task {pattern} was already successful. However, calculate task again since option 'overwrite' was chosen."
-                )
+                if overwrite is True:
+                    logging.info(
+                        f"Task {pattern} was already successful. However, calculate task again since option 'overwrite' was chosen."
+                    )
+                else:
+                    logging.info(
+                        f"Task {pattern} was already successful. However, calculate task again since its inputs, configuration or versions changed."
+                    )
                 os.remove(success_file_)
 
-            fh.writelines(
-                "{0} {1}/{2}.input > {1}/{2}.out 2> {1}/{2}.out; if [ $? -eq 0 ]; "
-                "then touch {1}/{2}.success; else touch {1}/{2}.failure; fi  \n".format(
-                    pycommand, log_diri, pattern
+            with open(fingerprint_file_, "w") as f:
+                f.write(fingerprint)
+            table_tasks.append(task)
+
+            if worker_pool is True:
+                pool_tasks.append(
+                    {
+                        "script": py_path,
+                        "args": [table_file, pattern],
+                        "log_dir": log_diri,
+                        "pattern": pattern,
+                    }
                 )
-            )
-            save_json(script_config, config_file_)
+            else:
+                line = get_task_command(pycommand, log_diri, pattern, table_file)
+                fh.writelines(f"{line}  \n")
+                executor_tasks.append(
+                    {
+                        "command": line,
+                        "timeout": task_executor.get_seconds(ti),
+                        "memory_mb": memory_mb,
+                    }
+                )
+                if pack is True:
+                    memory_est, time_est = estimate_task(
+                        level,
+                        get_input_size(source_file),
+                        task_model,
+                    )
+                    packed_tasks.append(
+                        {
+                            "command": line,
+                            "memory_mb": memory_est,
+                            "time_min": time_est,
+                            "workers": workers,
+                        }
+                    )
+
+        table_config = {k: v for k, v in script_config.items() if k not in task_keys}
+        save_task_table(table_config, table_tasks, table_file)
+
+        if len(pool_tasks) > 0:
+            # One pool per node, each runs in rounds of n_workers tasks
+            chunk_size = -(-len(pool_tasks) // min(n_pools, len(pool_tasks)))
+            pool_chunks = [
+                pool_tasks[i : i + chunk_size]
+                for i in range(0, len(pool_tasks), chunk_size)
+            ]
+            for i, pool_chunk in enumerate(pool_chunks):
+                pool_file = f"{file_}_{i:03d}.pool"
+                save_json(
+                    {
+                        "n_workers": n_workers,
+                        "max_tasks": script_config.get("max_tasks"),
+                        "tasks": pool_chunk,
+                    },
+                    pool_file,
+                )
+                line = f"python {task_runner} {pool_file} > {pool_file}.out 2>&1"
+                fh.writelines(f"{line}\n")
+                executor_tasks.append(
+                    {"command": line, "timeout": None, "memory_mb": memory_mb}
+                )
+            nodesi = len(pool_chunks)
+            TaskPNi = 1
+            n_rounds = -(-chunk_size // n_workers)
+            ti = task_executor.format_seconds(task_executor.get_seconds(ti) * n_rounds)
 
     logging.info(f"{sid_dck}: launching array")
     logging.info(f"Script {taskfarm_file} was created.")
     if script_config["submit_jobs"] is True:
-        job_file = f"{file_}.slurm"
         header = read_txt(
             os.path.join(lotus_dir, "header", f"slurm_header_{MACHINE}.txt")
         )
-        with open(job_file, "w") as fh:
-            for line in header:
-                line = eval(line)  # noqa: S307
-                line = f"{line}\n"
-                fh.writelines(line)
-        process = f"jid=$(sbatch {job_file} | cut -f 4 -d' ') && echo $jid"
-        logging.info(f"process launching: {process}")
-        jid = launch_process(process)
+        jobs = [(file_, taskfarm_file, TaskPNi, nodesi, ti)]
+        if len(packed_tasks) > 0:
+            bins = pack_tasks(packed_tasks)
+            logging.info(f"{len(packed_tasks)} tasks packed into {len(bins)} nodes.")
+            jobs = []
+            for i, bin_ in enumerate(bins):
+                file_i = f"{file_}_{i:03d}"
+                with open(f"{file_i}.tasks", "w") as fh:
+                    for task in bin_["tasks"]:
+                        fh.writelines(f"{task['command']}  \n")
+                ti_ = task_executor.format_seconds(math.ceil(bin_["time_min"]) * 60)
+                logging.info(
+                    f"Node {i}: {len(bin_['tasks'])} tasks, "
+                    f"{int(bin_['memory_mb'])} MB, {ti_}"
+                )
+                jobs.append((file_i, f"{file_i}.tasks", len(bin_["tasks"]), 1, ti_))
+        for file_i, taskfarm_file, TaskPNi, nodesi, ti in jobs:
+            job_file = f"{file_i}.slurm"
+            with open(job_file, "w") as fh:
+                for line in header:
+                    line = eval(line)  # noqa: S307
+                    line = f"{line}\n"
+                    fh.writelines(line)
+            process = f"jid=$(sbatch {job_file} | cut -f 4 -d' ') && echo $jid"
+            logging.info(f"process launching: {process}")
+            jid = launch_process(process)
         continue
 
+    if script_config["parallel_jobs"] is True:
+        executor_files_tasks.extend(executor_tasks)
+
     subprocess.call(["/bin/chmod", "u+x", taskfarm_file], shell=False)
     if script_config["parallel_tasks"] is True:
         logging.info("Run tasks per job interactively in parallel.")
-        cmd = [
-            "/bin/parallel",
-            "--jobs",
-            script_config["n_max_jobs"],
-            "::::",
-            taskfarm_file,
-        ]
-        if script_config["nohup"] is True:
-            nohup_out = os.path.join(sid_dck_log_dir, f"nohup_{pattern}.out")
-            nohup_err = os.path.join(sid_dck_log_dir, f"nohup_{pattern}.err")
-            nohup_pid = os.path.join(sid_dck_log_dir, f"nohup_{pattern}.pid")
-            cdm = ["nohup"] + cmd
-            with open(nohup_out, "w") as out, open(nohup_err, "w") as err:
-                proc = subprocess.Popen(
-                    cmd,
-                    stdout=out,
-                    stderr=err,
-                    preexec_fn=os.setpgrp,
-                )
-
-            with open(nohup_pid, "w") as pidf:
-                pidf.write(str(proc.pid))
-
+        launch_executor(
+            f"{file_}.executor",
+            executor_tasks,
+            os.path.join(sid_dck_log_dir, f"nohup_{sid_dck}"),
+        )
         continue
 
     if script_config["run_jobs"] is True:
@@ -365,24 +420,8 @@ for sid_dck in process_list:
 if script_config["parallel_jobs"] is True:
     subprocess.call(["/bin/chmod", "u+x", taskfarm_files], shell=False)
     logging.info("Run jobs interactively in parallel.")
-    cmd = [
-        "/bin/parallel",
-        "--jobs",
-        script_config["n_max_jobs"],
-        "::::",
-        taskfarm_files,
-    ]
-    if script_config["nohup"] is True:
-        nohup_out = os.path.join(sid_dck_log_dir, f"nohup_{pattern}.out")
-        nohup_err = os.path.join(sid_dck_log_dir, f"nohup_{pattern}.err")
-        nohup_pid = os.path.join(sid_dck_log_dir, f"nohup_{pattern}.pid")
-        cdm = ["nohup"] + cmd
-        with open(nohup_out, "w") as out, open(nohup_err, "w") as err:
-            proc = subprocess.Popen(
-                cmd,
-                stdout=out,
-                stderr=err,
-                preexec_fn=os.setpgrp,
-            )
-        with open(nohup_pid, "w") as pidf:
-            pidf.write(str(proc.pid))
+    launch_executor(
+        os.path.join(log_dir, "taskfarm.executor"),
+        executor_files_tasks,
+        os.path.join(log_dir, "nohup_taskfarm"),
+    )
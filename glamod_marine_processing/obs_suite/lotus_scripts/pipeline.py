@@ -0,0 +1,817 @@
+"""
+Run several levels of the observation suite as one pipeline.
+
+Each source-deck monthly task of each level is a node of a dependency
+graph. A node depends on
+
+- the node of the previous level of the same sid-dck and month,
+- level1c: all level1b nodes of the sid-dck, since level1b writes datetime
+  leaks to the files of other months,
+- level1e: the level1d nodes of the previous and next month of the sid-dck
+  and the level1d nodes of the buoy sid-dck (qc_settings: grouped_reports),
+- level2: all level1e nodes of the sid-dck (one task per sid-dck),
+- level3: the level2 node of the sid-dck.
+
+The node of the same sid-dck and month of the previous level must be
+successful, otherwise the node is skipped. All other dependencies only
+need to be finished. Interactively, nodes are run in a local process pool
+as soon as their dependencies are finished, later levels first. With
+submit_jobs, one SLURM job per level and sid-dck is submitted with
+dependencies on the jobs of its upstream nodes; each job runs its nodes
+with this script.
+
+With fuse_levels, the level1b, level1c and level1d nodes of a sid-dck
+month run as one task in one process (task_runner.py) and pass their CDM
+tables in memory; level1b and level1c tables are only written with
+write_intermediate. Datetime leaks of level1b are written as usual and
+read by the fused level1c of their month, so level1c does not wait for
+all level1b nodes of the sid-dck. Fused tasks of every other month run
+first, and fused tasks whose datetime leaks changed while the pipeline ran
+are rerun once at its end. A fused task is rerun as a whole if any of its
+levels is not up to date.
+
+Inargs:
+-------
+pipeline_file: JSON file with key levels: list of level configuration files,
+    optional keys fuse_levels and write_intermediate
+level: optional, run only nodes of this level (SLURM jobs)
+sid_dck: optional, run only nodes of this sid-dck (SLURM jobs)
+"""
+
+from __future__ import annotations
+
+import glob
+import heapq
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from copy import deepcopy
+
+from glamod_marine_processing.obs_suite.lotus_scripts import (
+    slurm_preferences,
+    task_executor,
+)
+from glamod_marine_processing.obs_suite.lotus_scripts._utilities import (
+    check_file_exist,
+    get_fingerprint,
+    get_job_memory,
+    get_job_time,
+    get_pattern,
+    get_task_command,
+    get_task_workers,
+    get_tasks_per_node,
+    get_yyyymm,
+    is_up_to_date,
+    launch_process,
+    scan_source,
+    select_source,
+    shift_month,
+    source_dataset,
+)
+from glamod_marine_processing.utilities import load_json, mkdir, read_txt, save_json
+
+finished = ["success", "failure", "skipped"]
+
+
+def load_level(config_file):
+    """Load level configuration and build level paths."""
+    check_file_exist([config_file])
+    config = load_json(config_file)
+    level = config["level"]
+    config_files_path = config["paths"]["config_files_path"]
+    data_dir = config["paths"]["data_directory"]
+
+    level_source = config["level_source"] or slurm_preferences.level_source[level]
+    level_dir = os.path.join(
+        data_dir,
+        config["release_destination"],
+        config["dataset_destination"],
+        config["level_destination"],
+    )
+    source_dir = os.path.join(
+        data_dir,
+        source_dataset(level, config["release_source"]),
+        config["dataset_source"],
+        level_source,
+    )
+    config["paths"]["destination_directory"] = level_dir
+    config["paths"]["source_directory"] = source_dir
+
+    source_pattern = config.get("source_pattern")
+    if not source_pattern:
+        source_pattern = slurm_preferences.source_pattern[level]
+    if isinstance(source_pattern, dict):
+        source_pattern = source_pattern[config["abbreviations"]["dataset"]]
+    if not isinstance(source_pattern, list):
+        source_pattern = [source_pattern]
+
+    if config["process_list"]:
+        process_list = config["process_list"]
+    else:
+        process_list_file = os.path.join(config_files_path, config["process_list_file"])
+        check_file_exist([process_list_file])
+        process_list = read_txt(process_list_file)
+
+    periods_file = os.path.join(config_files_path, config["release_periods_file"])
+    check_file_exist([periods_file])
+    periods = load_json(periods_file)
+    if config["year_init"]:
+        periods["year_init"] = config["year_init"]
+    if config["year_end"]:
+        periods["year_end"] = config["year_end"]
+
+    add_file = os.path.join(config_files_path, f"{level}_cmd_add.json")
+    if os.path.isfile(add_file):
+        config["cmd_add_file"] = add_file
+
+    py_path = os.path.join(config["paths"]["scripts_directory"], f"{level}.py")
+    recorder = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "task_recorder.py"
+    )
+    return {
+        "level": level,
+        "config": config,
+        "level_dir": level_dir,
+        "source_dir": source_dir,
+        "log_dir": os.path.join(level_dir, "log"),
+        "source_pattern": source_pattern,
+        "process_list": process_list,
+        "periods": periods,
+        "py_path": py_path,
+        "pycommand": f"python {recorder} {py_path}",
+    }
+
+
+def get_fused_levels(levels, fuse_levels=False):
+    """Get levels of the pipeline that run fused in one process per month."""
+    if fuse_levels is not True:
+        return []
+    fused = [
+        level for level in levels.keys() if level in slurm_preferences.fused_levels
+    ]
+    if len(fused) < 2:
+        logging.warning(
+            f"Option fuse_levels needs at least two of {slurm_preferences.fused_levels}."
+        )
+        return []
+    return fused
+
+
+def get_source_files(setup, sid_dck, scans=None):
+    """Get source files of sid-dck within the release period.
+
+    scans caches the scanned source directories of sid-dcks, so that a
+    directory is listed once while the graph is built.
+    """
+    if scans is None:
+        scans = {}
+    key = (setup["source_dir"], sid_dck, tuple(setup["source_pattern"]))
+    if key not in scans.keys():
+        scans[key] = scan_source(
+            setup["source_dir"], [sid_dck], setup["source_pattern"]
+        )
+    return select_source(scans[key], setup["periods"])["filename"].tolist()
+
+
+def get_months(setup, sid_dck, scans=None):
+    """Get months of sid-dck from source files of first level."""
+    months = []
+    for source_file in get_source_files(setup, sid_dck, scans):
+        yyyy, mm = get_yyyymm(source_file)
+        if yyyy is None or (yyyy, mm) in months:
+            continue
+        months.append((yyyy, mm))
+    return sorted(months)
+
+
+def get_buoy_dck(levels):
+    """Get buoy sid-dck of level1e if it is processed within the pipeline."""
+    if "level1e" not in levels.keys() or "level1d" not in levels.keys():
+        return
+    config = levels["level1e"]["config"]
+    if config.get("no_qc_suite") is True:
+        return
+    qc_dict = (config.get("qc_settings") or {}).get("grouped_reports") or {}
+    buoy_dataset = qc_dict.get("buoy_dataset")
+    buoy_dck = qc_dict.get("buoy_dck")
+    if buoy_dataset is None or buoy_dck is None:
+        return
+    if buoy_dataset != config["dataset_source"]:
+        logging.info(
+            f"Buoy data {buoy_dataset}/{buoy_dck} are not part of the pipeline "
+            "and assumed to be available."
+        )
+        return
+    if buoy_dck not in levels["level1d"]["process_list"]:
+        logging.info(f"Buoy sid-dck {buoy_dck} is not part of the pipeline.")
+        return
+    return buoy_dck
+
+
+def get_marker(setup, node, marker):
+    """Get marker file of node."""
+    log_diri = os.path.join(setup["log_dir"], node["sid_dck"])
+    if node["yyyy"] is None and node["mm"] is None:
+        files = glob.glob(os.path.join(log_diri, f"{node['sid_dck']}*.{marker}"))
+        return files[0] if len(files) > 0 else None
+    pattern = get_pattern(node["yyyy"], node["mm"], node["sid_dck"])
+    return os.path.join(log_diri, f"{pattern}.{marker}")
+
+
+def add_node(
+    nodes, level, sid_dck, yyyy, mm, inputs=None, context=None, fused_input=None
+):
+    """Add node to dependency graph.
+
+    fused_input is the node of the previous level that passes its tables in
+    memory within one fused task.
+    """
+    inputs = inputs or []
+    context = context or []
+    key = (level, sid_dck, yyyy, mm)
+    nodes[key] = {
+        "level": level,
+        "sid_dck": sid_dck,
+        "yyyy": yyyy,
+        "mm": mm,
+        "inputs": [k for k in inputs if k in nodes.keys()],
+        "context": [k for k in context if k in nodes.keys() and k not in inputs],
+        "fused_input": fused_input if fused_input in nodes.keys() else None,
+        "status": None,
+    }
+    return key
+
+
+def get_head(nodes, key):
+    """Get first node of the fused task of a node."""
+    while nodes[key]["fused_input"] is not None:
+        key = nodes[key]["fused_input"]
+    return key
+
+
+def get_groups(nodes):
+    """Get nodes of fused tasks by their first node, in level order."""
+    groups = {}
+    for key, node in nodes.items():
+        if node["fused_input"] is not None:
+            head = get_head(nodes, key)
+            groups.setdefault(head, [head]).append(key)
+    return groups
+
+
+def get_node_fingerprint(levels, nodes, key, scans=None):
+    """Get fingerprint of node, chained to its fused input node."""
+    node = nodes[key]
+    setup = levels[node["level"]]
+    config = get_task_config(setup, node, scans)
+    if config is None:
+        return
+    upstream = None
+    if node["fused_input"] is not None:
+        upstream = get_node_fingerprint(levels, nodes, node["fused_input"], scans)
+    return get_fingerprint(config, upstream=upstream)
+
+
+def is_node_up_to_date(levels, nodes, key, scans=None):
+    """Check whether node is successful with successful dependencies and fingerprint."""
+    node = nodes[key]
+    setup = levels[node["level"]]
+    if setup["config"]["overwrite"] is True:
+        return False
+    success_file = get_marker(setup, node, "success")
+    if success_file is None or not os.path.isfile(success_file):
+        return False
+    deps = node["inputs"] + node["context"]
+    if any(nodes[dep]["status"] != "success" for dep in deps):
+        return False
+    fingerprint = get_node_fingerprint(levels, nodes, key, scans)
+    if fingerprint is None:
+        return False
+    return is_up_to_date(success_file, fingerprint)
+
+
+def set_up_to_date(levels, nodes, scans=None):
+    """Set status of up-to-date nodes to success.
+
+    A fused task is only up to date as a whole.
+    """
+    last_members = {members[-1]: members for members in get_groups(nodes).values()}
+    for key, node in nodes.items():
+        if is_node_up_to_date(levels, nodes, key, scans):
+            node["status"] = "success"
+        members = last_members.get(key, [])
+        if any(nodes[member]["status"] != "success" for member in members):
+            for member in members:
+                nodes[member]["status"] = None
+
+
+def add_sid_dck_nodes(nodes, order, fused, sid_dck, months, buoy_dck=None):
+    """Add nodes of all levels and months of sid-dck to dependency graph."""
+    prev = None
+    for level in order:
+        if level in slurm_preferences.one_task:
+            context = [(prev, sid_dck, yyyy, mm) for yyyy, mm in months]
+            add_node(nodes, level, sid_dck, None, None, context=context)
+            prev = level
+            continue
+        for yyyy, mm in months:
+            inputs = []
+            context = []
+            fused_input = None
+            if prev in slurm_preferences.one_task:
+                inputs = [(prev, sid_dck, None, None)]
+            elif prev is not None:
+                inputs = [(prev, sid_dck, yyyy, mm)]
+            if prev in fused and level in fused:
+                fused_input = (prev, sid_dck, yyyy, mm)
+            elif level == "level1c" and prev == "level1b":
+                context = [(prev, sid_dck, y, m) for y, m in months]
+            if level == "level1e" and prev == "level1d":
+                shifted = [shift_month(yyyy, mm, s) for s in [-1, 0, 1]]
+                context = [(prev, sid_dck, y, m) for y, m in shifted]
+                if buoy_dck is not None:
+                    context += [(prev, buoy_dck, y, m) for y, m in shifted]
+            add_node(nodes, level, sid_dck, yyyy, mm, inputs, context, fused_input)
+        prev = level
+
+
+def build_graph(levels, fused=None, sid_dck=None):
+    """Build dependency graph of all levels, sid-dcks and months.
+
+    Consecutive levels in fused run as one task per sid-dck and month.
+    With sid_dck, only the nodes of this sid-dck and of the buoy sid-dck
+    it depends on are built.
+    """
+    fused = fused or []
+    order = list(levels.keys())
+    first = levels[order[0]]
+    buoy_dck = get_buoy_dck(levels)
+    process_list = first["process_list"]
+    if sid_dck is not None:
+        process_list = [s for s in process_list if s in [sid_dck, buoy_dck]]
+    if buoy_dck in process_list:
+        process_list = [buoy_dck] + [s for s in process_list if s != buoy_dck]
+
+    nodes = {}
+    scans = {}
+    for sid_dck_i in process_list:
+        months = get_months(first, sid_dck_i, scans)
+        if len(months) == 0 and first["level"] not in slurm_preferences.one_task:
+            logging.info(f"{sid_dck_i}: No tasks to be calculated")
+            continue
+        add_sid_dck_nodes(nodes, order, fused, sid_dck_i, months, buoy_dck)
+
+    set_up_to_date(levels, nodes, scans)
+    return nodes
+
+
+def get_task_config(setup, node, scans=None):
+    """Get task configuration of node, None without source file.
+
+    The source file of a node fused to its input node is the header table
+    its input node keeps in memory, as pattern of any table format.
+    """
+    sid_dck = node["sid_dck"]
+    if node.get("fused_input") is not None:
+        config = deepcopy(setup["config"])
+        release_tag = config["abbreviations_source"]["release_tag"]
+        source_file = os.path.join(
+            setup["source_dir"],
+            sid_dck,
+            f"header-{node['yyyy']}-{node['mm']}-{release_tag}.*",
+        )
+        config.update({"sid_dck": sid_dck, "yyyy": node["yyyy"], "mm": node["mm"]})
+        config.update({"filename": source_file})
+        return config
+
+    source_files = get_source_files(setup, sid_dck, scans)
+    if node["yyyy"] is not None or node["mm"] is not None:
+        source_files = [
+            f for f in source_files if get_yyyymm(f) == [node["yyyy"], node["mm"]]
+        ]
+    if len(source_files) == 0:
+        return
+
+    source_file = source_files[0]
+    yyyy, mm = get_yyyymm(source_file)
+    config = deepcopy(setup["config"])
+    config.update({"sid_dck": sid_dck, "yyyy": yyyy, "mm": mm})
+    config.update({"filename": source_file})
+    return config
+
+
+def write_task_files(setup, config, fingerprint):
+    """Remove markers, write task configuration and fingerprint of task.
+
+    Returns log directory and pattern of task.
+    """
+    sid_dck = config["sid_dck"]
+    pattern = get_pattern(config["yyyy"], config["mm"], sid_dck)
+    log_diri = os.path.join(setup["log_dir"], sid_dck)
+    mkdir(log_diri)
+    for marker in ["success", "failure"]:
+        marker_file = os.path.join(log_diri, f"{pattern}.{marker}")
+        if os.path.isfile(marker_file):
+            os.remove(marker_file)
+
+    save_json(config, os.path.join(log_diri, f"{pattern}.input"))
+    with open(os.path.join(log_diri, f"{pattern}.fingerprint"), "w") as f:
+        f.write(fingerprint)
+    return log_diri, pattern
+
+
+def prepare_task(setup, node, limit_memory=False):
+    """Write task configuration of node and return executor task."""
+    level = setup["level"]
+    sid_dck = node["sid_dck"]
+    config = get_task_config(setup, node)
+    if config is None:
+        logging.info(f"{level} {sid_dck}: No source file found. Skip task.")
+        return
+
+    fingerprint = get_fingerprint(config)
+    log_diri, pattern = write_task_files(setup, config, fingerprint)
+    memi = get_job_memory(config, sid_dck)
+    return {
+        "command": get_task_command(setup["pycommand"], log_diri, pattern),
+        "timeout": task_executor.get_seconds(get_job_time(config, sid_dck, level)),
+        "memory_mb": int(memi) if limit_memory is True else None,
+    }
+
+
+def prepare_group(levels, nodes, members, limit_memory=False, write_intermediate=False):
+    """Write task configurations of fused nodes and return executor task."""
+    head = nodes[members[0]]
+    scans = {}
+    if get_task_config(levels[head["level"]], head, scans) is None:
+        logging.info(
+            f"{head['level']} {head['sid_dck']}: No source file found. Skip task."
+        )
+        return
+
+    tasks = []
+    timeout = 0
+    memory_mb = 0
+    for key in members:
+        node = nodes[key]
+        setup = levels[node["level"]]
+        config = get_task_config(setup, node, scans)
+        fingerprint = get_node_fingerprint(levels, nodes, key, scans)
+        log_diri, pattern = write_task_files(setup, config, fingerprint)
+        tasks.append(
+            {
+                "script": setup["py_path"],
+                "args": [os.path.join(log_diri, f"{pattern}.input")],
+                "log_dir": log_diri,
+                "pattern": pattern,
+            }
+        )
+        timeout += task_executor.get_seconds(
+            get_job_time(config, node["sid_dck"], node["level"])
+        )
+        memory_mb = max(memory_mb, int(get_job_memory(config, node["sid_dck"])))
+
+    fused_file = os.path.join(tasks[0]["log_dir"], f"{tasks[0]['pattern']}.fused")
+    save_json(
+        {"fused": True, "write_intermediate": write_intermediate, "tasks": tasks},
+        fused_file,
+    )
+    task_runner = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "task_runner.py"
+    )
+    return {
+        "command": f"python {task_runner} {fused_file} > {fused_file}.out 2>&1",
+        "timeout": timeout,
+        "memory_mb": memory_mb if limit_memory is True else None,
+    }
+
+
+def get_group_status(levels, nodes, members):
+    """Get status of fused nodes from their markers."""
+    status = {}
+    for i, key in enumerate(members):
+        status[key] = "failure" if i == 0 else "skipped"
+        for marker in ["success", "failure"]:
+            marker_file = get_marker(levels[key[0]], nodes[key], marker)
+            if marker_file is not None and os.path.isfile(marker_file):
+                status[key] = marker
+                break
+    return status
+
+
+def log_summary(nodes):
+    """Log number of nodes per level and status."""
+    summary = {}
+    for node in nodes.values():
+        counts = summary.setdefault(node["level"], {})
+        counts[node["status"]] = counts.get(node["status"], 0) + 1
+    for level, counts in summary.items():
+        logging.info(f"{level}: {counts}")
+
+
+class ReadyQueue:
+    """Queue of nodes whose dependencies are finished.
+
+    Later levels come first. Fused tasks of every other month come first,
+    so that the fused tasks of the months in between read the datetime
+    leaks of both neighbour months.
+    """
+
+    def __init__(self, nodes, order, groups):
+        self.nodes = nodes
+        self.order = order
+        self.groups = groups
+        self.dependents = {key: [] for key in nodes.keys()}
+        self.waiting = {}
+        self.ready = []
+        self.counts = {status: 0 for status in finished}
+        for key, node in nodes.items():
+            if node["status"] in finished:
+                continue
+            deps = [
+                dep
+                for dep in node["inputs"] + node["context"]
+                if nodes[dep]["status"] not in finished
+            ]
+            for dep in deps:
+                self.dependents[dep].append(key)
+            self.waiting[key] = len(deps)
+            if len(deps) == 0:
+                self.push(key)
+        self.total = len(self.waiting)
+
+    def __len__(self):
+        """Get number of ready nodes."""
+        return len(self.ready)
+
+    def priority(self, key):
+        """Get priority of node, lowest first."""
+        level, sid_dck, yyyy, mm = key
+        parity = 0
+        if key in self.groups.keys():
+            parity = 1 - (int(yyyy) * 12 + int(mm)) % 2
+        return (-self.order.index(level), sid_dck, parity, yyyy or "", mm or "")
+
+    def push(self, key):
+        """Add node to the ready nodes."""
+        heapq.heappush(self.ready, (self.priority(key), key))
+
+    def pop(self):
+        """Get ready node of highest priority."""
+        return heapq.heappop(self.ready)[1]
+
+    def finish(self, key, status):
+        """Set status of node and add its dependents that became ready."""
+        self.nodes[key]["status"] = status
+        self.counts[status] += 1
+        for dependent in self.dependents[key]:
+            self.waiting[dependent] -= 1
+            if self.waiting[dependent] == 0:
+                self.push(dependent)
+
+
+def get_node_task(levels, queue, key, limit_memory=False, write_intermediate=False):
+    """Get executor task of ready node, None if node is finished or skipped."""
+    nodes = queue.nodes
+    node = nodes[key]
+    if node["status"] in finished:
+        return
+    if any(nodes[dep]["status"] != "success" for dep in node["inputs"]):
+        queue.finish(key, "skipped")
+        return
+    if key in queue.groups.keys():
+        task = prepare_group(
+            levels,
+            nodes,
+            queue.groups[key],
+            limit_memory=limit_memory,
+            write_intermediate=write_intermediate,
+        )
+    else:
+        task = prepare_task(levels[key[0]], node, limit_memory=limit_memory)
+    if task is None:
+        queue.finish(key, "skipped")
+    return task
+
+
+def finish_node(levels, queue, key, future):
+    """Finish node of done future, fused nodes by their markers."""
+    try:
+        success = future.result()
+    except Exception:
+        logging.error("Error running task", exc_info=True)
+        success = False
+    if key in queue.groups.keys():
+        members = queue.groups[key]
+        status = get_group_status(levels, queue.nodes, members)
+        for member in members:
+            queue.finish(member, status[member])
+        return
+    queue.finish(key, "success" if success is True else "failure")
+
+
+def run_graph(
+    levels,
+    nodes,
+    n_jobs=1,
+    retries=0,
+    backoff=30,
+    limit_memory=False,
+    write_intermediate=False,
+):
+    """Run nodes in local process pool as soon as dependencies are finished.
+
+    Fused nodes run as one task when their first node is ready.
+    """
+    queue = ReadyQueue(nodes, list(levels.keys()), get_groups(nodes))
+    start = time.monotonic()
+
+    logging.info(f"Run {queue.total} tasks with {n_jobs} jobs in parallel.")
+    running = {}
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        while queue or running:
+            while queue and len(running) < n_jobs:
+                key = queue.pop()
+                task = get_node_task(
+                    levels,
+                    queue,
+                    key,
+                    limit_memory=limit_memory,
+                    write_intermediate=write_intermediate,
+                )
+                if task is None:
+                    continue
+                nodes[key]["status"] = "running"
+                future = executor.submit(task_executor.run_task, task, retries, backoff)
+                running[future] = key
+            if not running:
+                continue
+            done, _ = wait(
+                running,
+                timeout=task_executor.progress_interval,
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                finish_node(levels, queue, running.pop(future), future)
+            task_executor.log_progress(
+                sum(queue.counts.values()), queue.counts["failure"], queue.total, start
+            )
+    log_summary(nodes)
+    return queue.counts["failure"]
+
+
+def restrict_nodes(levels, nodes, level, sid_dck):
+    """Restrict nodes to level and sid-dck, read status of others from markers."""
+    restricted = {}
+    for key, node in nodes.items():
+        if get_head(nodes, key)[:2] == (level, sid_dck):
+            restricted[key] = node
+            continue
+        if node["status"] is None:
+            node["status"] = "skipped"
+            for marker in ["success", "failure"]:
+                marker_file = get_marker(levels[key[0]], node, marker)
+                if marker_file is not None and os.path.isfile(marker_file):
+                    node["status"] = marker
+                    break
+        restricted[key] = node
+    return restricted
+
+
+def write_job_file(job_file, header, **header_vars):
+    """Write SLURM job file, header lines are f-strings of header_vars."""
+    with open(job_file, "w") as fh:
+        for line in header:
+            line = eval(line, {}, header_vars)  # noqa: S307
+            fh.writelines(f"{line}\n")
+
+
+def submit_graph(levels, nodes, pipeline_file):
+    """Submit one SLURM job per level and sid-dck with job dependencies."""
+    script_config = levels[list(levels.keys())[0]]["config"]
+    lotus_dir = script_config["paths"]["lotus_scripts_directory"]
+    MACHINE = script_config["scripts"]["machine"].lower()
+    header = read_txt(os.path.join(lotus_dir, "header", f"slurm_header_{MACHINE}.txt"))
+
+    groups = {}
+    for key, node in nodes.items():
+        job = get_head(nodes, key)[:2]
+        group = groups.setdefault(job, {"nodes": [], "after": set()})
+        group["nodes"].append(node)
+        for dep in node["inputs"] + node["context"]:
+            dep_job = get_head(nodes, dep)[:2]
+            if dep_job != job:
+                group["after"].add(dep_job)
+
+    jids = {}
+    for (level, sid_dck), group in groups.items():
+        if all(node["status"] in finished for node in group["nodes"]):
+            continue
+        setup = levels[level]
+        log_diri = os.path.join(setup["log_dir"], sid_dck)
+        mkdir(log_diri)
+        file_ = os.path.join(log_diri, f"{sid_dck}.pipeline")
+        taskfarm_file = f"{file_}.tasks"
+        with open(taskfarm_file, "w") as fh:
+            fh.writelines(
+                f"python {os.path.abspath(__file__)} {pipeline_file} {level} {sid_dck} "
+                f"> {file_}.out 2>&1\n"
+            )
+
+        job_levels = {node["level"] for node in group["nodes"]}
+        memi = max(
+            get_job_memory(levels[level_i]["config"], sid_dck) for level_i in job_levels
+        )
+        workers = max(
+            get_task_workers(levels[level_i]["config"], sid_dck, level_i)
+            for level_i in job_levels
+        )
+        TaskPNi = get_tasks_per_node(level, memi, workers)
+        n_rounds = -(-len(group["nodes"]) // len(job_levels) // TaskPNi)
+        if len(job_levels) > 1:
+            # Fused tasks whose datetime leaks changed are rerun at the end
+            n_rounds *= 2
+        seconds = sum(
+            task_executor.get_seconds(
+                get_job_time(levels[level_i]["config"], sid_dck, level_i)
+            )
+            for level_i in job_levels
+        )
+        job_file = f"{file_}.slurm"
+        write_job_file(
+            job_file,
+            header,
+            sid_dck=sid_dck,
+            log_diri=log_diri,
+            ti=task_executor.format_seconds(seconds * n_rounds),
+            nodesi=1,
+            TaskPNi=TaskPNi,
+            taskfarm_file=taskfarm_file,
+        )
+
+        after = [jids[g] for g in group["after"] if g in jids.keys()]
+        dependency = ""
+        if len(after) > 0:
+            dependency = f"--dependency=afterany:{':'.join(after)} "
+        process = f"jid=$(sbatch {dependency}{job_file} | cut -f 4 -d' ') && echo $jid"
+        logging.info(f"process launching: {process}")
+        jids[(level, sid_dck)] = launch_process(process)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
+        level=logging.INFO,
+        datefmt="%Y%m%d %H:%M:%S",
+        filename=None,
+    )
+    pipeline_file = os.path.abspath(sys.argv[1])
+    pipeline_config = load_json(pipeline_file)
+    levels = {}
+    for config_file in pipeline_config["levels"]:
+        setup = load_level(config_file)
+        levels[setup["level"]] = setup
+    script_config = levels[list(levels.keys())[0]]["config"]
+    fused = get_fused_levels(levels, pipeline_config.get("fuse_levels"))
+    write_intermediate = pipeline_config.get("write_intermediate") is True
+    level, sid_dck = sys.argv[2:4] if len(sys.argv) > 3 else (None, None)
+    nodes = build_graph(levels, fused, sid_dck=sid_dck)
+
+    if sid_dck is not None:
+        nodes = restrict_nodes(levels, nodes, level, sid_dck)
+        memi = get_job_memory(levels[level]["config"], sid_dck)
+        workers = get_task_workers(levels[level]["config"], sid_dck, level)
+        n_jobs = get_tasks_per_node(level, memi, workers)
+    elif script_config["submit_jobs"] is True:
+        submit_graph(levels, nodes, pipeline_file)
+        sys.exit(0)
+    else:
+        n_jobs = int(script_config["n_max_jobs"])
+
+    kwargs = {
+        "n_jobs": n_jobs,
+        "retries": int(script_config.get("task_retries") or 0),
+        "backoff": script_config.get("task_backoff") or 30,
+        "limit_memory": script_config.get("limit_memory") is True,
+        "write_intermediate": write_intermediate,
+    }
+    failed = run_graph(levels, nodes, **kwargs)
+
+    if len(fused) > 0:
+        rebuilt = build_graph(levels, fused, sid_dck=sid_dck)
+        if sid_dck is not None:
+            rebuilt = restrict_nodes(levels, rebuilt, level, sid_dck)
+        stale = [
+            key
+            for key, node in nodes.items()
+            if node["status"] == "success" and rebuilt[key]["status"] != "success"
+        ]
+        if len(stale) > 0:
+            logging.info(f"Rerun {len(stale)} tasks whose datetime leaks changed.")
+            for key, node in rebuilt.items():
+                if key not in stale:
+                    node["status"] = nodes[key]["status"]
+            failed += run_graph(levels, rebuilt, **kwargs)
+    sys.exit(1 if failed > 0 else 0)
@@ -27,6 +27,9 @@ source_pattern = {
 
 one_task = ["level2"]
 
+# Levels that may run as one process per source-deck month (pipeline -fuse)
+fused_levels = ["level1b", "level1c", "level1d"]
+
 nodesi = {
     "level1d": 1,
     "level2": 1,
@@ -37,3 +40,62 @@ TaskPNi = {
 }
 
 ti = {"level1d": "02:00:00"}
+
+node_memory_mb = 190000
+
+node_tasks = 40
+
+# Linear models of task memory (MB) and time (min) from input size (MB):
+# [intercept, slope]. Overwritten by key task_model of level configuration.
+task_model = {
+    "default": {"memory_mb": [1000, 10.0], "time_min": [5, 0.5]},
+    "level1a": {"memory_mb": [1500, 12.0], "time_min": [5, 1.0]},
+    "level1d": {"memory_mb": [2000, 10.0], "time_min": [10, 1.0]},
+    "level1e": {"memory_mb": [2000, 20.0], "time_min": [10, 2.0]},
+}
+
+# Safety margin and lower bounds of task memory (MB) and time (min) taken
+# from the task history of the release dataset.
+history_margin = 1.5
+
+history_min_memory_mb = 1000
+
+history_min_time_min = 10
+
+# Task fingerprints: packages whose versions are part of the fingerprint and
+# configuration keys that do not affect the task result.
+fingerprint_packages = [
+    "glamod_marine_processing",
+    "cdm_reader_mapper",
+    "marine_qc",
+    "numpy",
+    "pandas",
+    "pyarrow",
+]
+
+fingerprint_ignore = [
+    "paths",
+    "scripts",
+    "overwrite",
+    "submit_jobs",
+    "run_jobs",
+    "parallel_jobs",
+    "parallel_tasks",
+    "worker_pool",
+    "max_tasks",
+    "task_retries",
+    "task_backoff",
+    "limit_memory",
+    "pack_tasks",
+    "task_model",
+    "job_memo_mb",
+    "job_time_hr",
+    "job_time_min",
+    "n_max_jobs",
+    "nohup",
+    "process_list",
+    "process_list_file",
+    "year_init",
+    "year_end",
+    "shard_workers",
+]
@@ -0,0 +1,182 @@
+"""
+Run taskfarm lines interactively in a bounded pool of local processes.
+
+Replaces GNU parallel for the interactive parallel options of the
+obs_suite. Each task is one shell line of a taskfarm file and runs in its
+own process group, so that a task exceeding its time limit is terminated
+together with its children. Failing tasks are retried with exponential
+backoff. Optionally, the address space of each task is limited.
+
+Inargs:
+-------
+executor_file: JSON file with keys n_jobs, retries, backoff and tasks;
+    each task has keys command, timeout (seconds) and memory_mb
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import resource
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from glamod_marine_processing.utilities import load_json
+
+progress_interval = 60
+
+running = {}
+running_lock = threading.Lock()
+
+
+def get_seconds(hhmmss):
+    """Convert HH:MM:SS time string to seconds."""
+    if not hhmmss:
+        return None
+    seconds = 0
+    for part in hhmmss.split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+def format_seconds(seconds):
+    """Format seconds as HH:MM:SS."""
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def set_limits(memory_mb):
+    """Return function limiting the address space of a task."""
+
+    def preexec():
+        if memory_mb:
+            limit = int(memory_mb) * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    return preexec
+
+
+def kill_task(proc, grace=10):
+    """Terminate process group of task, kill it after grace seconds."""
+    for sig in [signal.SIGTERM, signal.SIGKILL]:
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            proc.wait(timeout=grace)
+            return
+        except subprocess.TimeoutExpired:
+            logging.warning(
+                f"Task {proc.pid} still running {grace} s after signal {sig.name}."
+            )
+
+
+def run_command(command, timeout=None, memory_mb=None):
+    """Run shell command in its own process group, return exit status."""
+    proc = subprocess.Popen(
+        ["/bin/sh", "-c", command],
+        start_new_session=True,
+        preexec_fn=set_limits(memory_mb),
+    )
+    with running_lock:
+        running[proc.pid] = proc
+    try:
+        return proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logging.warning(f"Task exceeded time limit of {timeout} s: {command}")
+        kill_task(proc)
+        return None
+    finally:
+        with running_lock:
+            running.pop(proc.pid, None)
+
+
+def run_task(task, retries=0, backoff=30):
+    """Run task, retry with exponential backoff on failure or timeout."""
+    for attempt in range(retries + 1):
+        if attempt > 0:
+            delay = backoff * 2 ** (attempt - 1)
+            logging.info(f"Retry {attempt}/{retries} in {delay} s: {task['command']}")
+            time.sleep(delay)
+        status = run_command(
+            task["command"],
+            timeout=task.get("timeout"),
+            memory_mb=task.get("memory_mb"),
+        )
+        if status == 0:
+            return True
+    return False
+
+
+def log_progress(done, failed, total, start):
+    """Log number of finished tasks, elapsed time and ETA."""
+    elapsed = time.monotonic() - start
+    eta = "unknown"
+    if done > 0:
+        eta = format_seconds(elapsed / done * (total - done))
+    logging.info(
+        f"Progress: {done}/{total} tasks done, {failed} failed, "
+        f"elapsed {format_seconds(elapsed)}, ETA {eta}"
+    )
+
+
+def run_tasks(tasks, n_jobs=1, retries=0, backoff=30):
+    """Run tasks with at most n_jobs at a time, return number of failures."""
+    total = len(tasks)
+    done = 0
+    failed = 0
+    start = time.monotonic()
+    logging.info(f"Run {total} tasks with {n_jobs} jobs in parallel.")
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        futures = {
+            executor.submit(run_task, task, retries, backoff): task for task in tasks
+        }
+        pending = set(futures)
+        try:
+            while pending:
+                finished, pending = wait(
+                    pending, timeout=progress_interval, return_when=FIRST_COMPLETED
+                )
+                for future in finished:
+                    done += 1
+                    try:
+                        success = future.result()
+                    except Exception:
+                        logging.error("Error running task", exc_info=True)
+                        success = False
+                    if success is not True:
+                        failed += 1
+                        logging.error(f"Task failed: {futures[future]['command']}")
+                log_progress(done, failed, total, start)
+        except KeyboardInterrupt:
+            logging.warning("Interrupted. Terminating running tasks.")
+            for future in pending:
+                future.cancel()
+            with running_lock:
+                procs = list(running.values())
+            for proc in procs:
+                kill_task(proc, grace=1)
+            raise
+    return failed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
+        level=logging.INFO,
+        datefmt="%Y%m%d %H:%M:%S",
+        filename=None,
+    )
+    executor_config = load_json(sys.argv[1])
+    failed = run_tasks(
+        executor_config["tasks"],
+        n_jobs=int(executor_config.get("n_jobs") or 1),
+        retries=int(executor_config.get("retries") or 0),
+        backoff=float(executor_config.get("backoff") or 30),
+    )
+    sys.exit(1 if failed > 0 else 0)
@@ -0,0 +1,182 @@
+"""
+Run level script task and record its statistics in the task history.
+
+The level script runs as child process. Wall time, CPU time and peak
+memory of the child are recorded together with input and output sizes
+and row counts in the task history database of the release dataset.
+The exit status of the level script is returned.
+
+Only the standard library is imported, so that wrapping a task does not
+add the import time of the processing package to each task.
+
+Inargs:
+-------
+script: level script
+config_file: task configuration file or task table
+pattern: task pattern in task table (optional)
+"""
+
+from __future__ import annotations
+
+import datetime
+import glob
+import json
+import logging
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from contextlib import closing
+
+history_file = "task_history.sqlite"
+
+columns = {
+    "level": "TEXT",
+    "sid_dck": "TEXT",
+    "year": "INTEGER",
+    "month": "INTEGER",
+    "status": "TEXT",
+    "start": "TEXT",
+    "host": "TEXT",
+    "wall_time": "REAL",
+    "cpu_time": "REAL",
+    "max_rss_mb": "REAL",
+    "input_bytes": "INTEGER",
+    "output_bytes": "INTEGER",
+    "input_rows": "INTEGER",
+    "output_rows": "INTEGER",
+}
+
+insert_query = (
+    f"INSERT INTO tasks ({', '.join(columns)}) "  # noqa: S608, fixed column names
+    f"VALUES ({', '.join('?' for _ in columns)})"
+)
+
+
+def get_history_file(level_dir):
+    """Get task history database of the release dataset of a level."""
+    return os.path.join(os.path.dirname(level_dir), "log", history_file)
+
+
+def connect(db_file):
+    """Connect to task history database, create table if missing."""
+    os.makedirs(os.path.dirname(db_file), exist_ok=True)
+    con = sqlite3.connect(db_file, timeout=60)
+    fields = ", ".join(f"{name} {dtype}" for name, dtype in columns.items())
+    con.execute(f"CREATE TABLE IF NOT EXISTS tasks ({fields})")
+    return con
+
+
+def get_input_files(filename):
+    """Get task input files, all CDM tables of a header file."""
+    basename = os.path.basename(filename)
+    if basename.startswith("header"):
+        suffix = basename[len("header") :]
+        return glob.glob(os.path.join(os.path.dirname(filename), f"*{suffix}"))
+    return [filename]
+
+
+def get_bytes(files):
+    """Get total size of files in bytes."""
+    return sum(os.path.getsize(f) for f in files if os.path.isfile(f))
+
+
+def count_rows(filename):
+    """Count rows of parquet, feather or text file."""
+    if not os.path.isfile(filename):
+        return 0
+    if filename.endswith(".pq") or filename.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        return pq.read_metadata(filename).num_rows
+    if filename.endswith(".feather"):
+        import pyarrow as pa
+
+        with pa.ipc.open_file(pa.memory_map(filename)) as reader:
+            return sum(
+                reader.get_batch(i).num_rows for i in range(reader.num_record_batches)
+            )
+    with open(filename, "rb") as f:
+        n_rows = sum(1 for _ in f)
+    if filename.endswith(".psv") or filename.endswith(".csv"):
+        n_rows = max(n_rows - 1, 0)
+    return n_rows
+
+
+def get_output_files(config):
+    """Get output files of task from its configuration."""
+    level_path = os.path.join(
+        config["paths"]["destination_directory"], config["sid_dck"]
+    )
+    file_id = f"-{config.get('yyyy')}-{config.get('mm')}-"
+    files = glob.glob(os.path.join(level_path, f"*{file_id}*"))
+    return [f for f in files if os.path.isfile(f)]
+
+
+def record_task(config, status, start, wall_time, cpu_time, max_rss_mb):
+    """Record statistics of a finished task in the task history."""
+    input_files = get_input_files(config["filename"])
+    output_files = get_output_files(config)
+    output_headers = [
+        f for f in output_files if os.path.basename(f).startswith("header")
+    ]
+    row = {
+        "level": config["level"],
+        "sid_dck": config["sid_dck"],
+        "year": int(config["yyyy"]) if config.get("yyyy") else None,
+        "month": int(config["mm"]) if config.get("mm") else None,
+        "status": status,
+        "start": datetime.datetime.fromtimestamp(start).isoformat(timespec="seconds"),
+        "host": socket.gethostname(),
+        "wall_time": wall_time,
+        "cpu_time": cpu_time,
+        "max_rss_mb": max_rss_mb,
+        "input_bytes": get_bytes(input_files),
+        "output_bytes": get_bytes(output_files),
+        "input_rows": count_rows(config["filename"]),
+        "output_rows": sum(count_rows(f) for f in output_headers),
+    }
+    db_file = get_history_file(config["paths"]["destination_directory"])
+    with closing(connect(db_file)) as con, con:
+        con.execute(insert_query, [row[name] for name in columns])
+
+
+def load_config(config_file, pattern=None):
+    """Load task configuration as utilities.load_task_config does."""
+    with open(config_file) as f:
+        if pattern is None:
+            return json.load(f)
+        config = json.loads(f.readline())
+        for line in f:
+            task = json.loads(line)
+            if task["pattern"] == pattern:
+                config.update(task)
+                return config
+    raise KeyError(f"Task {pattern} not found in task table {config_file}.")
+
+
+def run_task(script, args):
+    """Run level script, record task statistics and return exit status."""
+    start = time.time()
+    proc = subprocess.Popen([sys.executable, script, *args])
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    wall_time = time.time() - start
+    try:
+        record_task(
+            load_config(*args),
+            status="success" if proc.returncode == 0 else "failure",
+            start=start,
+            wall_time=wall_time,
+            cpu_time=rusage.ru_utime + rusage.ru_stime,
+            max_rss_mb=rusage.ru_maxrss / 1024,
+        )
+    except Exception:
+        logging.warning("Could not record task in task history.", exc_info=True)
+    return proc.returncode
+
+
+if __name__ == "__main__":
+    sys.exit(run_task(sys.argv[1], sys.argv[2:]))
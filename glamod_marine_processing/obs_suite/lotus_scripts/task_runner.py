@@ -0,0 +1,233 @@
+"""
+Run level script tasks in a pool of long-lived worker processes.
+
+Each worker imports the common dependencies and level scripts once and
+calls the run function of the level script of its tasks instead of
+starting a new interpreter per task. Log files and success/failure markers are the same as for the
+taskfarm shell lines written by level_slurm.py. Task statistics are
+recorded in the task history. The peak memory of a process covers all
+tasks it ran, so it is only recorded for the first task of each worker
+(and of a fused task); set max_tasks to 1 to record it for all tasks.
+
+With key fused in the pool file, the tasks are consecutive levels of one
+source-deck month (level1b to level1d). They run one after the other in
+this process and pass their main CDM tables in memory; the tables of the
+intermediate levels are only written with key write_intermediate. Datetime
+leaks, invalid data, quicklooks and markers are written per level as
+usual. A failed level stops the following ones.
+
+Tasks whose worker dies (e.g. out of memory) get a failure marker; the
+pool then exits with a non-zero status.
+
+Inargs:
+-------
+pool_file: JSON file with keys n_workers, max_tasks and tasks; each task
+    has keys script, args (task table and pattern), log_dir and pattern
+"""
+
+from __future__ import annotations
+
+import importlib
+import logging
+import os
+import resource
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from glamod_marine_processing.obs_suite.lotus_scripts.task_recorder import record_task
+from glamod_marine_processing.utilities import load_json, load_task_config
+
+preload_modules = [
+    "numpy",
+    "pandas",
+    "pyarrow",
+    "pyarrow.parquet",
+    "cdm_reader_mapper",
+    "marine_qc",
+    "matplotlib.pyplot",
+]
+
+tasks_run = 0
+
+
+def init_worker(scripts_dirs):
+    """Make level scripts importable and import common dependencies."""
+    logging.basicConfig(
+        format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
+        level=logging.INFO,
+        datefmt="%Y%m%d %H:%M:%S",
+        filename=None,
+    )
+    for scripts_dir in scripts_dirs:
+        if scripts_dir not in sys.path:
+            sys.path.insert(0, scripts_dir)
+    for module in preload_modules:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            logging.warning(f"Could not preload module {module}.", exc_info=True)
+
+
+def run_script(script, args):
+    """Run level script with args, return exit status.
+
+    The script is imported once per process; its run function is called
+    with the parameters of the task.
+    """
+    try:
+        module = importlib.import_module(os.path.splitext(os.path.basename(script))[0])
+        params = module.script_setup(module.process_options, [script, *args])
+        status = module.run(params)
+    except SystemExit as e:
+        status = e.code
+    except Exception:
+        traceback.print_exc()
+        return 1
+    return 0 if status in [None, 0] else 1
+
+
+def get_cpu_time():
+    """Get CPU time of process and its terminated children in seconds."""
+    cpu_time = 0
+    for who in [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN]:
+        usage = resource.getrusage(who)
+        cpu_time += usage.ru_utime + usage.ru_stime
+    return cpu_time
+
+
+def get_max_rss():
+    """Get peak memory of this process in MB if it ran no other task."""
+    if tasks_run > 1:
+        return
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_marker(task, marker, fingerprint=""):
+    """Write success or failure marker of task."""
+    with open(os.path.join(task["log_dir"], f"{task['pattern']}.{marker}"), "w") as f:
+        f.write(fingerprint)
+
+
+def run_task(task):
+    """Run task with stdout and stderr redirected to its log file."""
+    global tasks_run
+    tasks_run += 1
+    log_file = os.path.join(task["log_dir"], f"{task['pattern']}.out")
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_fds = [os.dup(1), os.dup(2)]
+    start = time.time()
+    cpu_start = get_cpu_time()
+    try:
+        with open(log_file, "w") as f:
+            os.dup2(f.fileno(), 1)
+            os.dup2(f.fileno(), 2)
+            status = run_script(task["script"], task["args"])
+            sys.stdout.flush()
+            sys.stderr.flush()
+    finally:
+        os.dup2(saved_fds[0], 1)
+        os.dup2(saved_fds[1], 2)
+        for fd in saved_fds:
+            os.close(fd)
+
+    marker = "success" if status == 0 else "failure"
+    try:
+        record_task(
+            load_task_config(*task["args"]),
+            status=marker,
+            start=start,
+            wall_time=time.time() - start,
+            cpu_time=get_cpu_time() - cpu_start,
+            max_rss_mb=get_max_rss(),
+        )
+    except Exception:
+        logging.warning("Could not record task in task history.", exc_info=True)
+    fingerprint = ""
+    fingerprint_file = os.path.join(task["log_dir"], f"{task['pattern']}.fingerprint")
+    if marker == "success" and os.path.isfile(fingerprint_file):
+        with open(fingerprint_file) as f:
+            fingerprint = f.read()
+    write_marker(task, marker, fingerprint)
+    return task["pattern"], marker
+
+
+def run_fused(tasks, write_intermediate=False):
+    """Run tasks of consecutive levels in this process, tables in memory.
+
+    Returns 1 if a task failed, otherwise 0.
+    """
+    init_worker(sorted({os.path.dirname(task["script"]) for task in tasks}))
+    memory = importlib.import_module("_utilities")
+    try:
+        for i, task in enumerate(tasks):
+            last = i == len(tasks) - 1
+            memory.memory_options["keep"] = not last
+            memory.memory_options["write"] = last or write_intermediate
+            previous = list(memory.memory_tables.keys())
+            pattern, marker = run_task(task)
+            for name in previous:
+                memory.memory_tables.pop(name, None)
+            logging.info(f"Task {pattern}: {marker} ({i + 1}/{len(tasks)})")
+            if marker != "success":
+                return 1
+    finally:
+        memory.memory_tables.clear()
+        memory.memory_options.update({"keep": False, "write": True})
+    return 0
+
+
+def run_pool(tasks, n_workers=1, max_tasks=None):
+    """Run tasks in a pool of n_workers processes.
+
+    Workers are not daemonic, so level scripts may start process pools
+    themselves. With max_tasks, workers are replaced after max_tasks
+    tasks; with max_tasks 1, the peak memory of every task is recorded.
+    Returns 1 if a task could not be run to its end, otherwise 0.
+    """
+    scripts_dirs = sorted({os.path.dirname(task["script"]) for task in tasks})
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        initializer=init_worker,
+        initargs=(scripts_dirs,),
+        max_tasks_per_child=max_tasks,
+    ) as executor:
+        futures = {executor.submit(run_task, task): task for task in tasks}
+        status = 0
+        for i, future in enumerate(as_completed(futures), start=1):
+            task = futures[future]
+            try:
+                pattern, marker = future.result()
+            except Exception:
+                logging.error(f"Error running task {task['pattern']}", exc_info=True)
+                write_marker(task, "failure")
+                status = 1
+                continue
+            logging.info(f"Task {pattern}: {marker} ({i}/{len(tasks)})")
+    return status
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
+        level=logging.INFO,
+        datefmt="%Y%m%d %H:%M:%S",
+        filename=None,
+    )
+    pool_config = load_json(sys.argv[1])
+    if pool_config.get("fused") is True:
+        sys.exit(
+            run_fused(
+                pool_config["tasks"],
+                write_intermediate=pool_config.get("write_intermediate") is True,
+            )
+        )
+    sys.exit(
+        run_pool(
+            pool_config["tasks"],
+            n_workers=int(pool_config.get("n_workers") or 1),
+            max_tasks=pool_config.get("max_tasks"),
+        )
+    )
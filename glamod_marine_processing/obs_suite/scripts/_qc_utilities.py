@@ -5,8 +5,12 @@ from __future__ import annotations
 import copy
 import datetime
 import logging
+import multiprocessing
 import operator
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 
 import numpy as np
 import pandas as pd
@@ -18,6 +22,8 @@ from marine_qc import (
 )
 from marine_qc.auxiliary import isvalid
 from marine_qc.external_clim import Climatology
+from marine_qc.location_control import mds_lat_to_yindex_fast, mds_lon_to_xindex_fast
+from marine_qc.time_control import which_pentad_array
 
 op_map = {
     "+": operator.add,
@@ -29,6 +35,14 @@ op_map = {
     "**": operator.pow,
 }
 
+# Processes are spawned since forked workers inherit dask and HDF5 locks
+executors = {
+    "thread": ThreadPoolExecutor,
+    "process": partial(
+        ProcessPoolExecutor, mp_context=multiprocessing.get_context("spawn")
+    ),
+}
+
 
 def update_history(history, history_add):
     """Update history."""
@@ -50,13 +64,6 @@ def get_single_qc_flag(df):
     return pd.Series(result, index=df.index, name="QC_FLAG")
 
 
-def compare_quality_checks(df, location_quality, report_time_quality):
-    """Compare entries with location_quality and report_time_quality."""
-    df[location_quality == 2] = 1
-    df[report_time_quality == 4] = 1
-    df[report_time_quality == 5] = 1
-
-
 def update_filenames(d, ext_path):
     """Ad external file path to file names."""
     if isinstance(d, dict):
@@ -79,15 +86,159 @@ def open_netcdffiles(d):
                 open_netcdffiles(v)
 
 
-def drop_invalid_indexes(df, df_ref, failed_qc):
-    """Drop invalid indexes."""
-    indexes_failed = df_ref[df_ref == failed_qc].index
-    indexes_failed = indexes_failed.intersection(df.index)
-    df.drop(index=indexes_failed, inplace=True)
+def get_positions(df):
+    """Get positions of the reports of df in their QC flags.
+
+    Reports of context data have no positions and get -1.
+    """
+    if QCFlags.position not in df.columns:
+        return np.full(len(df), QCFlags.missing, dtype="int64")
+    return df[QCFlags.position].fillna(QCFlags.missing).to_numpy(dtype="int64")
+
+
+def get_flags(flags, positions):
+    """Get flags of reports by integer position, -1 for reports without flags."""
+    positions = np.asarray(positions, dtype="int64")
+    return np.where(positions >= 0, flags.to_numpy()[positions], QCFlags.missing)
+
+
+def set_flags(flags, positions, value):
+    """Set flags of reports by integer position.
+
+    value is either a scalar or array-like in order of positions.
+    Reports without flags (position -1) are ignored.
+    """
+    positions = np.asarray(positions, dtype="int64")
+    valid = positions >= 0
+    if not np.isscalar(value):
+        value = np.asarray(value)[valid].astype(flags.dtype)
+    flags.iloc[positions[valid]] = value
+
+
+class QCFlags:
+    """QC flags and history of all tables of one month.
+
+    Flags are kept as compact int8 Series in the report order of the data
+    tables, with -1 for missing flags. add_positions stores the position
+    of each report in its flags in the QC data tables, so that flags are
+    read and set by integer position during QC. Only flags changed during
+    QC are written back to the data tables, so their columns keep their
+    original dtypes.
+    """
+
+    missing = -1
+    position = "qc_position"
+    header_columns = ["report_quality", "location_quality", "report_time_quality"]
+
+    def __init__(
+        self,
+        report_quality,
+        location_quality,
+        report_time_quality,
+        quality_flags,
+        history,
+    ):
+        self.report_quality = report_quality
+        self.location_quality = location_quality
+        self.report_time_quality = report_time_quality
+        self.quality_flags = quality_flags
+        self.history = history
+
+    @classmethod
+    def to_int8(cls, series):
+        """Convert flags to int8."""
+        series = pd.to_numeric(series, errors="coerce")
+        return series.fillna(cls.missing).astype("int8")
+
+    @classmethod
+    def from_data_dict(cls, data_dict):
+        """Get QC flags from data dictionary."""
+        header = data_dict["header"]
+        quality_flags = {
+            table: cls.to_int8(df["quality_flag"])
+            for table, df in data_dict.items()
+            if table != "header"
+        }
+        return cls(
+            *[cls.to_int8(header[column]) for column in cls.header_columns],
+            quality_flags=quality_flags,
+            history=header["history"].copy(),
+        )
+
+    def get_table_flags(self, table):
+        """Get flags indexed like the reports of table."""
+        if table == "header":
+            return self.report_quality
+        return self.quality_flags[table]
+
+    def add_positions(self, data_dict):
+        """Add positions of the reports in their flags to QC data tables."""
+        for table, df in data_dict.items():
+            if not df.index.equals(self.get_table_flags(table).index):
+                raise ValueError(f"QC data and flags of {table} are not aligned.")
+            df[self.position] = np.arange(len(df))
+
+    def set_report_quality(self):
+        """Fail reports with failed location or report time quality."""
+        failed = (self.location_quality == 2) | self.report_time_quality.isin([4, 5])
+        self.report_quality[failed] = 1
+
+    def add_history(self, mask, history_add):
+        """Add history_add to history of reports selected by boolean mask."""
+        self.history[mask] = self.history[mask].apply(
+            lambda x: update_history(x, history_add)
+        )
+
+    def copy_flags(self, table, table_cp):
+        """Copy flags of table_cp to table for reports available in both."""
+        flags_cp = self.quality_flags[table_cp]
+        positions = self.quality_flags[table].index.get_indexer(flags_cp.index)
+        set_flags(self.quality_flags[table], positions, flags_cp)
+
+    def update_data_dict(self, data_dict):
+        """Write changed flags and history to data dictionary."""
+        for table, df in data_dict.items():
+            if table == "header":
+                columns = {
+                    column: getattr(self, column) for column in self.header_columns
+                }
+                df["history"] = self.history
+            else:
+                columns = {"quality_flag": self.quality_flags[table]}
+
+            for column, flags in columns.items():
+                if not flags.index.equals(df.index):
+                    flags = flags.reindex(df.index, fill_value=self.missing)
+                flags = flags.to_numpy()
+                changed = np.flatnonzero(flags != self.to_int8(df[column]).to_numpy())
+                if len(changed) == 0:
+                    continue
+                values = df[column].copy()
+                values.iloc[changed] = flags[changed]
+                df[column] = values
+
+
+def drop_failed_reports(df, flags, failed_qc):
+    """Drop reports of df that have the flag failed_qc, looked up by position."""
+    failed = get_flags(flags, get_positions(df)) == failed_qc
+    if not failed.any():
+        return df
+    return df[~failed]
+
+
+def drop_reports(df, report_ids):
+    """Drop reports of context data by report_id."""
+    if len(report_ids) == 0:
+        return df
+    return df[~df.index.isin(report_ids)]
 
 
 def get_combined_input_values(tables, names, data_dict, drop_idx=None):
-    """Get combined input values."""
+    """Get combined input values.
+
+    Inputs are aligned by report_id. If a report_id occurs more than once
+    in a table, the first occurrence is kept.
+    """
     inputs = {}
     for ivar, table in tables.items():
         data = data_dict[table]
@@ -96,21 +247,41 @@ def get_combined_input_values(tables, names, data_dict, drop_idx=None):
             continue
         column = names[ivar]
         inputs[ivar] = data[column]
+        if not inputs[ivar].index.is_unique:
+            inputs[ivar] = inputs[ivar][~inputs[ivar].index.duplicated(keep="first")]
         if drop_idx is None:
             continue
-        intersec = inputs[ivar].index.intersection(drop_idx)
-        inputs[ivar] = inputs[ivar].drop(index=intersec)
+        inputs[ivar] = inputs[ivar][~inputs[ivar].index.isin(drop_idx)]
 
+    # Keep reports available in all inputs in order of the first input
     series_list = list(inputs.values())
-    common_indexes = set(series_list[0].index).intersection(
-        *(s.index for s in series_list[1:])
-    )
-    common_indexes = list(common_indexes)
+    common_indexes = series_list[0].index
+    available = np.ones(len(common_indexes), dtype=bool)
+    for series in series_list[1:]:
+        available &= series.index.get_indexer(common_indexes) >= 0
+    common_indexes = common_indexes[available]
     for ivar, series in inputs.items():
-        inputs[ivar] = inputs[ivar].loc[common_indexes]
+        inputs[ivar] = series.iloc[series.index.get_indexer(common_indexes)]
     return inputs
 
 
+def get_combined_inputs(parameters, data_dict, flagged_tables, drop_idx=None):
+    """Get combined input values and positions of the reports in flagged tables.
+
+    The positions are read alongside the inputs, in the same report order.
+    """
+    tables = {**parameters.tables, **{table: table for table in flagged_tables}}
+    names = {
+        **parameters.names,
+        **{table: QCFlags.position for table in flagged_tables},
+    }
+    inputs = get_combined_input_values(tables, names, data_dict, drop_idx=drop_idx)
+    positions = {
+        table: inputs.pop(table).to_numpy(dtype="int64") for table in flagged_tables
+    }
+    return inputs, positions
+
+
 def all_tables_available(tables, data_dict):
     """Check if all tables available in data_dict."""
     available = True
@@ -121,33 +292,205 @@ def all_tables_available(tables, data_dict):
     return available
 
 
-def concat_dataframes(df1, df2):
-    """Concat dataframes."""
-    df = pd.concat([df1, df2])
+def concat_dataframes(*dfs):
+    """Concat dataframes and drop duplicated reports.
+
+    Reports are identified by their index (report_id). If a report_id occurs
+    more than once, the first occurrence is kept.
+
+    The month window is concatenated per table and QC step since each step
+    drops the failed reports of both the current and the context data.
+    """
+    dfs = [df for df in dfs if not df.empty] or list(dfs[:1])
+    df = pd.concat(dfs)
     return df[~df.index.duplicated(keep="first")]
 
 
+def get_group_positions(index, group_df, column="primary_station_id"):
+    """Get integer positions of index grouped by a column of group_df.
+
+    Group labels are looked up once for all reports. Groups are sorted
+    by label and positions keep the order of index within each group.
+    Reports not in group_df or with missing labels are left out.
+    """
+    if not group_df.index.is_unique:
+        group_df = group_df[~group_df.index.duplicated(keep="first")]
+    positions = group_df.index.get_indexer(index)
+    rows = np.flatnonzero(positions >= 0)
+    codes, _ = pd.factorize(group_df[column].to_numpy()[positions[rows]], sort=True)
+    rows = rows[codes >= 0]
+    codes = codes[codes >= 0]
+    order = np.argsort(codes, kind="stable")
+    rows = rows[order]
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    return [group for group in np.split(rows, bounds) if len(group) > 0]
+
+
 def run_qc_by_group(inputs, group_df, func, kwargs):
-    """Run QC function grouped by primary_station_id."""
-    passed_idxs = []
-    failed_idxs = []
+    """Run QC function grouped by primary_station_id.
+
+    All inputs are expected to share the same index. Returns boolean masks
+    of passed and failed reports in the order of the inputs.
+    """
     sample_input = next(iter(inputs.values()))
-    for ps_id, subset in group_df.groupby("primary_station_id"):
-        idx = sample_input.index.intersection(subset.index)
-        if idx.empty:
-            continue
+    passed = np.zeros(len(sample_input), dtype=bool)
+    failed = np.zeros(len(sample_input), dtype=bool)
+    for rows in get_group_positions(sample_input.index, group_df):
+        subset_inputs = {k: v.iloc[rows] for k, v in inputs.items()}
+        qc_flags = np.asarray(func(**subset_inputs, **kwargs))
+        passed[rows[qc_flags == 0]] = True
+        failed[rows[qc_flags == 1]] = True
+
+    return passed, failed
+
+
+def get_table_pool(n_workers, executor, n_tables):
+    """Get a pool to run the checks of observations tables concurrently.
+
+    The pool is shared by the individual, sequential and grouped checks.
+    Returns a null context if the tables are checked one after another.
+    """
+    if not n_workers or int(n_workers) <= 1 or n_tables <= 1:
+        return nullcontext()
+
+    pool_class = executors.get(executor or "thread")
+    if pool_class is None:
+        raise ValueError(
+            f"Unknown executor: {executor}. Use one of {list(executors.keys())}."
+        )
+
+    n_workers = min(int(n_workers), n_tables)
+    logging.info(f"Run table checks with {n_workers} {executor} workers")
+    return pool_class(max_workers=n_workers)
+
+
+def map_tables(func, kwargs_list, pool=None):
+    """Call func once per observations table.
 
-        subset_inputs = {k: v.loc[idx] for k, v in inputs.items()}
-        qc_flags = func(**subset_inputs, **kwargs)
+    With a pool, the calls run concurrently.
+    Results are always returned in the order of kwargs_list.
+    """
+    if pool is None:
+        return [func(**kwargs) for kwargs in kwargs_list]
 
-        passed = qc_flags[qc_flags == 0].index
-        failed = qc_flags[qc_flags == 1].index
-        if not passed.empty:
-            passed_idxs.extend(passed)
-        if not failed.empty:
-            failed_idxs.extend(failed)
+    futures = [pool.submit(func, **kwargs) for kwargs in kwargs_list]
+    return [future.result() for future in futures]
 
-    return pd.Index(passed_idxs), pd.Index(failed_idxs)
+
+class GridIndex:
+    """Grid box and pentad index of reports for grouped checks.
+
+    Reports are bucketed on the 1x1 degree x pentad grid of the marine_qc
+    buddy checks. The index is keyed on report_id, so it can be built once
+    from the header positions of a month window and reused for every
+    observations table.
+    """
+
+    nx = 360
+    ny = 180
+    nt = 73
+
+    def __init__(self, lat, lon, date):
+        valid = isvalid(lat) & isvalid(lon) & isvalid(date)
+        lat = lat[valid].astype(float)
+        lon = lon[valid].astype(float)
+        date = pd.to_datetime(date[valid])
+
+        x = mds_lon_to_xindex_fast(lon.to_numpy(copy=True), res=1) % self.nx
+        y = mds_lat_to_yindex_fast(lat.to_numpy(copy=True), res=1) % self.ny
+        t = which_pentad_array(date.dt.month.to_numpy(), date.dt.day.to_numpy()) - 1
+        self.cells = pd.Series(
+            self.get_cell_ids(x, y, t), index=lat.index, dtype="int64"
+        )
+        self.cells = self.cells[~self.cells.index.duplicated(keep="first")]
+
+    @classmethod
+    def from_header(cls, *dfs):
+        """Build index from header tables."""
+        dfs = [df for df in dfs if not df.empty]
+        if not dfs:
+            return None
+        df = pd.concat(
+            [df[["latitude", "longitude", "report_timestamp"]] for df in dfs]
+        )
+        return cls(df["latitude"], df["longitude"], df["report_timestamp"])
+
+    def get_cell_ids(self, x, y, t):
+        """Convert grid indexes to unique cell ids."""
+        return (np.asarray(t) * self.ny + np.asarray(y)) * self.nx + np.asarray(x)
+
+    def get_neighbour_mask(self, report_ids, limits):
+        """Get mask of all cells within limits [lon, lat, pentads] of reports.
+
+        The mask is indexed by cell id. As in the marine_qc buddy search,
+        the longitude limit widens with latitude.
+        """
+        cells = np.unique(self.cells[self.cells.index.isin(report_ids)].to_numpy())
+        xspan, yspan, tspan = (int(limit) for limit in limits)
+        t, cells_yx = np.divmod(cells, self.nx * self.ny)
+        y, x = np.divmod(cells_yx, self.nx)
+        occupied = np.zeros((self.nt, self.ny, self.nx), dtype=bool)
+        occupied[t, y, x] = True
+
+        # Dilate along longitude per latitude row as a circular moving sum
+        mask = np.zeros_like(occupied)
+        for row in np.unique(y):
+            occupied_row = occupied[:, row, :]
+            full_xspan = int(xspan / np.cos(np.radians(89.5 - row)))
+            if 2 * full_xspan + 1 >= self.nx:
+                mask[:, row, :] = occupied_row.any(axis=1, keepdims=True)
+                continue
+            padded = np.concatenate(
+                [
+                    occupied_row[:, self.nx - full_xspan :],
+                    occupied_row,
+                    occupied_row[:, :full_xspan],
+                ],
+                axis=1,
+            )
+            counts = np.pad(np.cumsum(padded, axis=1), ((0, 0), (1, 0)))
+            width = 2 * full_xspan + 1
+            mask[:, row, :] = counts[:, width : width + self.nx] > counts[:, : self.nx]
+
+        # Dilate along latitude and pentads, wrapping at the grid boundaries
+        for axis, span in ((1, yspan), (0, tspan)):
+            dilated = mask.copy()
+            for shift in range(1, span + 1):
+                dilated |= np.roll(mask, shift, axis=axis)
+                dilated |= np.roll(mask, -shift, axis=axis)
+            mask = dilated
+        return mask.ravel()
+
+    def select_neighbours(self, df, report_ids, limits):
+        """Select rows of df that can be buddies of reports.
+
+        Rows not available in the index are kept.
+        """
+        if df.empty:
+            return df
+        neighbour_mask = self.get_neighbour_mask(report_ids, limits)
+        cells = self.cells.reindex(df.index)
+        indexed = cells.notna().to_numpy()
+        mask = ~indexed
+        mask[indexed] = neighbour_mask[cells.to_numpy()[indexed].astype("int64")]
+        return df[mask]
+
+
+def get_search_limits(qc_dict_obs, qc_dict_obs_sp, table):
+    """Get maximum buddy search limits [lon, lat, pentads] of table checks."""
+    limits = []
+    for qc_name, qc_dict in qc_dict_obs.items():
+        if table not in qc_dict["tables"]:
+            continue
+        limits_ = qc_dict_obs_sp.get(qc_name, {}).get(
+            "limits", qc_dict.get("arguments", {}).get("limits")
+        )
+        if limits_ is None:
+            return None
+        limits.append(np.atleast_2d(limits_))
+    if not limits:
+        return None
+    return np.concatenate(limits).max(axis=0)
 
 
 class Parameters:
@@ -183,9 +526,7 @@ def get_qc_function_and_inputs(qc_dict, data, table_name, qc_module):
 
 def do_qc_individual_header(
     data,
-    report_quality,
-    location_quality,
-    report_time_quality,
+    qc_flags,
     params,
     ext_path,
     i=1,
@@ -198,13 +539,14 @@ def do_qc_individual_header(
     # Header
     logging.info(f"{i}.{j}. Do individual header checks")
     qc_dict_header = copy.deepcopy(qc_dict.get("header", {}))
+    positions = get_positions(data)
 
     # Position check
     logging.info(f"{i}.{j}.1. Do positional checks")
 
     # Deselect already failed location_qualities
-    data_pos = data[location_quality.loc[data.index] != 2]
-    idx_pos = data_pos.index
+    selected = get_flags(qc_flags.location_quality, positions) != 2
+    data_pos = data[selected]
 
     # Do position check
     qc_dict_pos = copy.deepcopy(qc_dict_header.get("position_check", {}))
@@ -215,16 +557,15 @@ def do_qc_individual_header(
     )
     pos_qc = get_single_qc_flag(pos_qc)
     pos_qc = pos_qc.replace({1: 2, 2: 3})
-    location_quality.loc[idx_pos] = pos_qc
+    set_flags(qc_flags.location_quality, positions[selected], pos_qc)
 
     # Time check
     logging.info(f"{i}.{j}.2. Do time checks")
 
     # Deselect already failed report_time_qualities
-    data_time = data[
-        (report_time_quality.loc[data.index] != 4)
-        & (report_time_quality.loc[data.index] != 5)
-    ]
+    report_time_quality = get_flags(qc_flags.report_time_quality, positions)
+    selected = (report_time_quality != 4) & (report_time_quality != 5)
+    data_time = data[selected]
 
     # Do time check
     qc_dict_tme = copy.deepcopy(qc_dict_header.get("time_check", {}))
@@ -234,15 +575,53 @@ def do_qc_individual_header(
         return_method=return_method,
     )
     time_qc = get_single_qc_flag(time_qc)
-    time_qc = time_qc.replace({1: 5, 2: 4, 3: 4})
-    invalid_indexes = time_qc[time_qc != 0].index
-    report_time_quality.loc[invalid_indexes] = time_qc[invalid_indexes]
+    time_qc = time_qc.replace({1: 5, 2: 4, 3: 4}).to_numpy()
+    invalid = time_qc != 0
+    set_flags(
+        qc_flags.report_time_quality, positions[selected][invalid], time_qc[invalid]
+    )
 
     # Report quality
     logging.info(f"{i}.{j}.3. Set report quality")
-    compare_quality_checks(report_quality, location_quality, report_time_quality)
+    qc_flags.set_report_quality()
+
+    return qc_flags
+
+
+def get_individual_preproc_dict(params, ext_path, table):
+    """Get individual pre-processing of table with opened climatologies."""
+    qc_dict = params.qc_settings.get("individual_reports")
+    preproc_dict = copy.deepcopy(qc_dict.get("preprocessing", {}).get(table, {}))
+    update_filenames(preproc_dict, ext_path)
+    open_netcdffiles(preproc_dict)
+    return preproc_dict
+
+
+def get_grouped_preproc_dict(params, ext_path, table):
+    """Get grouped pre-processing of table with opened climatologies."""
+    qc_dict = params.qc_settings.get("grouped_reports")
+    preproc_dict = copy.deepcopy(qc_dict.get("preprocessing", {}).get(table, {}))
+    preproc_dict_ind = (
+        params.qc_settings.get("individual_reports")
+        .get("preprocessing", {})
+        .get(table, {})
+    )
+
+    for var_name, val in preproc_dict.items():
+        if val == "__individual_reports__":
+            preproc_dict[var_name] = {
+                "inputs": copy.deepcopy(
+                    preproc_dict_ind.get(var_name, {}).get("inputs")
+                )
+            }
+
+    update_filenames(preproc_dict, ext_path)
+    open_netcdffiles(preproc_dict)
 
-    return report_quality, location_quality, report_time_quality
+    for var_name, val in preproc_dict.items():
+        if isinstance(val, dict) and "inputs" in val:
+            preproc_dict[var_name] = val["inputs"]
+    return preproc_dict
 
 
 def do_qc_individual_observation(
@@ -251,6 +630,7 @@ def do_qc_individual_observation(
     quality_flag,
     params,
     ext_path,
+    preproc_dict=None,
     i=1,
     j=1,
     k=1,
@@ -266,34 +646,32 @@ def do_qc_individual_observation(
         qc_dict=qc_dict_miss,
         return_method=return_method,
     )
-    miss_qc = get_single_qc_flag(miss_qc)
-    quality_flag.loc[miss_qc[miss_qc == 1].index] = 3
-    drop_invalid_indexes(data, quality_flag, 3)
+    miss_qc = get_single_qc_flag(miss_qc).to_numpy()
+    set_flags(quality_flag, get_positions(data)[miss_qc == 1], 3)
+    data = drop_failed_reports(data, quality_flag, 3)
 
     # Do QC
-    preproc_dict = copy.deepcopy(qc_dict.get("preprocessing", {}).get(table, {}))
+    if preproc_dict is None:
+        preproc_dict = get_individual_preproc_dict(params, ext_path, table)
     qc_dict_obs = copy.deepcopy(qc_dict.get("observations", {}).get(table, {}))
-    update_filenames(preproc_dict, ext_path)
-    open_netcdffiles(preproc_dict)
     obs_qc = do_multiple_individual_check(
         data=data,
         preproc_dict=preproc_dict,
         qc_dict=qc_dict_obs,
         return_method=return_method,
     )
-    obs_qc = get_single_qc_flag(obs_qc)
+    obs_qc = get_single_qc_flag(obs_qc).to_numpy()
 
     # Flag quality_flag
-    passed = obs_qc[obs_qc == 0].index
-    failed = obs_qc[obs_qc == 1].index
-    quality_flag.loc[passed] = 0
-    quality_flag.loc[failed] = 1
-    return quality_flag
+    positions = get_positions(data)
+    set_flags(quality_flag, positions[obs_qc == 0], 0)
+    set_flags(quality_flag, positions[obs_qc == 1], 1)
+    return data, quality_flag
 
 
 def do_qc_individual_combined(
     data_dict_qc,
-    quality_flags,
+    qc_flags,
     params,
     ext_path,
     i=1,
@@ -314,59 +692,48 @@ def do_qc_individual_combined(
 
         logging.info(f"{i}.{j}.{k}. Do individual combined {qc_name} check")
 
-        inputs = get_combined_input_values(
-            parameters.tables, parameters.names, data_dict_qc
-        )
-
-        qc_flag = parameters.func(**inputs)
-        idx_passed = qc_flag[qc_flag == 0].index
-        idx_failed = qc_flag[qc_flag == 1].index
-
         if parameters.get_flagged is not None:
             obs_tables = parameters.get_flagged
+        inputs, positions = get_combined_inputs(parameters, data_dict_qc, obs_tables)
+
+        qc_flag = np.asarray(parameters.func(**inputs))
         for table in obs_tables:
-            quality_flags[table].loc[idx_passed] = 0
-            quality_flags[table].loc[idx_failed] = 1
-            drop_invalid_indexes(data_dict_qc[table], qc_flag, 1)
+            quality_flag = qc_flags.quality_flags[table]
+            set_flags(quality_flag, positions[table][qc_flag == 0], 0)
+            set_flags(quality_flag, positions[table][qc_flag == 1], 1)
+            data_dict_qc[table] = drop_failed_reports(
+                data_dict_qc[table], quality_flag, 1
+            )
 
         k += 1
 
-    return quality_flags
+    return qc_flags
 
 
 def do_qc_sequential_header(
     data,
-    report_quality,
-    location_quality,
+    qc_flags,
     idx_gnrc,
     params,
     data_add,
     i=1,
     j=1,
 ):
+    """Sequential header QC, return context reports that did not fail."""
     # Header
     logging.info(f"{i}.{j}. Do sequential header checks")
     qc_dict = copy.deepcopy(
         params.qc_settings.get("sequential_reports", {}).get("header", {})
     )
-    indexes_orig = data.index
-    data = data.copy()
 
     # Deselect rows containing generic ids
-    data = pd.concat([data, data_add])
-
-    data_str = data.astype(str)
-    data_str_no_dup = data_str.drop_duplicates()
-    indexes_no_dup = data_str_no_dup.index
-    data = data.loc[indexes_no_dup]
-
-    invalid_indexes = idx_gnrc.intersection(data.index)
-    data.drop(index=invalid_indexes, inplace=True)
+    data = concat_dataframes(data, data_add)
+    data = drop_reports(data, idx_gnrc)
 
     k = 1
     for qc_name in qc_dict.keys():
         # Deselect already failed report_qualities
-        drop_invalid_indexes(data, report_quality, 1)
+        data = drop_failed_reports(data, qc_flags.report_quality, 1)
 
         # Get parameters
         func, inputs, kwargs = get_qc_function_and_inputs(
@@ -377,22 +744,19 @@ def do_qc_sequential_header(
 
         logging.info(f"{i}.{j}.{k}. Do sequential {qc_name} check.")
 
-        # Do QC
-        indexes_passed, indexes_failed = run_qc_by_group(inputs, data, func, kwargs)
-        indexes_passed_orig = indexes_passed.intersection(indexes_orig)
-        indexes_failed_orig = indexes_failed.intersection(indexes_orig)
-        indexes_failed_add = indexes_failed.intersection(data_add.index)
+        # Do QC, reports of context data have no flags to set
+        passed, failed = run_qc_by_group(inputs, data, func, kwargs)
+        positions = get_positions(data)
+        set_flags(qc_flags.location_quality, positions[passed], 0)
+        set_flags(qc_flags.location_quality, positions[failed], 2)
+        set_flags(qc_flags.report_quality, positions[failed], 1)
 
-        location_quality.loc[indexes_passed_orig] = 0
-        location_quality.loc[indexes_failed_orig] = 2
-        report_quality.loc[indexes_failed_orig] = 1
-
-        drop_invalid_indexes(data, report_quality, 1)
-        data_add.drop(index=indexes_failed_add, inplace=True)
+        data_add = drop_reports(data_add, data.index[failed])
+        data = drop_failed_reports(data, qc_flags.report_quality, 1)
 
         k += 1
 
-    return report_quality, location_quality
+    return data_add
 
 
 def do_qc_sequential_observation(
@@ -414,19 +778,15 @@ def do_qc_sequential_observation(
     )
 
     logging.info(f"{i}.{j}.{k}. Do sequential {table} checks")
-    indexes_orig = data.index
-    data = data.copy()
 
     # Deselect rows containing generic ids
-    data = pd.concat([data, data_add])
-    data = data.drop_duplicates()
-    invalid_indexes = idx_gnrc.intersection(data.index)
-    data.drop(index=invalid_indexes, inplace=True)
+    data = concat_dataframes(data, data_add)
+    data = drop_reports(data, idx_gnrc)
 
     l = 1  # noqa: E741
     for qc_name in qc_dict.keys():
         # Deselect already failed report_qualities
-        drop_invalid_indexes(data, quality_flag, 1)
+        data = drop_failed_reports(data, quality_flag, 1)
 
         # Get parameter
         func, inputs, kwargs = get_qc_function_and_inputs(
@@ -437,28 +797,23 @@ def do_qc_sequential_observation(
 
         logging.info(f"{i}.{j}.{k}.{l}. Do {qc_name} check")
 
-        # Do QC
-        indexes_passed, indexes_failed = run_qc_by_group(
-            inputs, data_group, func, kwargs
-        )
-        indexes_passed_orig = indexes_passed.intersection(indexes_orig)
-        indexes_failed_orig = indexes_failed.intersection(indexes_orig)
-        indexes_failed_add = indexes_failed.intersection(data_add.index)
+        # Do QC, reports of context data have no flags to set
+        passed, failed = run_qc_by_group(inputs, data_group, func, kwargs)
+        positions = get_positions(data)
+        set_flags(quality_flag, positions[passed], 0)
+        set_flags(quality_flag, positions[failed], 1)
 
-        quality_flag.loc[indexes_passed_orig] = 0
-        quality_flag.loc[indexes_failed_orig] = 1
-
-        drop_invalid_indexes(data, quality_flag, 1)
-        data_add.drop(index=indexes_failed_add, inplace=True)
+        data_add = drop_reports(data_add, data.index[failed])
+        data = drop_failed_reports(data, quality_flag, 1)
 
         l += 1  # noqa: E741
 
-    return quality_flag
+    return quality_flag, data_add
 
 
 def do_qc_sequential_combined(
     data_dict_qc,
-    quality_flags,
+    qc_flags,
     idx_gnrc,
     params,
     data_dict_add,
@@ -481,13 +836,15 @@ def do_qc_sequential_combined(
             continue
 
         logging.info(f"{i}.{j}.{k}. Do sequential combined {qc_name} check")
-        inputs_dat = get_combined_input_values(
-            parameters.tables,
-            parameters.names,
+        if parameters.get_flagged is not None:
+            obs_tables = parameters.get_flagged
+        inputs_dat, positions_dat = get_combined_inputs(
+            parameters,
             data_dict_qc,
+            obs_tables,
             drop_idx=idx_gnrc,
         )
-        indexes_orig = inputs_dat[list(inputs_dat.keys())[0]].index
+        n_dat = len(next(iter(inputs_dat.values())))
 
         inputs_add = get_combined_input_values(
             parameters.tables,
@@ -495,35 +852,45 @@ def do_qc_sequential_combined(
             data_dict_add,
             drop_idx=idx_gnrc,
         )
-        indexes_add = inputs_add[list(inputs_add.keys())[0]].index
 
+        # Reports of the current month come first and are kept
         inputs = {
             column: concat_dataframes(inputs_dat[column], inputs_add[column])
             for column in inputs_dat.keys()
         }
 
-        indexes_passed, indexes_failed = run_qc_by_group(
+        passed, failed = run_qc_by_group(
             inputs, data_dict_qc["header"], parameters.func, parameters.kwargs
         )
-        indexes_passed_orig = indexes_passed.intersection(indexes_orig)
-        indexes_failed_orig = indexes_failed.intersection(indexes_orig)
-        indexes_failed_add = indexes_failed.intersection(indexes_add)
 
-        if parameters.get_flagged is not None:
-            obs_tables = parameters.get_flagged
         for table in obs_tables:
-            quality_flags[table].loc[indexes_passed_orig] = 0
-            quality_flags[table].loc[indexes_failed_orig] = 1
-            drop_invalid_indexes(data_dict_qc[table], quality_flags[table], 1)
-            data_dict_add[table].drop(index=indexes_failed_add)
+            quality_flag = qc_flags.quality_flags[table]
+            positions = np.full(len(passed), QCFlags.missing, dtype="int64")
+            positions[:n_dat] = positions_dat[table]
+            set_flags(quality_flag, positions[passed], 0)
+            set_flags(quality_flag, positions[failed], 1)
+            data_dict_qc[table] = drop_failed_reports(
+                data_dict_qc[table], quality_flag, 1
+            )
 
         k += 1
 
-    return quality_flags
+    return qc_flags
 
 
 def do_qc_grouped_observation(
-    data, table, quality_flag, params, ext_path, data_add, data_buoy, i=1, j=1, k=1
+    data,
+    table,
+    quality_flag,
+    params,
+    ext_path,
+    data_add,
+    data_buoy,
+    grid_index=None,
+    preproc_dict=None,
+    i=1,
+    j=1,
+    k=1,
 ):
     """Grouped QC."""
     logging.info(f"{i}.{j}.{k}. Do grouped {table} checks")
@@ -532,49 +899,27 @@ def do_qc_grouped_observation(
     qc_dict = copy.deepcopy(params.qc_settings.get("grouped_reports"))
 
     # Do observation buddy check
-    preproc_dict = copy.deepcopy(qc_dict.get("preprocessing", {}))
     qc_dict_obs = copy.deepcopy(qc_dict.get("observations"))
 
-    qc_dict_ind = copy.deepcopy(params.qc_settings.get("individual_reports"))
-    preproc_dict_ind = qc_dict_ind.get("preprocessing", {})
-
-    data = data.copy()
-
-    # Add buoy data
-    data = pd.concat([data, data_buoy])
-    buoy_indexes = data_buoy.index
+    # Get table-specific arguments
+    qc_dict_obs_sp = copy.deepcopy(qc_dict.get(table, {}))
 
-    # Add additional data
-    data = pd.concat([data, data_add])
-    data = data.drop_duplicates()
-    add_indexes = data_add.index
+    # Deselect buoy and additional data out of buddy search range
+    if grid_index is not None:
+        limits = get_search_limits(qc_dict_obs, qc_dict_obs_sp, table)
+        if limits is not None:
+            data_buoy = grid_index.select_neighbours(data_buoy, data.index, limits)
+            data_add = grid_index.select_neighbours(data_add, data.index, limits)
 
-    ignore_indexes = buoy_indexes.append(add_indexes)
+    # Add buoy and additional data, reports of the current month are kept
+    data = concat_dataframes(data, data_buoy, data_add)
 
     # Pre-processing
-    preproc_dict_obs = copy.deepcopy(preproc_dict.get(table, {}))
-    preproc_dict_ind_obs = copy.deepcopy(preproc_dict_ind.get(table, {}))
-
-    for var_name, val in preproc_dict_obs.items():
-        if val == "__individual_reports__":
-            preproc_dict_obs[var_name] = {
-                "inputs": copy.deepcopy(
-                    preproc_dict_ind_obs.get(var_name, {}).get("inputs")
-                )
-            }
-
-    update_filenames(preproc_dict_obs, ext_path)
-    open_netcdffiles(preproc_dict_obs)
-
-    for var_name, val in preproc_dict_obs.items():
-        if isinstance(val, dict) and "inputs" in val:
-            preproc_dict_obs[var_name] = val["inputs"]
+    if preproc_dict is None:
+        preproc_dict = get_grouped_preproc_dict(params, ext_path, table)
 
     l = 1  # noqa: E741
 
-    # Get table-specific arguments
-    qc_dict_obs_sp = copy.deepcopy(qc_dict.get(table, {}))
-
     for qc_name in qc_dict_obs.keys():
         if table not in qc_dict_obs[qc_name]["tables"]:
             continue
@@ -582,7 +927,7 @@ def do_qc_grouped_observation(
         logging.info(f"{i}.{j}.{k}.{l}. Do {qc_name} check")
 
         # Deselect already failed quality flags
-        drop_invalid_indexes(data, quality_flag, 1)
+        data = drop_failed_reports(data, quality_flag, 1)
 
         # Get parameters
         func, inputs, kwargs = get_qc_function_and_inputs(
@@ -593,39 +938,144 @@ def do_qc_grouped_observation(
 
         for var_name, value in kwargs.items():
             if isinstance(value, str) and value == "__preprocessed__":
-                kwargs[var_name] = preproc_dict_obs[var_name]
+                kwargs[var_name] = preproc_dict[var_name]
 
-        ignore_idxs = data.index.get_indexer(ignore_indexes)
-        ignore_idxs = ignore_idxs[ignore_idxs != -1]
-        kwargs["ignore_indexes"] = ignore_idxs
+        # Buoy and additional data are buddies only, they have no flags
+        positions = get_positions(data)
+        kwargs["ignore_indexes"] = np.flatnonzero(positions < 0)
         for arg_name, arg_value in qc_dict_obs_sp.get(qc_name, {}).items():
             kwargs[arg_name] = arg_value
 
-        qc_flag = func(**inputs, **kwargs)
-        idx_passed = qc_flag[qc_flag == 0].index
-        idx_failed = qc_flag[qc_flag == 1].index
-        quality_flag.loc[idx_passed] = 0
-        quality_flag.loc[idx_failed] = 1
+        qc_flag = np.asarray(func(**inputs, **kwargs))
+        set_flags(quality_flag, positions[qc_flag == 0], 0)
+        set_flags(quality_flag, positions[qc_flag == 1], 1)
 
-        drop_invalid_indexes(data, quality_flag, 1)
+        data = drop_failed_reports(data, quality_flag, 1)
 
         l += 1  # noqa: E741
 
     return quality_flag
 
 
+def do_qc_individual_table(
+    data,
+    table,
+    quality_flag,
+    report_quality,
+    blacklisted,
+    params,
+    ext_path,
+    preproc_dict=None,
+    i=1,
+    j=1,
+    k=1,
+):
+    """Individual QC of one observations table.
+
+    report_quality and blacklisted are the header flags of the reports
+    of data, in the order of data.
+    """
+    # Flag observations on blacklist
+    set_flags(quality_flag, get_positions(data)[blacklisted], 6)
+
+    # Remove already failed quality_flags, observations on blacklist and
+    # already failed report_qualities
+    flags = get_flags(quality_flag, get_positions(data))
+    data = data[(flags != 1) & (flags != 6) & (report_quality != 1)]
+
+    # Do individual QC
+    data, quality_flag = do_qc_individual_observation(
+        data,
+        table,
+        quality_flag,
+        params,
+        ext_path,
+        preproc_dict=preproc_dict,
+        i=i,
+        j=j,
+        k=k,
+    )
+
+    # Remove already failed quality_flags
+    data = drop_failed_reports(data, quality_flag, 1)
+    return data, quality_flag
+
+
+def do_qc_sequential_table(
+    data,
+    table,
+    quality_flag,
+    idx_gnrc,
+    data_group,
+    params,
+    data_add,
+    i=1,
+    j=1,
+    k=1,
+):
+    """Sequential QC of one observations table."""
+    quality_flag, data_add = do_qc_sequential_observation(
+        data,
+        table,
+        quality_flag,
+        idx_gnrc,
+        data_group,
+        params,
+        data_add,
+        i=i,
+        j=j,
+        k=k,
+    )
+
+    # Remove already failed quality_flags
+    data = drop_failed_reports(data, quality_flag, 1)
+    return data, quality_flag, data_add
+
+
+def do_qc_grouped_table(
+    data,
+    table,
+    quality_flag,
+    params,
+    ext_path,
+    data_add,
+    data_buoy,
+    grid_index=None,
+    preproc_dict=None,
+    i=1,
+    j=1,
+    k=1,
+):
+    """Grouped QC of one observations table."""
+    quality_flag = do_qc_grouped_observation(
+        data,
+        table,
+        quality_flag,
+        params,
+        ext_path,
+        data_add,
+        data_buoy,
+        grid_index=grid_index,
+        preproc_dict=preproc_dict,
+        i=i,
+        j=j,
+        k=k,
+    )
+
+    # Remove already failed quality_flags
+    data = drop_failed_reports(data, quality_flag, 1)
+    return data, quality_flag
+
+
 def do_qc(
     data_dict_qc,
-    report_quality,
-    location_quality,
-    report_time_quality,
-    quality_flags,
-    history,
+    qc_flags,
     params,
     ext_path,
     data_dict_add,
     data_dict_buoy,
     perform_qc,
+    grid_index=None,
 ):
     # Update history
     try:
@@ -636,32 +1086,27 @@ def do_qc(
         history_tstmp = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
 
     history_add = f"{history_tstmp}. {params.history_explain}"
+
+    report_quality = qc_flags.report_quality
     if perform_qc is False:
-        compare_quality_checks(report_quality, location_quality, report_time_quality)
+        qc_flags.set_report_quality()
         report_quality[report_quality == 2] = 0
-        qc_indexes = report_quality[report_quality.isin([0, 1])].index
-        history.loc[qc_indexes] = history.loc[qc_indexes].apply(
-            lambda x: update_history(x, history_add)
-        )
-        return (
-            report_quality,
-            location_quality,
-            report_time_quality,
-            quality_flags,
-            history,
-        )
+        qc_flags.add_history(report_quality.isin([0, 1]).to_numpy(), history_add)
+        return qc_flags
+
+    # Flags are read and set by the positions of the reports in the QC data
+    qc_flags.add_positions(data_dict_qc)
 
-    # Define indexes for both blacklist and generic IDs
-    idx_blck = report_quality[report_quality == 6].index
-    idx_gnrc_dat = report_quality[report_quality == 88].index
+    # Define masks for blacklist, generic IDs and already failed reports
+    blacklisted = report_quality.to_numpy() == 6
+    generic = report_quality.to_numpy() == 88
+    failed = report_quality.to_numpy() == 1
+
+    # Generic IDs of context data are looked up by report_id
+    idx_gnrc = report_quality.index[generic]
     if not data_dict_add["header"].empty:
         report_quality_add = data_dict_add["header"]["report_quality"]
-        idx_gnrc_add = report_quality_add[report_quality_add == 88].index
-        idx_gnrc = idx_gnrc_dat.append(idx_gnrc_add)
-    else:
-        idx_gnrc = idx_gnrc_dat.copy()
-
-    idx_fld = report_quality[report_quality == 1].index
+        idx_gnrc = idx_gnrc.append(report_quality_add.index[report_quality_add == 88])
 
     # DO QC
     i = 1
@@ -670,26 +1115,19 @@ def do_qc(
     # Header
     logging.info(f"{i}. Do header checks")
 
-    # Remove already failed report_qualities
-    data_dict_qc["header"].drop(index=idx_fld, inplace=True)
-
-    # Remove reports on blacklist and update history
-    data_dict_qc["header"].drop(index=idx_blck, inplace=True)
-    idx_not_blck = data_dict_qc["header"].index
-    history.loc[idx_not_blck] = history.loc[idx_not_blck].apply(
-        lambda x: update_history(x, history_add)
-    )
+    # Remove already failed report_qualities and reports on blacklist
+    # and update history
+    data_dict_qc["header"] = data_dict_qc["header"][~failed & ~blacklisted]
+    qc_flags.add_history(~failed & ~blacklisted, history_add)
 
     # Set report_qualities for generic IDs to passed
-    report_quality.loc[idx_gnrc_dat] = 0
+    set_flags(report_quality, np.flatnonzero(generic), 0)
 
     # Do individual header QC
     j = 1
-    report_quality, location_quality, report_time_quality = do_qc_individual_header(
+    do_qc_individual_header(
         data_dict_qc["header"],
-        report_quality,
-        location_quality,
-        report_time_quality,
+        qc_flags,
         params,
         ext_path,
         i=i,
@@ -697,52 +1135,80 @@ def do_qc(
     )
 
     # Remove already failed report_qualities
-    drop_invalid_indexes(data_dict_qc["header"], report_quality, 1)
+    data_dict_qc["header"] = drop_failed_reports(
+        data_dict_qc["header"], report_quality, 1
+    )
 
     # Do sequential header QC
     j = 2
-    report_quality, location_quality = do_qc_sequential_header(
+    data_dict_add["header"] = do_qc_sequential_header(
         data_dict_qc["header"],
-        report_quality,
-        location_quality,
+        qc_flags,
         idx_gnrc,
         params,
-        data_dict_add.get("header", pd.DataFrame()),
+        data_dict_add["header"],
         i=i,
         j=j,
     )
 
     # Remove already failed report_qualities
-    drop_invalid_indexes(data_dict_qc["header"], report_quality, 1)
+    data_dict_qc["header"] = drop_failed_reports(
+        data_dict_qc["header"], report_quality, 1
+    )
+
+    # Header flags of the observations reports, looked up once per table
+    header_positions = {
+        table: report_quality.index.get_indexer(data_dict_qc[table].index)
+        for table in obs_tables
+    }
 
     # Observations
-    i += 1
-    logging.info(f"{i}. Do observation checks")
+    with get_table_pool(params.qc_workers, params.qc_executor, len(obs_tables)) as pool:
+        i += 1
+        logging.info(f"{i}. Do observation checks")
+
+        # Do individual observations checks
+        j = 1
+        k = 1
+        logging.info(f"{i}.{j}. Do individual observations checks")
+
+        # Open climatologies before the table checks run concurrently
+        # since netCDF4/HDF5 is not thread-safe
+        preproc_dicts = {
+            table: get_individual_preproc_dict(params, ext_path, table)
+            for table in obs_tables
+        }
+        results = map_tables(
+            do_qc_individual_table,
+            [
+                {
+                    "data": data_dict_qc[table],
+                    "table": table,
+                    "quality_flag": qc_flags.quality_flags[table],
+                    "report_quality": get_flags(
+                        report_quality, header_positions[table]
+                    ),
+                    "blacklisted": (header_positions[table] >= 0)
+                    & blacklisted[header_positions[table]],
+                    "params": params,
+                    "ext_path": ext_path,
+                    "preproc_dict": preproc_dicts[table],
+                    "i": i,
+                    "j": j,
+                    "k": k,
+                }
+                for k, table in enumerate(obs_tables, start=1)
+            ],
+            pool=pool,
+        )
+        for table, (data, quality_flag) in zip(obs_tables, results):
+            data_dict_qc[table] = data
+            qc_flags.quality_flags[table] = quality_flag
+        k = len(obs_tables) + 1
 
-    # Do individual observations checks
-    j = 1
-    k = 1
-    logging.info(f"{i}.{j}. Do individual observations checks")
-
-    for table in obs_tables:
-        # Remove already failed quality_flags
-        idx_fld_obs = quality_flags[table][quality_flags[table] == 1].index
-        data_dict_qc[table].drop(index=idx_fld_obs, inplace=True)
-
-        # Remove observations on blacklist
-        idx_blck_obs = idx_blck.intersection(quality_flags[table].index)
-        quality_flags[table].loc[idx_blck_obs] = 6
-        idx_blck_obs = quality_flags[table][quality_flags[table] == 6].index
-        data_dict_qc[table].drop(index=idx_blck_obs, inplace=True)
-
-        # Remove already failed report_qualities
-        drop_invalid_indexes(data_dict_qc[table], report_quality, 1)
-
-        # Do individual QC
-        quality_flags[table] = do_qc_individual_observation(
-            data_dict_qc[table],
-            table,
-            quality_flags[table],
+        do_qc_individual_combined(
+            data_dict_qc,
+            qc_flags,
             params,
             ext_path,
             i=i,
@@ -750,85 +1216,85 @@ def do_qc(
             k=k,
         )
 
-        # Remove already failed quality_flags
-        drop_invalid_indexes(data_dict_qc[table], quality_flags[table], 1)
-
-        k += 1
+        # Do sequential observations checks
+        j += 1
+        k = 1
+        logging.info(f"{i}.{j}. Do sequential observations checks")
+        header_indexes = data_dict_add["header"].index
 
-    quality_flags = do_qc_individual_combined(
-        data_dict_qc,
-        quality_flags,
-        params,
-        ext_path,
-        i=i,
-        j=j,
-        k=k,
-    )
-
-    # Do sequential observations checks
-    j += 1
-    k = 1
-    logging.info(f"{i}.{j}. Do sequential observations checks")
-    header_indexes = data_dict_add["header"].index
-
-    for table in obs_tables:
-
-        table_indexes = data_dict_add[table].index
-        valid_indexes = table_indexes.intersection(header_indexes)
-        data_dict_add[table] = data_dict_add[table].loc[valid_indexes]
+        for table in obs_tables:
+            data_dict_add[table] = data_dict_add[table][
+                data_dict_add[table].index.isin(header_indexes)
+            ]
+
+        results = map_tables(
+            do_qc_sequential_table,
+            [
+                {
+                    "data": data_dict_qc[table],
+                    "table": table,
+                    "quality_flag": qc_flags.quality_flags[table],
+                    "idx_gnrc": idx_gnrc,
+                    "data_group": data_dict_qc["header"],
+                    "params": params,
+                    "data_add": data_dict_add[table],
+                    "i": i,
+                    "j": j,
+                    "k": k,
+                }
+                for k, table in enumerate(obs_tables, start=1)
+            ],
+            pool=pool,
+        )
+        for table, (data, quality_flag, data_add) in zip(obs_tables, results):
+            data_dict_qc[table] = data
+            qc_flags.quality_flags[table] = quality_flag
+            data_dict_add[table] = data_add
+        k = len(obs_tables) + 1
 
-        quality_flags[table] = do_qc_sequential_observation(
-            data_dict_qc[table],
-            table,
-            quality_flags[table],
+        do_qc_sequential_combined(
+            data_dict_qc,
+            qc_flags,
             idx_gnrc,
-            data_dict_qc["header"],
             params,
-            data_dict_add[table],
+            data_dict_add,
             i=i,
             j=j,
             k=k,
         )
 
-        # Remove already failed quality_flags
-        drop_invalid_indexes(data_dict_qc[table], quality_flags[table], 1)
-
-        k += 1
-
-    quality_flags = do_qc_sequential_combined(
-        data_dict_qc,
-        quality_flags,
-        idx_gnrc,
-        params,
-        data_dict_add,
-        i=i,
-        j=j,
-        k=k,
-    )
-
-    # Do grouped observations checks
-    j += 1
-    k = 1
-    logging.info(f"{i}.{j}. Do grouped observations checks")
-
-    for table in obs_tables:
+        # Do grouped observations checks
+        j += 1
+        k = 1
+        logging.info(f"{i}.{j}. Do grouped observations checks")
 
-        quality_flags[table] = do_qc_grouped_observation(
-            data_dict_qc[table],
-            table,
-            quality_flags[table],
-            params,
-            ext_path,
-            data_dict_add[table],
-            data_dict_buoy[table],
-            i=i,
-            j=j,
-            k=k,
+        preproc_dicts = {
+            table: get_grouped_preproc_dict(params, ext_path, table)
+            for table in obs_tables
+        }
+        results = map_tables(
+            do_qc_grouped_table,
+            [
+                {
+                    "data": data_dict_qc[table],
+                    "table": table,
+                    "quality_flag": qc_flags.quality_flags[table],
+                    "params": params,
+                    "ext_path": ext_path,
+                    "data_add": data_dict_add[table],
+                    "data_buoy": data_dict_buoy[table],
+                    "grid_index": grid_index,
+                    "preproc_dict": preproc_dicts[table],
+                    "i": i,
+                    "j": j,
+                    "k": k,
+                }
+                for k, table in enumerate(obs_tables, start=1)
+            ],
+            pool=pool,
         )
+        for table, (data, quality_flag) in zip(obs_tables, results):
+            data_dict_qc[table] = data
+            qc_flags.quality_flags[table] = quality_flag
 
-        # Remove already failed quality_flags
-        drop_invalid_indexes(data_dict_qc[table], quality_flags[table], 1)
-
-        k += 1
-
-    return report_quality, location_quality, report_time_quality, quality_flags, history
+    return qc_flags
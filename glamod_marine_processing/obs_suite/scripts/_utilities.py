@@ -3,30 +3,53 @@
 from __future__ import annotations
 
 import datetime
+import fnmatch
 import glob
 import itertools
-import json
 import logging
 import os
 import sys
 from pathlib import Path
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
 from cdm_reader_mapper import DataBundle, read_tables
 from cdm_reader_mapper.cdm_mapper.properties import cdm_tables
+from marine_qc.auxiliary import isvalid
 
-from glamod_marine_processing.utilities import save_simplejson
+from glamod_marine_processing.merge.merge import concat_parquet_files, conform_table
+from glamod_marine_processing.utilities import (
+    glob_manifest,
+    load_manifest,
+    load_task_config,
+    save_simplejson,
+)
 
 delimiter = "|"
 FFS = "-"
 
-allowed_extensions = {".pq", ".csv", ".psv"}
+allowed_extensions = {".pq", ".csv", ".psv", ".feather"}
+
+# File formats of CDM tables between levels (table_format) by extension.
+# Feather files are uncompressed Arrow IPC files read memory-mapped.
+table_formats = {"parquet": "pq", "feather": "feather"}
+table_format_levels = ["level1a", "level1b", "level1c", "level1d"]
+
+# Datetime leaks in parquet keep their historical psv extension.
+leak_extensions = {"parquet": "psv", "feather": "feather"}
+
+# Main CDM tables passed in memory between levels run in one process
+# (task_runner.py, fused levels), by output file name.
+memory_tables = {}
+memory_options = {"keep": False, "write": True}
 
 add_data_paths = {
     "level1a": ["level_excluded_path", "level_invalid_path"],
     "level1b": [],
     "level1c": ["level_invalid_path"],
-    "level1d": ["level_log_path"],
+    "level1d": ["level_log_path", "level_context_path"],
     "level1e": ["level_log_path"],
     "level2": ["level_excluded_path", "level_reports_path"],
     "level3": [],
@@ -39,6 +62,27 @@ chunksizes = {
     "ICOADS_R3.0.0T": 200000,
 }
 
+qc_context_columns = {
+    "header": [
+        "report_id",
+        "primary_station_id",
+        "latitude",
+        "longitude",
+        "report_timestamp",
+        "report_quality",
+        "station_speed",
+        "station_course",
+    ],
+    "observations": [
+        "report_id",
+        "latitude",
+        "longitude",
+        "date_time",
+        "observation_value",
+        "quality_flag",
+    ],
+}
+
 level3_source_ids = {
     "ICOADS-3-0-0T": 1,
     "ICOADS-3-0-2T": 2,
@@ -69,6 +113,54 @@ level3_columns = [
     "value_significance",
 ]
 
+level3_fields = pa.schema(
+    [
+        ("station_name", pa.string()),
+        ("primary_station_id", pa.string()),
+        ("report_id", pa.string()),
+        ("observation_id", pa.string()),
+        ("longitude", pa.float64()),
+        ("latitude", pa.float64()),
+        ("height_of_station_above_sea_level", pa.float64()),
+        ("observation_height_above_station_surface", pa.float64()),
+        ("z_coordinate", pa.float64()),
+        ("report_timestamp", pa.timestamp("ns", tz="UTC")),
+        ("report_meaning_of_time_stamp", pa.int64()),
+        ("report_duration", pa.int64()),
+        ("observed_variable", pa.int64()),
+        ("units", pa.int64()),
+        ("observation_value", pa.float64()),
+        ("quality_flag", pa.int64()),
+        ("source_id", pa.int64()),
+        ("data_policy_licence", pa.int64()),
+        ("platform_type", pa.int64()),
+        ("report_type", pa.int64()),
+        ("value_significance", pa.int64()),
+    ]
+)
+
+
+def add_pandas_metadata(schema):
+    """Add pandas metadata to arrow schema.
+
+    Integer and float columns are read back as nullable pandas dtypes.
+    """
+    dtypes = {}
+    for field in schema:
+        if pa.types.is_integer(field.type):
+            dtypes[field.name] = "Int64"
+        elif pa.types.is_floating(field.type):
+            dtypes[field.name] = "Float64"
+        elif pa.types.is_timestamp(field.type):
+            dtypes[field.name] = pd.DatetimeTZDtype("ns", field.type.tz)
+        else:
+            dtypes[field.name] = "object"
+    df = pd.DataFrame({k: pd.Series(dtype=v) for k, v in dtypes.items()})
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False).schema
+
+
+level3_schema = add_pandas_metadata(level3_fields)
+
 level3_mappings = {
     "header": {
         "station_name": "station_name",
@@ -139,14 +231,16 @@ class script_setup:
             sys.exit(1)
 
         configfile = inargs[1]
+        pattern = inargs[2] if len(inargs) == 3 else None
+        self.configfile = configfile
+        self.pattern = pattern
 
         try:
-            with open(configfile) as fileObj:
-                config = json.load(fileObj)
+            config = load_task_config(configfile, pattern)
         except Exception:
             logging.error(f"Opening configuration file: {configfile}", exc_info=True)
             sys.exit(1)
-        if len(sys.argv) >= 8:
+        if len(inargs) >= 8:
             logging.warning(
                 "Removed option to provide sid_dck, year and month as arguments. Use config file instead"
             )
@@ -184,6 +278,22 @@ class script_setup:
         self.cdm_tables = config["cdm_tables"] or cdm_tables
 
         self.filename = config.get("filename")
+        self.table_format = config.get("table_format") or "parquet"
+        if self.table_format not in table_formats.keys():
+            logging.error(
+                f"Unknown table_format: {self.table_format}. "
+                f"Use one of {list(table_formats.keys())}."
+            )
+            sys.exit(1)
+        if (
+            self.table_format != "parquet"
+            and config["level"] not in table_format_levels
+        ):
+            logging.warning(
+                f"Option table_format is only used by {table_format_levels}. "
+                "Write parquet files."
+            )
+            self.table_format = "parquet"
         self.level2_list = config.get("cmd_add_file")
         self.prev_fileID = config.get("prev_fileID")
         self.release_id = config["abbreviations_destination"].get("release_tag")
@@ -204,9 +314,14 @@ class script_setup:
         self.level_path = os.path.join(level_path, sid_dck)
         self.level_ql_path = os.path.join(level_path, "quicklooks", sid_dck)
         self.level_log_path = os.path.join(level_path, "log", sid_dck)
+        self.level_dataset_path = os.path.join(level_path, "dataset")
         self.level_invalid_path = os.path.join(level_path, "invalid", sid_dck)
         self.level_excluded_path = os.path.join(level_path, "excluded", sid_dck)
         self.level_reports_path = os.path.join(level_path, "reports", sid_dck)
+        self.level_context_path = os.path.join(level_path, "context", sid_dck)
+        self.prev_level_context_path = os.path.join(
+            config["paths"]["source_directory"], "context", sid_dck
+        )
         data_paths = [
             self.prev_level_path,
             self.level_path,
@@ -215,7 +330,7 @@ class script_setup:
         for data_path in add_data_paths[config["level"]]:
             data_paths.append(getattr(self, data_path))
         paths_exist(data_paths)
-        if len(glob.glob(self.filename)) == 0:
+        if len(glob_cdm_tables(self.filename)) == 0:
             logging.error(f"Previous level header files not found: {self.filename}")
             sys.exit(1)
 
@@ -269,6 +384,169 @@ def save_quicklook(params, ql_dict, date_handler):
     )
 
 
+def read_arrow_file(filename, columns=None):
+    """Read parquet or memory-mapped feather file as arrow table."""
+    if filename.endswith(".feather"):
+        return feather.read_table(filename, columns=columns, memory_map=True)
+    return pq.read_table(filename, columns=columns)
+
+
+def write_arrow_file(table, filename):
+    """Write arrow table as parquet or uncompressed feather file."""
+    if filename.endswith(".feather"):
+        feather.write_feather(table, filename, compression="uncompressed")
+    else:
+        pq.write_table(table, filename, compression="snappy")
+
+
+def concat_table_files(files, out_file):
+    """Concatenate parquet or feather files with compatible schemas into one file.
+
+    Parquet files are streamed row group by row group, feather files record
+    batch by record batch.
+    """
+    if not out_file.endswith(".feather"):
+        concat_parquet_files(files, out_file)
+        return
+    schemas = []
+    for f in files:
+        with pa.memory_map(f) as source:
+            schemas.append(pa.ipc.open_file(source).schema)
+    schema = pa.unify_schemas(schemas, promote_options="permissive")
+    with pa.ipc.new_file(out_file, schema) as writer:
+        for f in files:
+            with pa.memory_map(f) as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    batch = pa.Table.from_batches([reader.get_batch(i)])
+                    writer.write_table(conform_table(batch, schema))
+
+
+def remove_invalid_positions(df):
+    """Remove rows where latitude and/or longitude is None."""
+    df.dropna(subset=["latitude", "longitude"], inplace=True)
+
+
+def get_valid_indexes(df, table):
+    """Get valid indexes."""
+    if df.empty:
+        return pd.Index([])
+    valid_indexes = isvalid(df["latitude"]) & isvalid(df["longitude"])
+    if table == "header":
+        valid_indexes = (
+            valid_indexes
+            & isvalid(df["report_timestamp"])
+            & (df["report_quality"] != 6)
+            & (df["report_quality"] != 1)
+        )
+    else:
+        valid_indexes = (
+            valid_indexes
+            & isvalid(df["date_time"])
+            & (df["quality_flag"] != 6)
+            & (df["quality_flag"] != 1)
+            & isvalid(df["observation_value"])
+        )
+    return valid_indexes
+
+
+def create_consistent_datadict(
+    data_dict,
+    remove_invalids=False,
+    drop_positions=True,
+):
+    """Remove report_ids without any observations."""
+    report_ids = pd.Series()
+    for table_in in data_dict.keys():
+        if drop_positions is True:
+            remove_invalid_positions(data_dict[table_in])
+        if remove_invalids is True:
+            valid_indexes = get_valid_indexes(data_dict[table_in], table_in)
+            data_dict[table_in] = data_dict[table_in].loc[valid_indexes]
+        report_ids = pd.concat(
+            [report_ids, data_dict[table_in]["report_id"]], ignore_index=True
+        )
+
+    report_ids = report_ids[report_ids.duplicated()]
+
+    ql_dict = {}
+    for table, df in data_dict.items():
+        df = df.set_index("report_id", drop=False)
+        p_length = len(df)
+        valid_indexes = df.index.intersection(report_ids)
+        df = df.loc[valid_indexes]
+
+        data_dict[table] = df
+
+        c_length = len(df)
+        r_length = p_length - c_length
+        ql_dict[table] = {
+            "total": c_length,
+            "deleted": r_length,
+        }
+    return data_dict, ql_dict
+
+
+def get_qc_context_columns(table):
+    """Get columns of QC context table."""
+    if table == "header":
+        return qc_context_columns["header"]
+    return qc_context_columns["observations"]
+
+
+def read_manifest_tables(params, tables):
+    """Read CDM tables resolved through the selection manifest of the previous level."""
+    tables = [tables] if isinstance(tables, str) else tables
+    ifiles = {}
+    for table in tables:
+        pattern = f"{table}-*{params.prev_fileID}"
+        ifiles_table = []
+        for ext in table_formats.values():
+            ifiles_table += glob_manifest(params.prev_level_path, f"{pattern}.{ext}")
+        if len(ifiles_table) != 1:
+            logging.warning(f"CDM file pattern not found in manifest: {pattern}.")
+            continue
+        ifiles[table] = ifiles_table[0]
+
+    if len(ifiles) == 0:
+        return DataBundle()
+    if len(ifiles) == 1:
+        table, ifile = next(iter(ifiles.items()))
+        return read_cdm_tables(params, table, ifile=ifile)
+
+    # All included files are in the source directory of the manifest
+    source = os.path.dirname(next(iter(ifiles.values())))
+    ext = os.path.splitext(next(iter(ifiles.values())))[1][1:]
+    data_format = {v: k for k, v in table_formats.items()}[ext]
+    try:
+        return read_tables(
+            source,
+            data_format=data_format,
+            suffix=params.prev_fileID,
+            cdm_subset=list(ifiles),
+            extension=ext,
+        )
+    except ValueError:
+        logging.warning(f"CDM files {list(ifiles)} are empty.")
+        return DataBundle()
+
+
+def glob_cdm_tables(pattern):
+    """Glob CDM table files on disk and in memory."""
+    return glob.glob(pattern) + fnmatch.filter(memory_tables.keys(), pattern)
+
+
+def read_arrow_table(data, table):
+    """Read CDM table from arrow table as read_tables reads it from disk."""
+    df = data.to_pandas()
+    df = df.set_index("report_id", drop=False)
+    if "null" in df.index:
+        df = df.drop(index="null")
+    df.columns = pd.MultiIndex.from_product([[table], df.columns])
+    df = df.reset_index(drop=True)
+    return DataBundle(data=df, columns=df.columns, mode="tables")
+
+
 def read_cdm_tables(params, table, ifile=None):
     """Read CDM tables."""
     kwargs = {
@@ -279,10 +557,26 @@ def read_cdm_tables(params, table, ifile=None):
         ifile_pattern = os.path.join(
             params.prev_level_path, f"{table}*{params.prev_fileID}*"
         )
+        names = fnmatch.filter(memory_tables.keys(), ifile_pattern)
+        if len(names) == 1:
+            logging.info(f"Reading CDM table {table} from memory: {names[0]}.")
+            return read_arrow_table(memory_tables[names[0]], table)
+
+        if load_manifest(params.prev_level_path) is not None:
+            return read_manifest_tables(params, table)
+
         if len(glob.glob(ifile_pattern)) == 0:
             logging.warning(f"CDM file pattern not found: {ifile_pattern}.")
             return DataBundle()
 
+        ifiles = glob.glob(
+            os.path.join(
+                params.prev_level_path, f"{table}-*{params.prev_fileID}.feather"
+            )
+        )
+        if len(ifiles) == 1:
+            return read_arrow_table(read_arrow_file(ifiles[0]), table)
+
         try:
             return read_tables(
                 params.prev_level_path, suffix=params.prev_fileID, **kwargs
@@ -295,6 +589,9 @@ def read_cdm_tables(params, table, ifile=None):
         logging.warning(f"CDM file not found: {ifile}.")
         return DataBundle()
 
+    if ifile.endswith(".feather"):
+        return read_arrow_table(read_arrow_file(ifile), table)
+
     db = read_tables(ifile, **kwargs)
     db.data.columns = pd.MultiIndex.from_tuples([table, col] for col in db.data.columns)
     return db
@@ -305,21 +602,32 @@ def write_cdm_tables(
     df,
     tables=[],
     outname=None,
-    mode="parquet",
+    mode=None,
     **kwargs,
 ):
-    """Write table to disk."""
+    """Write table to disk.
+
+    Main tables (no outname) are written in the table format of the level,
+    other tables in parquet by default. Main tables are kept in memory for
+    the next level if memory_options keep is set and only written with
+    memory_options write.
+    """
     if df.empty:
         return
     if isinstance(tables, str):
         tables = [tables]
+    main = outname is None
+    if mode is None:
+        mode = params.table_format if main else "parquet"
     for table in tables:
         if mode == "csv":
             ext = "psv"
-        elif mode == "parquet":
-            ext = "pq"
+        elif mode in table_formats.keys():
+            ext = table_formats[mode]
         else:
-            raise ValueError(f"Unknown mode: {mode}. Use 'csv' or 'parquet'.")
+            raise ValueError(
+                f"Unknown mode: {mode}. Use 'csv', 'parquet' or 'feather'."
+            )
         if outname is None:
             outname = os.path.join(
                 params.level_path, f"{FFS.join([table, params.fileID])}"
@@ -333,6 +641,12 @@ def write_cdm_tables(
         except KeyError:
             logging.info(f"Table {table} is already selected.")
 
+        if main and memory_options["keep"]:
+            memory_tables[outname] = pa.Table.from_pandas(df, preserve_index=False)
+            logging.info(f"Output table kept in memory: {outname}.")
+            if not memory_options["write"]:
+                continue
+
         if mode == "csv":
             df.to_csv(
                 outname,
@@ -351,4 +665,11 @@ def write_cdm_tables(
                 compression="snappy",
                 **kwargs,
             )
+        elif mode == "feather":
+            feather.write_feather(
+                pa.Table.from_pandas(df, preserve_index=False),
+                outname,
+                compression="uncompressed",
+                **kwargs,
+            )
         logging.info(f"Output file written: {outname}.")
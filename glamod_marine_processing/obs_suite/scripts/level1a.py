@@ -56,22 +56,51 @@ settings:
 
 from __future__ import annotations
 
+import copy
 import logging
+import math
 import os
+import shutil
+import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from importlib import reload
 
 import numpy as np
 import pandas as pd
-from _utilities import FFS, chunksizes, date_handler, save_quicklook, script_setup
+from _utilities import (
+    FFS,
+    chunksizes,
+    concat_table_files,
+    date_handler,
+    save_quicklook,
+    script_setup,
+    write_cdm_tables,
+)
 from cdm_reader_mapper import read_mdf
 from cdm_reader_mapper.cdm_mapper import properties
 from cdm_reader_mapper.common import inspect
 
 import glamod_marine_processing.obs_suite.modules.blacklisting as blacklist_funcs
 from glamod_marine_processing.obs_suite.modules.icoads_identify import id_is_generic
+from glamod_marine_processing.utilities import (
+    add_counts,
+    load_json,
+    load_task_config,
+    save_json,
+    split_lines,
+)
 
-reload(logging)  # This is to override potential previous config of logging
+process_options = [
+    "data_model",
+    "read_sections",
+    "filter_reports_by",
+    "blacklisting",
+    "generic_ids",
+    "shards",
+    "shard_size_mb",
+    "shard_workers",
+]
 
 blck_flag = 6
 gnrc_flag = 88
@@ -80,66 +109,124 @@ observations_quality_column = "quality_flag"
 
 
 # FUNCTIONS -------------------------------------------------------------------
-def write_out_junk(dataObj, filename):
+def write_out_junk(dataObj, filename, chunksize=None):
     """Write to disk."""
-    v = [dataObj] if not read_kwargs.get("chunksize") else dataObj
+    v = [dataObj] if not chunksize else dataObj
     c = 0
     for df in v:
         df.to_parquet(filename)
         c += 1
 
 
-# MAIN ------------------------------------------------------------------------
+def get_n_shards(filename, shards, shard_size_mb):
+    """Get number of shards to split level0 file into.
+
+    Only line based text files are split, netCDF files are processed
+    as a whole.
+    """
+    if os.path.splitext(filename)[1] == ".nc":
+        return 1
+    n_shards = int(shards or 1)
+    if shard_size_mb:
+        size_mb = os.path.getsize(filename) / 1024**2
+        n_shards = max(n_shards, math.ceil(size_mb / shard_size_mb))
+    return n_shards
+
+
+def get_n_cpus():
+    """Get number of CPUs available to this process."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def run_shard(shard_config_file):
+    """Run level1a on one shard and return its exit status."""
+    script = os.path.abspath(__file__)
+    return subprocess.run([sys.executable, script, shard_config_file]).returncode
+
+
+def process_shards(params, L0_filename, n_shards):
+    """Process level0 file in shards and merge shard outputs.
+
+    Each shard runs this script with its own configuration and output
+    directory in the log directory of the sid-dck, at most shard_workers
+    and no more than the available CPUs at a time. CDM tables, invalid
+    and excluded data files of the shards are concatenated and their
+    quicklook counts are added. As in an unsharded run, duplicate
+    report_ids are left to level1b. Returns the exit status.
+    """
+    sid_dck = params.sid_dck
+    shard_path = os.path.join(params.level_log_path, f"{params.fileID}-shards")
+    shutil.rmtree(shard_path, ignore_errors=True)
+    os.makedirs(shard_path)
+    shard_files = split_lines(L0_filename, n_shards, shard_path)
+    logging.info(f"Split {L0_filename} into {len(shard_files)} shards")
+
+    config = load_task_config(params.configfile, params.pattern)
+    output_dirs = {
+        sid_dck: params.level_path,
+        os.path.join("invalid", sid_dck): params.level_invalid_path,
+        os.path.join("excluded", sid_dck): params.level_excluded_path,
+    }
+    shard_dirs = []
+    shard_config_files = []
+    for i, shard_file in enumerate(shard_files):
+        shard_dir = os.path.join(shard_path, f"{i:03d}")
+        for output_dir in [*output_dirs.keys(), os.path.join("quicklooks", sid_dck)]:
+            os.makedirs(os.path.join(shard_dir, output_dir))
+        shard_config = copy.deepcopy(config)
+        shard_config["filename"] = shard_file
+        shard_config["paths"]["destination_directory"] = shard_dir
+        for opt in ["shards", "shard_size_mb"]:
+            shard_config[opt] = None
+            if isinstance(shard_config.get(sid_dck), dict):
+                shard_config[sid_dck].pop(opt, None)
+        shard_config_file = f"{shard_dir}.json"
+        save_json(shard_config, shard_config_file)
+        shard_dirs.append(shard_dir)
+        shard_config_files.append(shard_config_file)
+
+    n_workers = min(
+        int(params.shard_workers or len(shard_files)), len(shard_files), get_n_cpus()
+    )
+    logging.info(f"Process shards with {n_workers} workers")
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        status = list(executor.map(run_shard, shard_config_files))
+    failed = [i for i, returncode in enumerate(status) if returncode != 0]
+    if len(failed) > 0:
+        logging.error(f"Processing failed in shards: {failed}")
+        return 1
+
+    for output_dir, level_path in output_dirs.items():
+        files = {}
+        for shard_dir in shard_dirs:
+            for filename in sorted(os.listdir(os.path.join(shard_dir, output_dir))):
+                files.setdefault(filename, []).append(
+                    os.path.join(shard_dir, output_dir, filename)
+                )
+        for filename, shard_outputs in files.items():
+            out_file = os.path.join(level_path, filename)
+            logging.info(f"Merging {len(shard_outputs)} shards to {out_file}")
+            concat_table_files(shard_outputs, out_file)
+
+    io_dict = {}
+    for shard_dir in shard_dirs:
+        ql_file = os.path.join(
+            shard_dir, "quicklooks", sid_dck, f"{params.fileID}.json"
+        )
+        add_counts(io_dict, load_json(ql_file)[params.fileID_date])
+    logging.info("Saving json quicklook")
+    save_quicklook(params, io_dict, date_handler)
 
-# PROCESS INPUT AND MAKE SOME CHECKS ------------------------------------------
-logging.basicConfig(
-    format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
-    level=logging.INFO,
-    datefmt="%Y%m%d %H:%M:%S",
-    filename=None,
-)
+    shutil.rmtree(shard_path)
+    logging.info("End")
+    return 0
 
-process_options = [
-    "data_model",
-    "read_sections",
-    "filter_reports_by",
-    "blacklisting",
-    "generic_ids",
-]
-params = script_setup(process_options, sys.argv)
-
-L0_filename = os.path.join(params.prev_level_path, params.filename)
-if not os.path.isfile(L0_filename):
-    logging.error(f"Could not find data input file: {L0_filename}")
-    sys.exit(1)
-
-# DO THE DATA PROCESSING ------------------------------------------------------
-data_model = params.data_model
-dataset = params.dataset
-io_dict = {}
-
-# 1. Read input file to dataframe
-logging.info("Reading dataset data")
-chunksize = chunksizes[params.dataset]
-read_kwargs = {
-    "imodel": data_model,
-    "sections": params.read_sections,
-    "chunksize": chunksize,
-}
-
-data_in = read_mdf(L0_filename, **read_kwargs)
-io_dict["read"] = {"total": len(data_in)}
-# 2. PT fixing, filtering and invalid rejectionselect_true
-# 2.1. Fix platform type
-
-# dataset = ICOADS_R3.0.0T is not "registered" in metmetpy, but icoads_r3000
-# Modify metmetpy so that it maps ICOADS_R3.0.0T to its own alliaeses
-# we now do the dirty trick here: dataset_metmetpy = icoads_r3000
-logging.info("Applying platform type fixtures")
-data_in.correct_pt(inplace=True)
-
-# 2.2. Apply record selection (filter by) criteria: PT types.....
-if params.filter_reports_by:
+
+def select_reports(data_in, io_dict, params):
+    """Apply record selection (filter by) criteria, return selected and excluded data."""
     logging.info("Applying selection filters")
     io_dict["not_selected"] = {}
     data_excluded = {}
@@ -162,38 +249,45 @@ if params.filter_reports_by:
     io_dict["not_selected"]["total"] = sum(
         [v.get("total") for k, v in io_dict["not_selected"].items()]
     )
-io_dict["pre_selected"] = {"total": len(data_in)}
-
-# 2.3. Keep track of invalid data
-# First create a global mask and count failure occurrences
-logging.info("Removing invalid data")
-if chunksize:
-    zipped = zip(data_in.data.copy(), data_in.mask.copy())
-else:
-    zipped = zip([data_in.data], [data_in.mask])
-
-for data, mask in zipped:
-    mask["global_mask"] = mask.all(axis=1)
-
-    # 2.3.2. Invalid reports counts and values
-    # Initialize counters if first chunk
-    masked_columns = [x for x in mask if not all(mask[x].isna()) and x != "global_mask"]
-    if not io_dict.get("invalid"):
-        io_dict["invalid"] = {
-            ".".join(k): {"total": 0, "values": []} for k in masked_columns
-        }
+    return data_in, data_excluded
+
 
+def count_invalid_values(data_in, io_dict, chunksize):
+    """Count invalid values per column, return masked columns."""
+    if chunksize:
+        zipped = zip(data_in.data.copy(), data_in.mask.copy())
+    else:
+        zipped = zip([data_in.data], [data_in.mask])
+
+    masked_columns = []
+    for data, mask in zipped:
+        mask["global_mask"] = mask.all(axis=1)
+
+        # 2.3.2. Invalid reports counts and values
+        # Initialize counters if first chunk
+        masked_columns = [
+            x for x in mask if not all(mask[x].isna()) and x != "global_mask"
+        ]
+        if not io_dict.get("invalid"):
+            io_dict["invalid"] = {
+                ".".join(k): {"total": 0, "values": []} for k in masked_columns
+            }
+
+        for col in masked_columns:
+            k = ".".join(col)
+            io_dict["invalid"][k]["total"] += len(mask[col].loc[~mask[col]])
+            if col in data:  # cause some masks are not in data (datetime....)
+                io_dict["invalid"][k]["values"].extend(data[col].loc[~mask[col]].values)
+    return masked_columns
+
+
+def summarize_invalid_values(data_in, io_dict, masked_columns):
+    """Replace invalid values by value counts or histograms."""
     for col in masked_columns:
         k = ".".join(col)
-        io_dict["invalid"][k]["total"] += len(mask[col].loc[~mask[col]])
-        if col in data:  # cause some masks are not in data (datetime....)
-            io_dict["invalid"][k]["values"].extend(data[col].loc[~mask[col]].values)
-
-# Now see what fails
-for col in masked_columns:
-    k = ".".join(col)
-    if io_dict["invalid"][k]["total"] > 0:
-        if data_in.dtypes.get(col, {}) in properties.ObjectTypes:
+        if io_dict["invalid"][k]["total"] == 0:
+            io_dict["invalid"].pop(k, None)
+        elif data_in.dtypes.get(col, {}) in properties.ObjectTypes:
             ivalues = list(set(io_dict["invalid"][k]["values"]))
             # This is because sorting fails on strings if nan
             if np.nan in ivalues:
@@ -209,7 +303,7 @@ for col in masked_columns:
             io_dict["invalid"][k].update(
                 {i: io_dict["invalid"][k]["values"].count(i) for i in ivalues}
             )
-            sush = io_dict["invalid"][k].pop("values", None)
+            io_dict["invalid"][k].pop("values", None)
         elif data_in.dtypes.get(col, {}) in properties.NumericTypes:
             values = io_dict["invalid"][k]["values"]
             values = np.array(values)[~pd.isnull(values)]
@@ -227,32 +321,28 @@ for col in masked_columns:
                 io_dict["invalid"][k].update(
                     {"nan?": len(io_dict["invalid"][k]["values"])}
                 )
-            sush = io_dict["invalid"][k].pop("values", None)
-    else:
-        sush = io_dict["invalid"].pop(k, None)
-
-# 2.4. Discard invalid data.
-data_invalid = {}
-data_in, data_false = data_in.split_by_boolean_true()
-data_invalid["data"] = data_false.data
-data_invalid["valid_mask"] = data_false.mask
-io_dict["invalid"]["total"] = len(data_false)
-io_dict["processed"] = {"total": len(data_in)}
-
-process = True
-if io_dict["processed"]["total"] == 0:
-    process = False
-    logging.warning("No data to map to CDM after selection and cleaning")
-
-# 2.5 Flag data on blacklist
-blck_dict = {}
-if params.blacklisting:
+            io_dict["invalid"][k].pop("values", None)
+
+
+def get_function_kwargs(inputs):
+    """Get keyword arguments of flagging function from column configuration."""
+    kwargs = {}
+    for param, columns in inputs.items():
+        if isinstance(columns, list):
+            columns = tuple(columns)
+        kwargs[param] = columns
+    return kwargs
+
+
+def get_blacklist_masks(data_in, params, chunksize):
+    """Get masks of data on blacklist per CDM table."""
     logging.info("Flag data on blacklist")
     if not chunksize:
         data_in_data = [data_in.data]
     else:
         data_in_data = data_in.data.copy()
 
+    blck_dict = {}
     for data in data_in_data:
         cdm_tables = sorted(params.cdm_tables, key=lambda x: 0 if x == "header" else 1)
         for cdm_table in cdm_tables:
@@ -260,11 +350,7 @@ if params.blacklisting:
             if inputs is None:
                 continue
             func = getattr(blacklist_funcs, inputs["func"])
-            kwargs = {}
-            for param, columns in inputs["params"].items():
-                if isinstance(columns, list):
-                    columns = tuple(columns)
-                kwargs[param] = columns
+            kwargs = get_function_kwargs(inputs["params"])
             blck_mask = data.apply(
                 lambda row: func(**{k: row[v] for k, v in kwargs.items()}), axis=1
             ).reset_index(drop=True)
@@ -274,22 +360,20 @@ if params.blacklisting:
                 )
             else:
                 blck_dict[cdm_table] = blck_mask
+    return blck_dict
 
-# 2.6. Flag data with generic ID
-gnrc_dict = {}
-if params.generic_ids:
+
+def get_generic_masks(data_in, params, chunksize):
+    """Get masks of data with generic ID."""
     logging.info("Flag data with generic ID")
     if not chunksize:
         data_in_data = [data_in.data]
     else:
         data_in_data = data_in.data.copy()
 
+    gnrc_dict = {}
     for data in data_in_data:
-        kwargs = {}
-        for param, columns in params.generic_ids["params"].items():
-            if isinstance(columns, list):
-                columns = tuple(columns)
-            kwargs[param] = columns
+        kwargs = get_function_kwargs(params.generic_ids["params"])
         gnrc_mask = data.apply(
             lambda row: id_is_generic(**{k: row[v] for k, v in kwargs.items()}), axis=1
         ).reset_index(drop=True)
@@ -299,10 +383,11 @@ if params.generic_ids:
             )
         else:
             gnrc_dict["header"] = gnrc_mask
+    return gnrc_dict
 
 
-# 3. Map to common data model and output files
-if process:
+def map_to_cdm(data_in, gnrc_dict, blck_dict, io_dict, params):
+    """Map to common data model, flag data and write CDM tables."""
     logging.info("Mapping to CDM")
     tables = params.cdm_tables
     io_dict.update({table: {} for table in tables})
@@ -332,41 +417,136 @@ if process:
         )
         data_in.data.loc[cond, blck_column] = blck_flag
 
-    logging.info("Printing tables to parquet files")
-    data_in.write(
-        out_dir=params.level_path,
-        suffix=params.fileID,
-        extension="pq",
-    )
+    logging.info(f"Printing tables to {params.table_format} files")
+    if params.table_format == "parquet":
+        data_in.write(
+            out_dir=params.level_path,
+            suffix=params.fileID,
+            extension="pq",
+        )
+    else:
+        for table in tables:
+            if table in data_in.data:
+                table_df = data_in.data[table].dropna(how="all")
+                write_cdm_tables(params, table_df, tables=table)
 
     for table in tables:
         io_dict[table]["total"] = len(data_in[table].dropna(how="all"))
 
-logging.info("Saving json quicklook")
-save_quicklook(params, io_dict, date_handler)
-
 
-# Output excluded and invalid ---------------------------------------------
-if params.filter_reports_by:
-    for k, v in data_excluded["data"].items():
+def write_excluded_invalid(data_excluded, data_invalid, params, chunksize):
+    """Write excluded and invalid data."""
+    for k, v in data_excluded.get("data", {}).items():
         if inspect.get_length(data_excluded["data"][k]) > 0:
             excluded_filename = os.path.join(
                 params.level_excluded_path,
                 params.fileID + FFS + "_".join(k.split(".")) + ".pq",
             )
             logging.info(f"Writing {k} excluded data to file {excluded_filename}")
-            write_out_junk(v, excluded_filename)
+            write_out_junk(v, excluded_filename, chunksize)
 
-if inspect.get_length(data_invalid["data"]) > 0:
-    invalid_data_filename = os.path.join(
-        params.level_invalid_path, params.fileID + FFS + "data.pq"
-    )
-    invalid_mask_filename = os.path.join(
-        params.level_invalid_path, params.fileID + FFS + "mask.pq"
-    )
-    logging.info(f"Writing invalid data to file {invalid_data_filename}")
-    write_out_junk(data_invalid["data"], invalid_data_filename)
-    logging.info(f"Writing invalid data mask to file {invalid_mask_filename}")
-    write_out_junk(data_invalid["valid_mask"], invalid_mask_filename)
+    if inspect.get_length(data_invalid["data"]) > 0:
+        invalid_data_filename = os.path.join(
+            params.level_invalid_path, params.fileID + FFS + "data.pq"
+        )
+        invalid_mask_filename = os.path.join(
+            params.level_invalid_path, params.fileID + FFS + "mask.pq"
+        )
+        logging.info(f"Writing invalid data to file {invalid_data_filename}")
+        write_out_junk(data_invalid["data"], invalid_data_filename, chunksize)
+        logging.info(f"Writing invalid data mask to file {invalid_mask_filename}")
+        write_out_junk(data_invalid["valid_mask"], invalid_mask_filename, chunksize)
+
+
+def run(params):
+    """Map the level0 file of one sid-dck month to CDM tables, return exit status."""
+    L0_filename = os.path.join(params.prev_level_path, params.filename)
+    if not os.path.isfile(L0_filename):
+        logging.error(f"Could not find data input file: {L0_filename}")
+        return 1
+
+    n_shards = get_n_shards(L0_filename, params.shards, params.shard_size_mb)
+    if n_shards > 1:
+        return process_shards(params, L0_filename, n_shards)
+
+    # DO THE DATA PROCESSING --------------------------------------------------
+    io_dict = {}
+
+    # 1. Read input file to dataframe
+    logging.info("Reading dataset data")
+    chunksize = chunksizes[params.dataset]
+    read_kwargs = {
+        "imodel": params.data_model,
+        "sections": params.read_sections,
+        "chunksize": chunksize,
+    }
+
+    data_in = read_mdf(L0_filename, **read_kwargs)
+    io_dict["read"] = {"total": len(data_in)}
+    # 2. PT fixing, filtering and invalid rejectionselect_true
+    # 2.1. Fix platform type
+
+    # dataset = ICOADS_R3.0.0T is not "registered" in metmetpy, but icoads_r3000
+    # Modify metmetpy so that it maps ICOADS_R3.0.0T to its own alliaeses
+    # we now do the dirty trick here: dataset_metmetpy = icoads_r3000
+    logging.info("Applying platform type fixtures")
+    data_in.correct_pt(inplace=True)
+
+    # 2.2. Apply record selection (filter by) criteria: PT types.....
+    data_excluded = {}
+    if params.filter_reports_by:
+        data_in, data_excluded = select_reports(data_in, io_dict, params)
+    io_dict["pre_selected"] = {"total": len(data_in)}
+
+    # 2.3. Keep track of invalid data
+    # First create a global mask and count failure occurrences
+    logging.info("Removing invalid data")
+    masked_columns = count_invalid_values(data_in, io_dict, chunksize)
+
+    # Now see what fails
+    summarize_invalid_values(data_in, io_dict, masked_columns)
+
+    # 2.4. Discard invalid data.
+    data_invalid = {}
+    data_in, data_false = data_in.split_by_boolean_true()
+    data_invalid["data"] = data_false.data
+    data_invalid["valid_mask"] = data_false.mask
+    io_dict["invalid"]["total"] = len(data_false)
+    io_dict["processed"] = {"total": len(data_in)}
+
+    # 2.5 Flag data on blacklist
+    blck_dict = {}
+    if params.blacklisting:
+        blck_dict = get_blacklist_masks(data_in, params, chunksize)
+
+    # 2.6. Flag data with generic ID
+    gnrc_dict = {}
+    if params.generic_ids:
+        gnrc_dict = get_generic_masks(data_in, params, chunksize)
+
+    # 3. Map to common data model and output files
+    if io_dict["processed"]["total"] == 0:
+        logging.warning("No data to map to CDM after selection and cleaning")
+    else:
+        map_to_cdm(data_in, gnrc_dict, blck_dict, io_dict, params)
+
+    logging.info("Saving json quicklook")
+    save_quicklook(params, io_dict, date_handler)
 
-logging.info("End")
+    # Output excluded and invalid ---------------------------------------------
+    write_excluded_invalid(data_excluded, data_invalid, params, chunksize)
+
+    logging.info("End")
+    return 0
+
+
+# MAIN ------------------------------------------------------------------------
+if __name__ == "__main__":
+    reload(logging)  # This is to override potential previous config of logging
+    logging.basicConfig(
+        format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
+        level=logging.INFO,
+        datefmt="%Y%m%d %H:%M:%S",
+        filename=None,
+    )
+    sys.exit(run(script_setup(process_options, sys.argv)))
@@ -62,6 +62,7 @@ from _utilities import (
     FFS,
     date_handler,
     delimiter,
+    leak_extensions,
     paths_exist,
     read_cdm_tables,
     save_quicklook,
@@ -69,28 +70,6 @@ from _utilities import (
     write_cdm_tables,
 )
 
-reload(logging)  # This is to override potential previous config of logging
-
-
-def drop_qualities(df, drop_dict):
-    """Drop rows with bad quality flags."""
-    for column, values in drop_dict.items():
-        if not isinstance(values, list):
-            values = [values]
-        df = df[~df[column].isin(values)]
-
-    return df
-
-
-# MAIN ------------------------------------------------------------------------
-# Process input and set up some things ----------------------------------------
-logging.basicConfig(
-    format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
-    level=logging.INFO,
-    datefmt="%Y%m%d %H:%M:%S",
-    filename=None,
-)
-
 process_options = [
     "correction_version",
     "corrections",
@@ -99,70 +78,72 @@ process_options = [
     "drop_qualities",
     "delete_no_obs",
 ]
-params = script_setup(process_options, sys.argv)
 cor_ext = ".txt.gz"
+isChange = "1"
+dupNotEval = "4"
 
-if params.correction_version != "null":
-    L1b_main_corrections = os.path.join(
-        params.data_path, "datasets", "NOC_corrections", params.correction_version
-    )
-    logging.info(f"Setting corrections path to {L1b_main_corrections}")
-    paths_exist(L1b_main_corrections)
 
-ql_dict = {table: {} for table in params.cdm_tables}
+def drop_qualities(df, drop_dict):
+    """Drop rows with bad quality flags."""
+    for column, values in drop_dict.items():
+        if not isinstance(values, list):
+            values = [values]
+        df = df[~df[column].isin(values)]
 
-# Do the data processing ------------------------------------------------------
-isChange = "1"
-dupNotEval = "4"
+    return df
 
-# 1. Do it a table at a time....
-try:
-    history_tstmp = datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%d %H:%M:%S")
-except AttributeError:  # for python < 3.11
-    history_tstmp = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
 
-tables = params.cdm_tables
-obs_tables = [table for table in tables if table != "header"]
-if params.delete_no_obs is True:
+def get_report_ids(obs_tables, params):
+    """Get report_ids with any observations."""
     report_ids = pd.Series()
     for table in obs_tables:
         db_ = read_cdm_tables(params, table)
         if not db_.empty:
             db_.data = db_[table]
             report_ids = pd.concat([report_ids, db_["report_id"]], ignore_index=True)
-    report_ids = report_ids.drop_duplicates().reset_index(drop=True)
+    return report_ids.drop_duplicates().reset_index(drop=True)
 
-for table in tables:
-    datetime_col = "report_timestamp" if table == "header" else "date_time"
-    logging.info(params.prev_level_path)
-    logging.info(params.prev_fileID)
-    logging.info(table)
-    table_db = read_cdm_tables(params, table)
 
-    if table_db.empty:
-        logging.warning(f"Empty or non-existing table {table}")
-        ql_dict[table]["read"] = 0
-        continue
+def get_table_corrections(table, params):
+    """Get corrections of table from configuration."""
+    if params.corrections is None:
+        return {}
+    if "observations" in table and "observations" in params.corrections.keys():
+        return params.corrections.get("observations")
+    return params.corrections.get(table)
+
+
+def read_corrections(directories, columns, usecols, params):
+    """Read correction files of directories for the month."""
+    correction_df = pd.DataFrame()
+    for directory in directories:
+        cor_path = os.path.join(
+            params.corrections_path, directory, params.fileID_date + cor_ext
+        )
+        if not os.path.isfile(cor_path):
+            logging.warning(f"Correction file {cor_path} not found")
+            continue
 
-    table_db.data = table_db[table]
-    table_db.set_index("report_id", inplace=True, drop=False)
-    if table == "header" and params.delete_no_obs is True:
-        logging.info("Delete header information without any observations.")
-        table_db.data = table_db[table_db.index.isin(report_ids)]
+        cor_df = pd.read_csv(
+            cor_path,
+            delimiter=delimiter,
+            dtype="object",
+            header=None,
+            usecols=usecols,
+            names=columns,
+            quotechar=None,
+            quoting=3,
+        )
+        correction_df = pd.concat([correction_df, cor_df], ignore_index=True)
+    return correction_df
 
-    ql_dict[table]["read"] = len(table_db)
-    if params.corrections is None:
-        table_corrections = {}
-    else:
-        if "observations" in table and "observations" in params.corrections.keys():
-            table_corrections = params.corrections.get("observations")
-        else:
-            table_corrections = params.corrections.get(table)
 
+def apply_corrections(table_db, table, ql_dict, params, history_tstmp):
+    """Apply corrections of table."""
+    table_corrections = get_table_corrections(table, params)
     if len(table_corrections) == 0:
         logging.warning(f"No corrections defined for table {table}")
 
-    ql_dict[table]["date leak out"] = {}
     ql_dict[table]["corrections"] = {}
 
     for column, elements in table_corrections.items():
@@ -181,27 +162,7 @@ for table in tables:
         if isinstance(directories, str):
             directories = [directories]
 
-        correction_df = pd.DataFrame()
-        for directory in directories:
-            cor_path = os.path.join(
-                L1b_main_corrections, directory, params.fileID_date + cor_ext
-            )
-            if not os.path.isfile(cor_path):
-                logging.warning(f"Correction file {cor_path} not found")
-                continue
-
-            cor_df = pd.read_csv(
-                cor_path,
-                delimiter=delimiter,
-                dtype="object",
-                header=None,
-                usecols=usecols,
-                names=columns,
-                quotechar=None,
-                quoting=3,
-            )
-            correction_df = pd.concat([correction_df, cor_df], ignore_index=True)
-
+        correction_df = read_corrections(directories, columns, usecols, params)
         if correction_df.empty:
             logging.warning(f"No {column} corrections found.")
             continue
@@ -236,37 +197,68 @@ for table in tables:
                 + f"; {history_tstmp}. {hist_add}"
             )
 
-    if table_db.empty:
-        logging.warning("Empty table {table}")
-        continue
 
-    # Track duplicate status
-    if table == "header":
-        ql_dict["duplicates"] = {}
-        if params.correction_version == "null":
-            if params.drop_qualities:
-                table_db.data = drop_qualities(table_db, params.drop_qualities)
-            table_db.duplicate_check(**params.duplicates, inplace=True)
-            table_db.flag_duplicates(inplace=True)
-
-        contains_info = table_db["duplicate_status"] != dupNotEval
-        logging.info("Logging duplicate status info")
-        if len(np.where(contains_info)[0]) > 0:
-            counts = table_db["duplicate_status"].value_counts()
-            for k in counts.index:
-                ql_dict["duplicates"][k] = int(
-                    counts.loc[k]
-                )  # otherwise prints null to json!!!
-        else:
-            ql_dict["duplicates"][dupNotEval] = ql_dict[table]["read"]
-
-    # Now get ready to write out, extracting eventual leaks of data to a different monthly table
+def track_duplicates(table_db, ql_dict, params):
+    """Flag duplicates in header table and log duplicate status."""
+    ql_dict["duplicates"] = {}
+    if params.correction_version == "null":
+        if params.drop_qualities:
+            table_db.data = drop_qualities(table_db, params.drop_qualities)
+        table_db.duplicate_check(**params.duplicates, inplace=True)
+        table_db.flag_duplicates(inplace=True)
+
+    contains_info = table_db["duplicate_status"] != dupNotEval
+    logging.info("Logging duplicate status info")
+    if len(np.where(contains_info)[0]) > 0:
+        counts = table_db["duplicate_status"].value_counts()
+        for k in counts.index:
+            ql_dict["duplicates"][k] = int(
+                counts.loc[k]
+            )  # otherwise prints null to json!!!
+    else:
+        ql_dict["duplicates"][dupNotEval] = ql_dict["header"]["read"]
+
+
+def write_leaks(table_db, table, datetime_leaks, source_mon_period, ql_dict, params):
+    """Write data of other months to leak table files."""
+    len_db = len(table_db)
+    logging.info("Datetime leaks found:")
+    for leak in datetime_leaks:
+        logging.info(
+            "Writing {} data to {} table file".format(leak.strftime("%Y-%m"), table)
+        )
+        L1b_idl = FFS.join(
+            [
+                table,
+                leak.strftime("%Y-%m"),
+                params.release_id,
+                source_mon_period.strftime("%Y-%m"),
+            ]
+        )
+        leak_ext = leak_extensions[params.table_format]
+        filename = os.path.join(params.level_path, f"{L1b_idl}.{leak_ext}")
+        write_cdm_tables(
+            params,
+            table_db.loc[[leak]],
+            tables=table,
+            outname=filename,
+            mode=params.table_format,
+        )
+        table_db.drop(leak, inplace=True)
+        len_db_i = len_db
+        len_db = len(table_db)
+        ql_dict[table]["date leak out"][leak.strftime("%Y-%m")] = len_db_i - len_db
+    ql_dict[table]["date leak out"]["total"] = sum(
+        [v for k, v in ql_dict[table]["date leak out"].items()]
+    )
+
+
+def write_monthly_tables(table_db, table, ql_dict, params):
+    """Write table, extracting eventual leaks of data to a different monthly table."""
     # cdm_columns = cdm_tables.get(table).keys()
     # BECAUSE LIZ'S datetimes have UTC info:
     # ValueError: Tz-aware datetime.datetime cannot be converted to datetime64 unless utc=True
-    if table_db.empty:
-        continue
-
+    datetime_col = "report_timestamp" if table == "header" else "date_time"
     table_db.data["monthly_period"] = pd.to_datetime(
         table_db[datetime_col], errors="coerce", utc=True
     ).dt.to_period("M")
@@ -305,32 +297,89 @@ for table in tables:
 
     datetime_leaks = [m for m in monthly_periods if m != source_mon_period]
     if len(datetime_leaks) > 0:
-        logging.info("Datetime leaks found:")
-        for leak in datetime_leaks:
-            logging.info(
-                "Writing {} data to {} table file".format(leak.strftime("%Y-%m"), table)
-            )
-            L1b_idl = FFS.join(
-                [
-                    table,
-                    leak.strftime("%Y-%m"),
-                    params.release_id,
-                    source_mon_period.strftime("%Y-%m"),
-                ]
-            )
-            filename = os.path.join(params.level_path, L1b_idl + ".psv")
-            write_cdm_tables(
-                params, table_db.loc[[leak]], tables=table, outname=filename
-            )
-            table_db.drop(leak, inplace=True)
-            len_db_i = len_db
-            len_db = len(table_db)
-            ql_dict[table]["date leak out"][leak.strftime("%Y-%m")] = len_db_i - len_db
-        ql_dict[table]["date leak out"]["total"] = sum(
-            [v for k, v in ql_dict[table]["date leak out"].items()]
-        )
+        write_leaks(table_db, table, datetime_leaks, source_mon_period, ql_dict, params)
     else:
         ql_dict[table]["date leak out"]["total"] = 0
 
-logging.info("Saving json quicklook")
-save_quicklook(params, ql_dict, date_handler)
+
+def process_table(table, ql_dict, params, history_tstmp, report_ids=None):
+    """Correct table, track duplicates and write it per month."""
+    logging.info(params.prev_level_path)
+    logging.info(params.prev_fileID)
+    logging.info(table)
+    table_db = read_cdm_tables(params, table)
+
+    if table_db.empty:
+        logging.warning(f"Empty or non-existing table {table}")
+        ql_dict[table]["read"] = 0
+        return
+
+    table_db.data = table_db[table]
+    table_db.set_index("report_id", inplace=True, drop=False)
+    if table == "header" and report_ids is not None:
+        logging.info("Delete header information without any observations.")
+        table_db.data = table_db[table_db.index.isin(report_ids)]
+
+    ql_dict[table]["read"] = len(table_db)
+    ql_dict[table]["date leak out"] = {}
+    apply_corrections(table_db, table, ql_dict, params, history_tstmp)
+
+    if table_db.empty:
+        logging.warning("Empty table {table}")
+        return
+
+    # Track duplicate status
+    if table == "header":
+        track_duplicates(table_db, ql_dict, params)
+
+    # Now get ready to write out
+    if table_db.empty:
+        return
+
+    write_monthly_tables(table_db, table, ql_dict, params)
+
+
+def run(params):
+    """Correct the CDM tables of one sid-dck month, return exit status."""
+    if params.correction_version != "null":
+        params.corrections_path = os.path.join(
+            params.data_path, "datasets", "NOC_corrections", params.correction_version
+        )
+        logging.info(f"Setting corrections path to {params.corrections_path}")
+        paths_exist(params.corrections_path)
+
+    ql_dict = {table: {} for table in params.cdm_tables}
+
+    # Do the data processing --------------------------------------------------
+    # 1. Do it a table at a time....
+    try:
+        history_tstmp = datetime.datetime.now(datetime.UTC).strftime(
+            "%Y-%m-%d %H:%M:%S"
+        )
+    except AttributeError:  # for python < 3.11
+        history_tstmp = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+    tables = params.cdm_tables
+    obs_tables = [table for table in tables if table != "header"]
+    report_ids = None
+    if params.delete_no_obs is True:
+        report_ids = get_report_ids(obs_tables, params)
+
+    for table in tables:
+        process_table(table, ql_dict, params, history_tstmp, report_ids=report_ids)
+
+    logging.info("Saving json quicklook")
+    save_quicklook(params, ql_dict, date_handler)
+    return 0
+
+
+# MAIN ------------------------------------------------------------------------
+if __name__ == "__main__":
+    reload(logging)  # This is to override potential previous config of logging
+    logging.basicConfig(
+        format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
+        level=logging.INFO,
+        datefmt="%Y%m%d %H:%M:%S",
+        filename=None,
+    )
+    sys.exit(run(script_setup(process_options, sys.argv)))
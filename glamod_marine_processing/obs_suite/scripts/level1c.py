@@ -33,7 +33,7 @@ The processing unit is the source-deck monthly set of CDM tables.
 
 On reading the table files from the source level (1b), it read:
     1. master table file (table-yyyy-mm-release-update.psv)
-    2. datetime leak files (table-yyyy-mm-release-update-YYYY-MM.psv), where
+    2. datetime leak files (table-yyyy-mm-release-update-YYYY-MM.psv or .feather), where
        YYYY-MM indicates the initial yyyy-mm stamp of the reports contained in that
        leak file upon arrival to level1b.
 
@@ -108,19 +108,26 @@ import pandas as pd
 from _utilities import (
     FFS,
     date_handler,
+    glob_cdm_tables,
+    leak_extensions,
     paths_exist,
     read_cdm_tables,
     save_quicklook,
     script_setup,
+    table_formats,
     write_cdm_tables,
 )
 
-reload(logging)  # This is to override potential previous config of logging
+process_options = ["noc_version"]
 
+# Settings in configuration file
+validated = ["report_timestamp", "primary_station_id"]
+history = "Performed report_timestamp (date_time) and primary_station_id validation"
 
-def validate_id(idSeries):
+
+def validate_id(idSeries, params):
     """Validate ID."""
-    json_file = os.path.join(id_validation_path, "dck" + params.dck + ".json")
+    json_file = os.path.join(params.id_validation_path, "dck" + params.dck + ".json")
     if not os.path.isfile(json_file):
         logging.warning(f"NO noc ancillary info file {json_file} available")
         logging.warning("Adding match-all regex to validation patterns")
@@ -148,7 +155,7 @@ def validate_id(idSeries):
     return idSeries.str.match(combined_compiled, na=na_values)
 
 
-def read_table_files(table):
+def read_table_files(table, ql_dict, params):
     """Read table files."""
     logging.info(f"Reading data from {table} table files")
     # First read the master file, if any, then append leaks
@@ -164,8 +171,10 @@ def read_table_files(table):
                 table
             )
         )
-    leak_pattern = FFS.join([table, params.fileID, "????" + FFS + "??.psv"])
-    leak_files = glob.glob(os.path.join(params.prev_level_path, leak_pattern))
+    leak_files = []
+    for leak_ext in set(leak_extensions.values()):
+        leak_pattern = FFS.join([table, params.fileID, f"????{FFS}??.{leak_ext}"])
+        leak_files += glob.glob(os.path.join(params.prev_level_path, leak_pattern))
     leaks_in = 0
     if len(leak_files) > 0:
         for leak_file in leak_files:
@@ -183,11 +192,11 @@ def read_table_files(table):
     return table_db
 
 
-def process_table(table_df, table):
+def process_table(table_df, table, mask_df, ql_dict, params, history_tstmp):
     """Process table."""
     if isinstance(table_df, str):
         # Open table and reindex
-        table_df = read_table_files(table)
+        table_df = read_table_files(table, ql_dict, params)
         if table_df is None or len(table_df) == 0:
             logging.warning(f"Empty or non existing table {table}")
             return
@@ -212,135 +221,150 @@ def process_table(table_df, table):
     ql_dict[table]["total"] = len(table_df[table_mask["all"]])
 
 
-# MAIN ------------------------------------------------------------------------
-
-# Process input and set up some things and make sure we can do something-------
-logging.basicConfig(
-    format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
-    level=logging.INFO,
-    datefmt="%Y%m%d %H:%M:%S",
-    filename=None,
-)
-params = script_setup(["noc_version"], sys.argv)
-paths_exist(params.level_invalid_path)
-if params.noc_version:
-    id_validation_path = os.path.join(
-        params.data_path, "datasets", "NOC_ANC_INFO", params.noc_version
+def validate_header(table_db, ql_dict, params):
+    """Validate report_timestamp and primary_station_id, return mask."""
+    # Initialize mask
+    mask_df = pd.DataFrame(index=table_db.index, columns=validated + ["all"])
+    mask_df[validated] = True
+
+    # 2.1. Validate datetime
+    field = "report_timestamp"
+    mask_df[field] = table_db[field].notna()
+
+    # 2.2. Validate primary_station_id
+    field = "primary_station_id"
+    ql_dict["id_validation_rules"] = {}
+
+    # First get callsigns:
+    logging.info("Applying callsign id validation")
+    p_id_scheme = "primary_station_id_scheme"
+    pt = "platform_type"
+    callsigns = table_db[p_id_scheme].isin([5]) & table_db[pt].isin([2, 33])
+    nocallsigns = ~callsigns
+
+    relist = [
+        "^([0-9]{1}[A-Z]{1}|^[A-Z]{1}[0-9]{1}|^[A-Z]{2})[A-Z0-9]{1,}$",
+        "^[0-9]{5}$",
+    ]
+    callre = re.compile("|".join(relist))
+    mask_df.loc[callsigns, field] = (
+        table_db[field].loc[callsigns].str.match(callre, na=True)
+    )
+    # Then the rest according to general validation rules
+    logging.info("Applying general id validation")
+    mask_df.loc[nocallsigns, field] = validate_id(
+        table_db[field].loc[callsigns], params
+    )
+    mask_df = mask_df.astype(bool)
+
+    # And now set back to True all that the linkage provided
+    # Instead, read in the header history field and check if it contains
+    # 'Corrected primary_station_id'
+    logging.info("Restoring linked IDs")
+    linked_history = "Corrected primary_station_id"
+    linked_IDs = (
+        table_db["history"].str.contains(linked_history)
+        & table_db["history"].str.contains("ID identification").notna()
     )
-    paths_exist(id_validation_path)
-else:
-    id_validation_path = ""
 
-ql_dict = {table: {} for table in params.cdm_tables}
+    linked_IDs_no = (linked_IDs).sum()
 
-# DO THE DATA PROCESSING ------------------------------------------------------
+    if linked_IDs_no > 0:
+        mask_df.loc[linked_IDs, field] = True
+        ql_dict["id_validation_rules"]["idcorrected"] = linked_IDs_no
 
-# -----------------------------------------------------------------------------
-# Settings in configuration file
-validated = ["report_timestamp", "primary_station_id"]
-history = "Performed report_timestamp (date_time) and primary_station_id validation"
-try:
-    history_tstmp = datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%d %H:%M:%S")
-except AttributeError:  # for python < 3.11
-    history_tstmp = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-
-# 1. READ THE DATA-------------------------------------------------------------
-
-# Read the header table file(s) and init the mask to True
-# Table files can be multiple for a yyyy-mm if datetime corrections
-# in level1b resulted in a change in the month
-table = "header"
-table_db = read_table_files(table)
-if table_db.empty:
-    logging.error(f"No data could be read for file partition {params.fileID}")
-    sys.exit(1)
-
-table_db.data = table_db[table]
-table_db.set_index("report_id", inplace=True, drop=False)
-
-# Initialize mask
-mask_df = pd.DataFrame(index=table_db.index, columns=validated + ["all"])
-mask_df[validated] = True
-
-# 2. VALIDATE THE FIELDS-------------------------------------------------------
-# 2.1. Validate datetime
-field = "report_timestamp"
-mask_df[field] = table_db[field].notna()
-
-# 2.2. Validate primary_station_id
-field = "primary_station_id"
-ql_dict["id_validation_rules"] = {}
-
-# First get callsigns:
-logging.info("Applying callsign id validation")
-p_id_scheme = "primary_station_id_scheme"
-pt = "platform_type"
-callsigns = table_db[p_id_scheme].isin([5]) & table_db[pt].isin([2, 33])
-nocallsigns = ~callsigns
-
-relist = ["^([0-9]{1}[A-Z]{1}|^[A-Z]{1}[0-9]{1}|^[A-Z]{2})[A-Z0-9]{1,}$", "^[0-9]{5}$"]
-callre = re.compile("|".join(relist))
-mask_df.loc[callsigns, field] = (
-    table_db[field].loc[callsigns].str.match(callre, na=True)
-)
-# Then the rest according to general validation rules
-logging.info("Applying general id validation")
-mask_df.loc[nocallsigns, field] = validate_id(table_db[field].loc[callsigns])
-mask_df = mask_df.astype(bool)
-
-# And now set back to True all that the linkage provided
-# Instead, read in the header history field and check if it contains
-# 'Corrected primary_station_id'
-logging.info("Restoring linked IDs")
-linked_history = "Corrected primary_station_id"
-linked_IDs = (
-    table_db["history"].str.contains(linked_history)
-    & table_db["history"].str.contains("ID identification").notna()
-)
+    ql_dict["id_validation_rules"]["callsign"] = len(np.where(callsigns)[0])
+    ql_dict["id_validation_rules"]["noncallsign"] = len(np.where(~callsigns)[0])
+    return mask_df
 
-linked_IDs_no = (linked_IDs).sum()
 
-if linked_IDs_no > 0:
-    mask_df.loc[linked_IDs, field] = True
-    ql_dict["id_validation_rules"]["idcorrected"] = linked_IDs_no
+def run(params):
+    """Validate the CDM tables of one sid-dck month, return exit status."""
+    paths_exist(params.level_invalid_path)
+    if params.noc_version:
+        params.id_validation_path = os.path.join(
+            params.data_path, "datasets", "NOC_ANC_INFO", params.noc_version
+        )
+        paths_exist(params.id_validation_path)
+    else:
+        params.id_validation_path = ""
 
-ql_dict["id_validation_rules"]["callsign"] = len(np.where(callsigns)[0])
-ql_dict["id_validation_rules"]["noncallsign"] = len(np.where(~callsigns)[0])
+    ql_dict = {table: {} for table in params.cdm_tables}
 
-# 3. OUTPUT INVALID REPORTS - HEADER ------------------------------------------
-for field in validated:
-    if False in mask_df[field].value_counts().index:
-        ioutname = os.path.join(
-            params.level_invalid_path,
-            FFS.join(["header", params.fileID, field]) + ".psv",
-        )
-        write_cdm_tables(
-            params, table_db[~mask_df[field]], tables=table, outname=ioutname
+    # DO THE DATA PROCESSING --------------------------------------------------
+    try:
+        history_tstmp = datetime.datetime.now(datetime.UTC).strftime(
+            "%Y-%m-%d %H:%M:%S"
         )
+    except AttributeError:  # for python < 3.11
+        history_tstmp = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+    # 1. READ THE DATA---------------------------------------------------------
+
+    # Read the header table file(s) and init the mask to True
+    # Table files can be multiple for a yyyy-mm if datetime corrections
+    # in level1b resulted in a change in the month
+    table = "header"
+    table_db = read_table_files(table, ql_dict, params)
+    if table_db.empty:
+        logging.error(f"No data could be read for file partition {params.fileID}")
+        return 1
+
+    table_db.data = table_db[table]
+    table_db.set_index("report_id", inplace=True, drop=False)
+
+    # 2. VALIDATE THE FIELDS---------------------------------------------------
+    mask_df = validate_header(table_db, ql_dict, params)
+
+    # 3. OUTPUT INVALID REPORTS - HEADER --------------------------------------
+    for field in validated:
+        if False in mask_df[field].value_counts().index:
+            ioutname = os.path.join(
+                params.level_invalid_path,
+                FFS.join(["header", params.fileID, field]) + ".psv",
+            )
+            write_cdm_tables(
+                params, table_db[~mask_df[field]], tables=table, outname=ioutname
+            )
+
+    # 4. REPORT INVALIDS PER FIELD  -------------------------------------------
+    # Now clean, keep only all valid:
+    mask_df["all"] = mask_df.all(axis=1)
+    # Report invalids
+    ql_dict["invalid"] = {}
+    ql_dict["invalid"]["total"] = len(table_db[~mask_df["all"]])
+    for field in validated:
+        mask_df = mask_df.fillna(False)
+        ql_dict["invalid"][field] = len(mask_df[field].loc[~mask_df[field]])
+
+    # 5. CLEAN AND OUTPUT TABLES  ---------------------------------------------
+    # Now process tables and log final numbers and some specifics in header table
+    # First header table, already open
+    logging.info("Cleaning table header")
+    process_table(table_db, table, mask_df, ql_dict, params, history_tstmp)
+    obs_tables = [x for x in params.cdm_tables if x != "header"]
+    for table in obs_tables:
+        table_files = []
+        for ext in table_formats.values():
+            table_pattern = FFS.join([table, params.prev_fileID]) + "*." + ext
+            table_pattern = os.path.join(params.prev_level_path, table_pattern)
+            table_files += glob_cdm_tables(table_pattern)
+        if len(table_files) > 0:
+            logging.info(f"Cleaning table {table}")
+            process_table(table, table, mask_df, ql_dict, params, history_tstmp)
+
+    logging.info("Saving json quicklook")
+    save_quicklook(params, ql_dict, date_handler)
+    return 0
 
 
-# 4. REPORT INVALIDS PER FIELD  -----------------------------------------------
-# Now clean, keep only all valid:
-mask_df["all"] = mask_df.all(axis=1)
-# Report invalids
-ql_dict["invalid"] = {}
-ql_dict["invalid"]["total"] = len(table_db[~mask_df["all"]])
-for field in validated:
-    mask_df = mask_df.fillna(False)
-    ql_dict["invalid"][field] = len(mask_df[field].loc[~mask_df[field]])
-
-# 5. CLEAN AND OUTPUT TABLES  -------------------------------------------------
-# Now process tables and log final numbers and some specifics in header table
-# First header table, already open
-logging.info("Cleaning table header")
-process_table(table_db, table)
-obs_tables = [x for x in params.cdm_tables if x != "header"]
-for table in obs_tables:
-    table_pattern = FFS.join([table, params.prev_fileID]) + "*.pq"
-    table_files = glob.glob(os.path.join(params.prev_level_path, table_pattern))
-    if len(table_files) > 0:
-        logging.info(f"Cleaning table {table}")
-        process_table(table, table)
-
-logging.info("Saving json quicklook")
-save_quicklook(params, ql_dict, date_handler)
+# MAIN ------------------------------------------------------------------------
+if __name__ == "__main__":
+    reload(logging)  # This is to override potential previous config of logging
+    logging.basicConfig(
+        format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
+        level=logging.INFO,
+        datefmt="%Y%m%d %H:%M:%S",
+        filename=None,
+    )
+    sys.exit(run(script_setup(process_options, sys.argv)))
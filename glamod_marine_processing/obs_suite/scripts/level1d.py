@@ -17,6 +17,7 @@ The processing unit is the source-deck monthly set of CDM tables.
 
 Outputs data to /<data_path>/<release>/<dataset>/level1d/<sid-dck>/table[i]-fileID.psv
 Outputs quicklook info to:  /<data_path>/<release>/<dataset>/level1d/quicklooks/<sid-dck>/fileID.json
+Outputs slim QC context to: /<data_path>/<release>/<dataset>/level1d/context/<sid-dck>/table[i]-fileID.pq
 where fileID is yyyy-mm-release_tag-update_tag
 
 Before processing starts:
@@ -63,8 +64,11 @@ from importlib import reload
 
 import pandas as pd
 from _utilities import (
+    FFS,
+    create_consistent_datadict,
     date_handler,
     delimiter,
+    get_qc_context_columns,
     paths_exist,
     read_cdm_tables,
     save_quicklook,
@@ -74,10 +78,20 @@ from _utilities import (
 from cdm_reader_mapper import map_model
 from cdm_reader_mapper.cdm_mapper.tables.tables import get_cdm_atts
 
-reload(logging)  # This is to override potential previous config of logging
+process_options = [
+    "md_model",
+    "md_subdir",
+    "md_version",
+    "history_explain",
+    "md_first_yr_avail",
+    "md_last_yr_avail",
+    "md_not_avail",
+    "no_qc_context",
+]
+cdm_atts = get_cdm_atts()
 
 
-def map_to_cdm(md_model, meta_df, log_level="INFO"):
+def map_to_cdm(md_model, meta_df, cdm_tables, log_level="INFO"):
     """Map to CDM."""
     # Atts is a minimum info on vars the cdm module requires
     meta_db = map_model(
@@ -87,14 +101,58 @@ def map_to_cdm(md_model, meta_df, log_level="INFO"):
         drop_missing_obs=False,
         log_level=log_level,
     )
-    for table in params.cdm_tables:
+    for table in cdm_tables:
         meta_db[table] = meta_db[table].astype("object")
 
     return meta_db
 
 
-def process_table(table_db, table):
-    """Process table."""
+def merge_metadata(table_db, table, meta_cdm, ql_dict, params, history_tstmp):
+    """Update table with metadata by primary_station_id."""
+    ql_dict[table] = {"total": len(table_db), "updated": 0}
+    table_db.set_index("primary_station_id", drop=False, inplace=True)
+
+    if table == "header":
+        meta_table = meta_cdm[[x for x in meta_cdm if x[0] == table]]
+        meta_table.columns = [x[1] for x in meta_table]
+        # which should be equivalent to: (but more felxible if table !=header)
+        # meta_table = meta_cdm.loc[:, table]
+    else:
+        meta_table = meta_cdm[
+            [
+                x
+                for x in meta_cdm
+                if x[0] == table or (x[0] == "header" and x[1] == "primary_station_id")
+            ]
+        ]
+        meta_table.columns = [x[1] for x in meta_table]
+
+    meta_table.set_index("primary_station_id", drop=False, inplace=True)
+    table_db.data.update(meta_table[~meta_table.index.duplicated()])
+
+    updated_locs = [x for x in table_db.index if x in meta_table.index]
+    ql_dict[table]["updated"] = len(updated_locs)
+
+    if table == "header":
+        missing_ids = [x for x in table_db.index if x not in meta_table.index]
+        if len(missing_ids) > 0:
+            ql_dict["non " + params.md_model + " ids"] = {
+                k: v for k, v in Counter(missing_ids).items()
+            }
+        history_add = ";{}. {}".format(history_tstmp, "metadata fix")
+        locs = table_db.data["primary_station_id"].isin(updated_locs)
+        table_db.data["history"].loc[locs] = (
+            table_db.data["history"].loc[locs] + history_add
+        )
+
+
+def process_table(
+    table_db, table, header_db, meta_cdm, ql_dict, context_dict, params, history_tstmp
+):
+    """Process table.
+
+    Tables are updated with meta_cdm if it is not None.
+    """
     logging.info(f"Processing table {table}")
     if isinstance(table_db, str):
         # Assume 'header' and in a DF in table_df otherwise
@@ -113,43 +171,8 @@ def process_table(table_db, table):
         ]
 
     ql_dict[table] = {"total": len(table_db), "updated": 0}
-    if merge:
-        ql_dict[table] = {"total": len(table_db), "updated": 0}
-        table_db.set_index("primary_station_id", drop=False, inplace=True)
-
-        if table == "header":
-            meta_table = meta_cdm[[x for x in meta_cdm if x[0] == table]]
-            meta_table.columns = [x[1] for x in meta_table]
-            # which should be equivalent to: (but more felxible if table !=header)
-            # meta_table = meta_cdm.loc[:, table]
-        else:
-            meta_table = meta_cdm[
-                [
-                    x
-                    for x in meta_cdm
-                    if x[0] == table
-                    or (x[0] == "header" and x[1] == "primary_station_id")
-                ]
-            ]
-            meta_table.columns = [x[1] for x in meta_table]
-
-        meta_table.set_index("primary_station_id", drop=False, inplace=True)
-        table_db.data.update(meta_table[~meta_table.index.duplicated()])
-
-        updated_locs = [x for x in table_db.index if x in meta_table.index]
-        ql_dict[table]["updated"] = len(updated_locs)
-
-        if table == "header":
-            missing_ids = [x for x in table_db.index if x not in meta_table.index]
-            if len(missing_ids) > 0:
-                ql_dict["non " + params.md_model + " ids"] = {
-                    k: v for k, v in Counter(missing_ids).items()
-                }
-            history_add = ";{}. {}".format(history_tstmp, "metadata fix")
-            locs = table_db.data["primary_station_id"].isin(updated_locs)
-            table_db.data["history"].loc[locs] = (
-                table_db.data["history"].loc[locs] + history_add
-            )
+    if meta_cdm is not None:
+        merge_metadata(table_db, table, meta_cdm, ql_dict, params, history_tstmp)
 
     table_db = table_db[cdm_atts.get(table).keys()]
 
@@ -159,36 +182,35 @@ def process_table(table_db, table):
         tables=table,
     )
 
+    if params.no_qc_context is not True and not table_db.empty:
+        context_dict[table] = table_db[get_qc_context_columns(table)].copy()
+
+
+def write_qc_context(context_dict, params):
+    """Write slim QC context tables of valid and consistent reports."""
+    if "header" not in context_dict.keys():
+        logging.warning("No header table available. Skip writing QC context.")
+        return
+    context_dict, _ = create_consistent_datadict(context_dict, remove_invalids=True)
+    for table, df in context_dict.items():
+        write_cdm_tables(
+            params,
+            df,
+            tables=table,
+            outname=os.path.join(
+                params.level_context_path, FFS.join([table, params.fileID])
+            ),
+            mode=params.table_format,
+        )
 
-# END FUNCTIONS ---------------------------------------------------------------
-
-
-# %% MAIN ------------------------------------------------------------------------
-
-# Process input and set up some things and make sure we can do something-------
-logging.basicConfig(
-    format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
-    level=logging.DEBUG,
-    datefmt="%Y%m%d %H:%M:%S",
-    filename=None,
-)
-
-process_options = [
-    "md_model",
-    "md_subdir",
-    "md_version",
-    "history_explain",
-    "md_first_yr_avail",
-    "md_last_yr_avail",
-    "md_not_avail",
-]
-params = script_setup(process_options, sys.argv)
-
-paths_exist(params.level_log_path)
 
-md_avail = True if not params.md_not_avail else False
+def get_metadata_filename(params):
+    """Get metadata file name of the month, None if not available."""
+    if params.md_not_avail:
+        logging.info(f"Metadata not available for data source-deck {params.sid_dck}")
+        logging.info("level1d data will be created with no merging")
+        return
 
-if md_avail:
     if params.corrections_mod.get("pub47_path"):
         md_path = params.corrections_mod.get("pub47_path")
     else:
@@ -198,83 +220,114 @@ if md_avail:
     logging.info(f"Setting MD path to {md_path}")
     metadata_filename = os.path.join(md_path, f"pub47_{params.year}_{params.month}.csv")
 
-    if not os.path.isfile(metadata_filename):
-        if int(params.year) > int(params.md_last_yr_avail) or int(params.year) < int(
-            params.md_first_yr_avail
-        ):
-            md_avail = False
-            logging.warning(
-                f"Metadata source available only in period {str(params.md_first_yr_avail)}-{str(params.md_last_yr_avail)}"
-            )
-            logging.warning("level1d data will be created with no merging")
-        else:
-            logging.error(f"Metadata file not found: {metadata_filename}")
-            sys.exit(1)
-else:
-    logging.info(f"Metadata not available for data source-deck {params.sid_dck}")
-    logging.info("level1d data will be created with no merging")
-
-ql_dict = {}
-
-# DO THE DATA PROCESSING ------------------------------------------------------
-# -----------------------------------------------------------------------------
-try:
-    history_tstmp = datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%d %H:%M:%S")
-except AttributeError:  # for python < 3.11
-    history_tstmp = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    if os.path.isfile(metadata_filename):
+        return metadata_filename
+    if int(params.year) > int(params.md_last_yr_avail) or int(params.year) < int(
+        params.md_first_yr_avail
+    ):
+        logging.warning(
+            f"Metadata source available only in period {str(params.md_first_yr_avail)}-{str(params.md_last_yr_avail)}"
+        )
+        logging.warning("level1d data will be created with no merging")
+        return
+    logging.error(f"Metadata file not found: {metadata_filename}")
+    sys.exit(1)
 
-cdm_atts = get_cdm_atts()
-obs_tables = [x for x in cdm_atts.keys() if x != "header"]
 
-# 1. SEE STATION ID's FROM BOTH DATA STREAMS AND SEE IF THERE'S ANYTHING TO
-# MERGE AT ALL
-# Read the header table
-header_db = read_cdm_tables(params, "header")
-header_db.data = header_db["header"]
+# END FUNCTIONS ---------------------------------------------------------------
 
-if header_db.empty:
-    logging.error("Empty or non-existing header table")
-    sys.exit(1)
 
-# Read the metadata
-if md_avail:
-    meta_df = pd.read_csv(
-        metadata_filename,
-        delimiter=delimiter,
-        dtype="object",
-        header=0,
-        na_values="MSNG",
-    )
+def run(params):
+    """Merge metadata into the CDM tables of one sid-dck month, return exit status."""
+    paths_exist(params.level_log_path)
+
+    metadata_filename = get_metadata_filename(params)
+
+    ql_dict = {}
+    context_dict = {}
 
-    if len(meta_df) == 0:
-        logging.error("Empty or non-existing metadata file")
-        sys.exit(1)
-
-# See if there's anything to do
-header_db.set_index("primary_station_id", drop=False, inplace=True)
-merge = True if md_avail else False
-if md_avail:
-    meta_df = meta_df.loc[
-        meta_df["ship_callsign"].isin(header_db["primary_station_id"])
-    ]
-    if len(meta_df) == 0:
-        logging.warning("No metadata to merge in file")
-        merge = False
-
-# 2. MAP PUB47 MD TO CDM FIELDS -----------------------------------------------
-if merge:
-    logging.info("Mapping metadata to CDM")
-    meta_cdm = map_to_cdm(params.md_model, meta_df, log_level="DEBUG")
-
-# 3. UPDATE CDM WITH PUB47 OR JUST COPY PREV LEVEL TO CURRENT -----------------
-# This is only valid for the header
-process_table(header_db, "header")
-
-header_db.set_index("report_id", inplace=True, drop=False)
-
-for table in obs_tables:
-    process_table(table, table)
-
-# 4. SAVE QUICKLOOK -----------------------------------------------------------
-logging.info("Saving json quicklook")
-save_quicklook(params, ql_dict, date_handler)
+    # DO THE DATA PROCESSING --------------------------------------------------
+    # -------------------------------------------------------------------------
+    try:
+        history_tstmp = datetime.datetime.now(datetime.UTC).strftime(
+            "%Y-%m-%d %H:%M:%S"
+        )
+    except AttributeError:  # for python < 3.11
+        history_tstmp = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+    obs_tables = [x for x in cdm_atts.keys() if x != "header"]
+
+    # 1. SEE STATION ID's FROM BOTH DATA STREAMS AND SEE IF THERE'S ANYTHING TO
+    # MERGE AT ALL
+    # Read the header table
+    header_db = read_cdm_tables(params, "header")
+    header_db.data = header_db["header"]
+
+    if header_db.empty:
+        logging.error("Empty or non-existing header table")
+        return 1
+
+    # Read the metadata
+    meta_df = None
+    if metadata_filename is not None:
+        meta_df = pd.read_csv(
+            metadata_filename,
+            delimiter=delimiter,
+            dtype="object",
+            header=0,
+            na_values="MSNG",
+        )
+
+        if len(meta_df) == 0:
+            logging.error("Empty or non-existing metadata file")
+            return 1
+
+    # See if there's anything to do
+    header_db.set_index("primary_station_id", drop=False, inplace=True)
+    if meta_df is not None:
+        meta_df = meta_df.loc[
+            meta_df["ship_callsign"].isin(header_db["primary_station_id"])
+        ]
+        if len(meta_df) == 0:
+            logging.warning("No metadata to merge in file")
+            meta_df = None
+
+    # 2. MAP PUB47 MD TO CDM FIELDS -------------------------------------------
+    meta_cdm = None
+    if meta_df is not None:
+        logging.info("Mapping metadata to CDM")
+        meta_cdm = map_to_cdm(
+            params.md_model, meta_df, params.cdm_tables, log_level="DEBUG"
+        )
+
+    # 3. UPDATE CDM WITH PUB47 OR JUST COPY PREV LEVEL TO CURRENT -------------
+    # This is only valid for the header
+    args = (meta_cdm, ql_dict, context_dict, params, history_tstmp)
+    process_table(header_db, "header", header_db, *args)
+
+    header_db.set_index("report_id", inplace=True, drop=False)
+
+    for table in obs_tables:
+        process_table(table, table, header_db, *args)
+
+    # 4. WRITE SLIM QC CONTEXT FOR NEIGHBOURING LEVEL1E MONTHS ----------------
+    if params.no_qc_context is not True:
+        logging.info("Writing QC context tables")
+        write_qc_context(context_dict, params)
+
+    # 5. SAVE QUICKLOOK -------------------------------------------------------
+    logging.info("Saving json quicklook")
+    save_quicklook(params, ql_dict, date_handler)
+    return 0
+
+
+# %% MAIN ------------------------------------------------------------------------
+if __name__ == "__main__":
+    reload(logging)  # This is to override potential previous config of logging
+    logging.basicConfig(
+        format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
+        level=logging.DEBUG,
+        datefmt="%Y%m%d %H:%M:%S",
+        filename=None,
+    )
+    sys.exit(run(script_setup(process_options, sys.argv)))
@@ -36,6 +36,7 @@ The processing unit is the source-deck monthly set of CDM tables.
 
 Outputs data to /<data_path>/<release>/<source>/level1e/<sid-dck>/table[i]-fileID.psv
 Outputs quicklook info to:  /<data_path>/<release>/<source>/level1c/quicklooks/<sid-dck>/fileID.json
+Caches hourly buoy reports in: /<data_path>/<release>/<source>/level1e/context/<buoy_dataset>/<buoy_dck>/table[i]-fileID.pq
 
 where fileID is yyyy-mm-release_tag-update_tag
 
@@ -121,14 +122,19 @@ of the QC files relative to a set path (i.e. informing of the QC version)
 from __future__ import annotations
 
 import copy
+import fcntl
+import glob
 import logging
 import os
 import sys
+from contextlib import contextmanager
 from importlib import reload
 
 import pandas as pd
-from _qc_utilities import do_qc
+from _qc_utilities import GridIndex, QCFlags, do_qc
 from _utilities import (
+    FFS,
+    create_consistent_datadict,
     date_handler,
     paths_exist,
     read_cdm_tables,
@@ -136,107 +142,21 @@ from _utilities import (
     script_setup,
     write_cdm_tables,
 )
-from marine_qc import plot_qc_outcomes as pqo
-from marine_qc.auxiliary import isvalid
-
-reload(logging)  # This is to override potential previous config of logging
 
+from glamod_marine_processing.quicklooks.quicklooks import (
+    plot_suffix,
+    write_binned_qc_outcomes,
+)
 
 # Functions--------------------------------------------------------------------
 
 
-def remove_invalid_positions(df):
-    """Remove rows where latitude and/or longitude is None."""
-    df.dropna(subset=["latitude", "longitude"], inplace=True)
-
-
 def value_counts(series):
     """Count values in pandas Series."""
     counts = series.value_counts(dropna=False).to_dict()
     return {int(k): v for k, v in counts.items()}
 
 
-def get_valid_indexes(df, table):
-    """Get valid indexes."""
-    if df.empty:
-        return pd.Index([])
-    valid_indexes = isvalid(df["latitude"]) & isvalid(df["longitude"])
-    if table == "header":
-        valid_indexes = (
-            valid_indexes
-            & isvalid(df["report_timestamp"])
-            & (df["report_quality"] != 6)
-            & (df["report_quality"] != 1)
-        )
-    else:
-        valid_indexes = (
-            valid_indexes
-            & isvalid(df["date_time"])
-            & (df["quality_flag"] != 6)
-            & (df["quality_flag"] != 1)
-            & isvalid(df["observation_value"])
-        )
-    return valid_indexes
-
-
-def create_consistent_datadict(
-    data_dict,
-    remove_invalids=False,
-    drop_positions=True,
-):
-    """Remove report_ids without any observations."""
-    report_ids = pd.Series()
-    for table_in in data_dict.keys():
-        if drop_positions is True:
-            remove_invalid_positions(data_dict[table_in])
-        if remove_invalids is True:
-            valid_indexes = get_valid_indexes(data_dict[table_in], table_in)
-            data_dict[table_in] = data_dict[table_in].loc[valid_indexes]
-        report_ids = pd.concat(
-            [report_ids, data_dict[table_in]["report_id"]], ignore_index=True
-        )
-
-    report_ids = report_ids[report_ids.duplicated()]
-
-    ql_dict = {}
-    for table, df in data_dict.items():
-        df = df.set_index("report_id", drop=False)
-        p_length = len(df)
-        valid_indexes = df.index.intersection(report_ids)
-        df = df.loc[valid_indexes]
-
-        data_dict[table] = df
-
-        c_length = len(df)
-        r_length = p_length - c_length
-        ql_dict[table] = {
-            "total": c_length,
-            "deleted": r_length,
-        }
-    return data_dict, ql_dict
-
-
-def update_data_dict(
-    data_dict,
-    report_quality,
-    location_quality,
-    report_time_quality,
-    quality_flags,
-    history,
-):
-    """Update data_dict with new quality flags."""
-    for table in data_dict.keys():
-        df = data_dict[table]
-        if table == "header":
-            df = data_dict[table]
-            df["report_quality"] = report_quality
-            df["location_quality"] = location_quality
-            df["report_time_quality"] = report_time_quality
-            df["history"] = history
-        else:
-            df["quality_flag"] = quality_flags[table]
-
-
 def configure_month_params(params):
     """Configure params for both previous and next months."""
     year = int(params.year)
@@ -270,36 +190,6 @@ def configure_month_params(params):
     return params_prev, params_next
 
 
-def get_qc_columns(data_dict):
-    """Copy data dictionary, convert values and get quality flags."""
-    quality_flags = {}
-    report_quality = pd.Series()
-    location_quality = pd.Series()
-    report_time_quality = pd.Series()
-    history = pd.Series()
-    data_dict_qc = {}
-
-    for table, df in data_dict.items():
-        data_dict_qc[table] = df.copy()
-
-        if table == "header":
-            report_quality = df["report_quality"].copy()
-            location_quality = df["location_quality"].copy()
-            report_time_quality = df["report_time_quality"].copy()
-            history = df["history"].copy()
-        else:
-            quality_flags[table] = df["quality_flag"].copy()
-
-    return (
-        data_dict_qc,
-        report_quality,
-        location_quality,
-        report_time_quality,
-        quality_flags,
-        history,
-    )
-
-
 def concat_data_dicts(*dicts, dictref):
     """Concatenate data dicts."""
     dictout = {}
@@ -332,6 +222,69 @@ def get_nearest_to_hour(series, groupby=None):
     return nearest[["timestamp"]]
 
 
+def thin_to_hourly(data_dict):
+    """Keep reports nearest to each whole hour per primary_station_id."""
+    if "header" not in data_dict.keys() or data_dict["header"].empty:
+        return data_dict
+    ids = data_dict["header"]["primary_station_id"]
+    for table, df in data_dict.items():
+        if df.empty:
+            continue
+        if table == "header":
+            time_axis = "report_timestamp"
+        else:
+            time_axis = "date_time"
+
+        time_data = get_nearest_to_hour(df[time_axis], groupby=ids)
+        data_dict[table] = df.loc[time_data.index]
+    return data_dict
+
+
+def plot_quicklooks(df, table, params):
+    """Plot QC outcomes or write binned QC outcomes for deferred plotting."""
+    quicklook_plots = params.quicklook_plots or "inline"
+    if quicklook_plots == "none":
+        return
+    if quicklook_plots == "deferred":
+        write_binned_qc_outcomes(
+            df["latitude"],
+            df["longitude"],
+            df["observation_value"],
+            df["quality_flag"],
+            filename=os.path.join(
+                params.level_ql_path, f"{table}_{params.fileID}{plot_suffix}"
+            ),
+        )
+        return
+    if quicklook_plots != "inline":
+        logging.error(
+            f"Unknown quicklook_plots: {quicklook_plots}. Use 'inline', 'deferred' or 'none'."
+        )
+        sys.exit(1)
+
+    import matplotlib.pyplot as plt
+    from marine_qc import plot_qc_outcomes as pqo
+
+    fig = pqo.latitude_variable_plot(
+        df["latitude"],
+        df["observation_value"],
+        df["quality_flag"],
+        filename=os.path.join(
+            params.level_ql_path, f"{table}_{params.fileID}_lat_var.png"
+        ),
+    )
+    plt.close(fig)
+    fig = pqo.latitude_longitude_plot(
+        df["latitude"],
+        df["longitude"],
+        df["quality_flag"],
+        filename=os.path.join(
+            params.level_ql_path, f"{table}_{params.fileID}_lat_lon.png"
+        ),
+    )
+    plt.close(fig)
+
+
 def create_data_dict(data_dict, tables_in, params):
     """Create data dictionary."""
     for table_in in tables_in:
@@ -344,96 +297,118 @@ def create_data_dict(data_dict, tables_in, params):
     return data_dict
 
 
-# MAIN ------------------------------------------------------------------------
-
-# Process input, set up some things and make sure we can do something   -------
-logging.basicConfig(
-    format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
-    level=logging.INFO,
-    datefmt="%Y%m%d %H:%M:%S",
-    filename=None,
-)
-
-process_options = [
-    "qc_settings",
-    "history_explain",
-    "no_qc_suite",
-]
-params = script_setup(process_options, sys.argv)
-
-# Some other parameters -------------------------------------------------------
-obs_tables = [x for x in params.cdm_tables if x != "header"]
-
-# -----------------------------------------------------------------------------
-
-# DO SOME PREPROCESSING ------------------------------------------------------
-
-# Set file path to external files
-ext_path = os.path.join(params.data_path, "external_files")
-paths_exist(ext_path)
-
-# Do some additional checks before clicking go, do we have a valid header?
-header_filename = params.filename
-if not os.path.isfile(header_filename):
-    logging.error(f"Header table file not found: {header_filename}")
-    sys.exit(1)
-
-header_db = read_cdm_tables(params, "header")
-
-if header_db.empty:
-    logging.error("Empty or non-existing header table")
-    sys.exit(1)
-
-data_dict = {}
-data_dict["header"] = header_db["header"]
-
-# See what CDM tables are available for this fileID
-tables_in = ["header"]
-for table in obs_tables:
-    table_filename = header_filename.replace("header", table)
-    if not os.path.isfile(table_filename):
-        logging.warning(f"CDM table not available: {table_filename}")
-        continue
-    tables_in.append(table)
-
-if len(tables_in) == 1:
-    logging.error(
-        f"NO OBS TABLES AVAILABLE: {params.sid_dck}, period {params.year}-{params.month}"
+def create_context_dict(tables_in, params):
+    """Create data dictionary of valid and consistent QC context data.
+
+    Read slim QC context tables written by level1d if available.
+    Otherwise, fall back to full level1d tables.
+    """
+    params_context = copy.deepcopy(params)
+    params_context.prev_level_path = params.prev_level_context_path
+    data_dict = {}
+    if os.path.isdir(params_context.prev_level_context_path):
+        data_dict = create_data_dict({}, ["header"], params_context)
+    if "header" in data_dict.keys():
+        data_dict = create_data_dict(data_dict, tables_in, params_context)
+        data_dict, _ = create_consistent_datadict(data_dict, drop_positions=False)
+        return data_dict
+
+    logging.info(
+        f"No QC context available in {params.prev_level_context_path}. Read full tables."
     )
-    sys.exit(1)
-
-data_dict = create_data_dict(data_dict, tables_in, params)
-
-# Remove report_ids without any observations
-data_dict, ql_dict = create_consistent_datadict(data_dict)
+    data_dict = create_data_dict({}, tables_in, params)
+    data_dict, _ = create_consistent_datadict(data_dict, remove_invalids=True)
+    return data_dict
 
-# DO THE DATA PROCESSING ------------------------------------------------------
 
-# Update dtypes and get QC columns
-(
-    data_dict_qc,
-    report_quality,
-    location_quality,
-    report_time_quality,
-    quality_flags,
-    history,
-) = get_qc_columns(data_dict)
+def get_mtime(path, table, fileID):
+    """Get latest modification time of table files."""
+    files = glob.glob(os.path.join(path, f"{table}*{fileID}*"))
+    if len(files) == 0:
+        return None
+    return max(os.path.getmtime(file) for file in files)
+
+
+@contextmanager
+def cache_lock(lock_file):
+    """Hold an exclusive lock on lock_file, go without if it cannot be created."""
+    try:
+        os.makedirs(os.path.dirname(lock_file), exist_ok=True)
+        f = open(lock_file, "a")
+    except OSError:
+        logging.warning(f"Could not create lock file: {lock_file}", exc_info=True)
+        yield
+        return
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def write_hourly_buoy_cache(data_dict, cache_path, params):
+    """Write hourly buoy reports to cache.
+
+    Files are written to temporary files first and renamed afterwards.
+    The header table is written last and marks a complete cache.
+    """
+    tables = [table for table in data_dict.keys() if table != "header"]
+    try:
+        os.makedirs(cache_path, exist_ok=True)
+        for table in tables + ["header"]:
+            outname = FFS.join([table, params.prev_fileID])
+            tmpname = os.path.join(cache_path, f".{os.getpid()}-{outname}.pq")
+            write_cdm_tables(params, data_dict[table], tables=table, outname=tmpname)
+            if os.path.isfile(tmpname):
+                os.replace(tmpname, os.path.join(cache_path, f"{outname}.pq"))
+    except OSError:
+        logging.warning(
+            f"Could not write hourly buoy reports to cache: {cache_path}",
+            exc_info=True,
+        )
 
 
-if params.no_qc_suite is True:
-    data_dict_add = {}
-    data_dict_buoy = {}
-    for table, df in data_dict.items():
-        data_dict_add[table] = pd.DataFrame(columns=df.columns)
-        data_dict_buoy[table] = pd.DataFrame(columns=df.columns)
-else:
-    # Get additional data: month +/-1
+def create_hourly_buoy_dict(tables_in, params):
+    """Create data dictionary of buoy reports nearest to each whole hour.
+
+    The hourly buoy reports of one month are the same for all decks.
+    They are cached in params.hourly_buoy_path and only recomputed if
+    the level1d buoy data are newer than the cache. Decks of the same
+    month wait on a lock file, so the cache is computed only once.
+    """
+    cache_path = params.hourly_buoy_path
+    source_mtimes = [
+        get_mtime(params.prev_level_context_path, "header", params.prev_fileID),
+        get_mtime(params.prev_level_path, "header", params.prev_fileID),
+    ]
+    source_mtime = max(filter(None, source_mtimes), default=None)
+    if source_mtime is None:
+        logging.warning(f"No buoy data available in {params.prev_level_path}.")
+        return {}
+
+    with cache_lock(os.path.join(cache_path, f".{params.prev_fileID}.lock")):
+        cache_mtime = get_mtime(cache_path, "header", params.prev_fileID)
+        if cache_mtime is not None and cache_mtime >= source_mtime:
+            logging.info(f"Read hourly buoy reports from cache: {cache_path}")
+            params_cache = copy.deepcopy(params)
+            params_cache.prev_level_path = cache_path
+            data_dict = create_data_dict({}, tables_in, params_cache)
+            return {
+                table: df.set_index("report_id", drop=False)
+                for table, df in data_dict.items()
+            }
+
+        data_dict = create_context_dict(params.cdm_tables, params)
+        data_dict = thin_to_hourly(data_dict)
+        if "header" in data_dict.keys():
+            write_hourly_buoy_cache(data_dict, cache_path, params)
+    return {table: df for table, df in data_dict.items() if table in tables_in}
+
+
+def create_additional_dicts(data_dict, tables_in, params):
+    """Create data dictionaries of ship (month +/-1) and buoy context data."""
     # SHIP
     params_prev, params_next = configure_month_params(params)
-    data_dict_prev = create_data_dict({}, tables_in, params_prev)
-    data_dict_prev, _ = create_consistent_datadict(data_dict_prev, remove_invalids=True)
-    data_dict_next = create_data_dict({}, tables_in, params_prev)
-    data_dict_next, _ = create_consistent_datadict(data_dict_next, remove_invalids=True)
+    data_dict_prev = create_context_dict(tables_in, params_prev)
+    data_dict_next = create_context_dict(tables_in, params_next)
 
     data_dict_add = concat_data_dicts(data_dict_prev, data_dict_next, dictref=data_dict)
 
@@ -443,114 +418,167 @@ else:
     buoy_dataset = copy.deepcopy(qc_dict.get("buoy_dataset", "None"))
     buoy_dck = copy.deepcopy(qc_dict.get("buoy_dck", "None"))
 
-    params_buoy.prev_level_path = params_buoy.prev_level_path.replace(
-        params.dataset, buoy_dataset
-    )
-    params_buoy.prev_level_path = params_buoy.prev_level_path.replace(
-        params.sid_dck, buoy_dck
+    for path_attr in ["prev_level_path", "prev_level_context_path"]:
+        path = getattr(params_buoy, path_attr)
+        path = path.replace(params.dataset, buoy_dataset)
+        path = path.replace(params.sid_dck, buoy_dck)
+        setattr(params_buoy, path_attr, path)
+    params_buoy.hourly_buoy_path = os.path.join(
+        os.path.dirname(params.level_path), "context", buoy_dataset, buoy_dck
     )
     params_buoy_prev, params_buoy_next = configure_month_params(params_buoy)
-    data_dict_buoy_prev = create_data_dict({}, tables_in, params_buoy_prev)
-    data_dict_buoy_prev, _ = create_consistent_datadict(
-        data_dict_buoy_prev, remove_invalids=True
-    )
-    data_dict_buoy_curr = create_data_dict({}, tables_in, params_buoy)
-    data_dict_buoy_curr, _ = create_consistent_datadict(
-        data_dict_buoy_curr, remove_invalids=True
-    )
-    data_dict_buoy_next = create_data_dict({}, tables_in, params_buoy_next)
-    data_dict_buoy_next, _ = create_consistent_datadict(
-        data_dict_buoy_next, remove_invalids=True
-    )
+    data_dict_buoy_prev = create_hourly_buoy_dict(tables_in, params_buoy_prev)
+    data_dict_buoy_curr = create_hourly_buoy_dict(tables_in, params_buoy)
+    data_dict_buoy_next = create_hourly_buoy_dict(tables_in, params_buoy_next)
 
     data_dict_buoy = concat_data_dicts(
-        data_dict_buoy_prev, data_dict_buoy_curr, data_dict_buoy_next, dictref=data_dict
+        data_dict_buoy_prev,
+        data_dict_buoy_curr,
+        data_dict_buoy_next,
+        dictref=data_dict,
     )
 
-    if not data_dict_buoy["header"].empty:
-        ids = data_dict_buoy["header"]["primary_station_id"]
-        for table, df in data_dict_buoy.items():
-            if df.empty:
-                continue
-            if table == "header":
-                time_axis = "report_timestamp"
-            else:
-                time_axis = "date_time"
-
-            time_data = get_nearest_to_hour(df[time_axis], groupby=ids)
-            data_dict_buoy[table] = df.loc[time_data.index]
-
-    for table in data_dict_qc.keys():
+    for table in data_dict.keys():
         if table not in data_dict_add.keys():
             data_dict_add[table] = pd.DataFrame()
         if table not in data_dict_buoy.keys():
             data_dict_buoy[table] = pd.DataFrame()
+    return data_dict_add, data_dict_buoy
 
-# Perform QC
-report_quality, location_quality, report_time_quality, quality_flags, history = do_qc(
-    data_dict_qc=data_dict_qc,
-    report_quality=report_quality,
-    location_quality=location_quality,
-    report_time_quality=report_time_quality,
-    quality_flags=quality_flags,
-    history=history,
-    params=params,
-    ext_path=ext_path,
-    data_dict_add=data_dict_add,
-    data_dict_buoy=data_dict_buoy,
-    perform_qc=not params.no_qc_suite,
-)
 
-# Optionally, copy quality_flags
-if params.no_qc_suite is False and params.qc_settings["copies"]:
-    for table, table_cp in params.qc_settings["copies"].items():
-        if table in data_dict.keys():
-            intersec = quality_flags[table].index.intersection(
-                quality_flags[table_cp].index
-            )
-            quality_flags[table].loc[intersec] = quality_flags[table_cp].loc[intersec]
-        else:
-            logging.warning(f"Could not copy {table}.")
-
-# Update data_dict with reworked QC columns
-update_data_dict(
-    data_dict,
-    report_quality,
-    location_quality,
-    report_time_quality,
-    quality_flags,
-    history,
-)
+# MAIN ------------------------------------------------------------------------
+
+process_options = [
+    "qc_settings",
+    "history_explain",
+    "no_qc_suite",
+    "qc_workers",
+    "qc_executor",
+    "quicklook_plots",
+]
+
+
+def run(params):
+    """Add QC flags to the CDM tables of one sid-dck month, return exit status."""
+    # Some other parameters ---------------------------------------------------
+    obs_tables = [x for x in params.cdm_tables if x != "header"]
+
+    # -------------------------------------------------------------------------
+
+    # DO SOME PREPROCESSING ---------------------------------------------------
+
+    # Set file path to external files
+    ext_path = os.path.join(params.data_path, "external_files")
+    paths_exist(ext_path)
+
+    # Do some additional checks before clicking go, do we have a valid header?
+    header_filename = params.filename
+    if not os.path.isfile(header_filename):
+        logging.error(f"Header table file not found: {header_filename}")
+        return 1
+
+    header_db = read_cdm_tables(params, "header")
+
+    if header_db.empty:
+        logging.error("Empty or non-existing header table")
+        return 1
 
-# WRITE QC FLAGS TO DATA ------------------------------------------------------
-for table, df in data_dict.items():
-    if table == "header":
-        ql_dict[table]["report_quality_flag"] = value_counts(df["report_quality"])
-        ql_dict[table]["location_quality_flag"] = value_counts(df["location_quality"])
-        ql_dict[table]["report_time_quality_flag"] = value_counts(
-            df["report_time_quality"]
+    data_dict = {}
+    data_dict["header"] = header_db["header"]
+
+    # See what CDM tables are available for this fileID
+    tables_in = ["header"]
+    for table in obs_tables:
+        table_filename = header_filename.replace("header", table)
+        if not os.path.isfile(table_filename):
+            logging.warning(f"CDM table not available: {table_filename}")
+            continue
+        tables_in.append(table)
+
+    if len(tables_in) == 1:
+        logging.error(
+            f"NO OBS TABLES AVAILABLE: {params.sid_dck}, period {params.year}-{params.month}"
         )
+        return 1
+
+    data_dict = create_data_dict(data_dict, tables_in, params)
+
+    # Remove report_ids without any observations
+    data_dict, ql_dict = create_consistent_datadict(data_dict)
+
+    # DO THE DATA PROCESSING --------------------------------------------------
+
+    # Copy data dictionary and get QC flags
+    data_dict_qc = {table: df.copy() for table, df in data_dict.items()}
+    qc_flags = QCFlags.from_data_dict(data_dict)
+
+    grid_index = None
+    if params.no_qc_suite is True:
+        data_dict_add = {}
+        data_dict_buoy = {}
+        for table, df in data_dict.items():
+            data_dict_add[table] = pd.DataFrame(columns=df.columns)
+            data_dict_buoy[table] = pd.DataFrame(columns=df.columns)
     else:
-        ql_dict[table]["quality_flag"] = value_counts(df["quality_flag"])
-        pqo.latitude_variable_plot(
-            df["latitude"],
-            df["observation_value"],
-            df["quality_flag"],
-            filename=os.path.join(
-                params.level_ql_path, f"{table}_{params.fileID}_lat_var.png"
-            ),
+        data_dict_add, data_dict_buoy = create_additional_dicts(
+            data_dict_qc, tables_in, params
         )
-        pqo.latitude_longitude_plot(
-            df["latitude"],
-            df["longitude"],
-            df["quality_flag"],
-            filename=os.path.join(
-                params.level_ql_path, f"{table}_{params.fileID}_lat_lon.png"
-            ),
+        # Index positions of the month window once for all grouped checks
+        grid_index = GridIndex.from_header(
+            data_dict_qc["header"], data_dict_add["header"], data_dict_buoy["header"]
         )
 
-    write_cdm_tables(params, df, tables=table)
+    # Perform QC
+    qc_flags = do_qc(
+        data_dict_qc=data_dict_qc,
+        qc_flags=qc_flags,
+        params=params,
+        ext_path=ext_path,
+        data_dict_add=data_dict_add,
+        data_dict_buoy=data_dict_buoy,
+        perform_qc=not params.no_qc_suite,
+        grid_index=grid_index,
+    )
+
+    # Optionally, copy quality_flags
+    if params.no_qc_suite is False and params.qc_settings["copies"]:
+        for table, table_cp in params.qc_settings["copies"].items():
+            if table in data_dict.keys():
+                qc_flags.copy_flags(table, table_cp)
+            else:
+                logging.warning(f"Could not copy {table}.")
+
+    # Update data_dict with reworked QC columns
+    qc_flags.update_data_dict(data_dict)
 
-# CHECKOUT --------------------------------------------------------------------
-logging.info("Saving json quicklook")
-save_quicklook(params, ql_dict, date_handler)
+    # WRITE QC FLAGS TO DATA --------------------------------------------------
+    for table, df in data_dict.items():
+        if table == "header":
+            ql_dict[table]["report_quality_flag"] = value_counts(df["report_quality"])
+            ql_dict[table]["location_quality_flag"] = value_counts(
+                df["location_quality"]
+            )
+            ql_dict[table]["report_time_quality_flag"] = value_counts(
+                df["report_time_quality"]
+            )
+        else:
+            ql_dict[table]["quality_flag"] = value_counts(df["quality_flag"])
+            plot_quicklooks(df, table, params)
+
+        write_cdm_tables(params, df, tables=table)
+
+    # CHECKOUT ----------------------------------------------------------------
+    logging.info("Saving json quicklook")
+    save_quicklook(params, ql_dict, date_handler)
+    return 0
+
+
+if __name__ == "__main__":
+    reload(logging)  # This is to override potential previous config of logging
+    logging.basicConfig(
+        format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
+        level=logging.INFO,
+        datefmt="%Y%m%d %H:%M:%S",
+        filename=None,
+    )
+    sys.exit(run(script_setup(process_options, sys.argv)))
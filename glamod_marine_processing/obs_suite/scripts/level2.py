@@ -11,6 +11,10 @@ Outputs excluded data to /<data_path>/<release>/<source>/level2/excluded/<sid-dc
 
 where fileID is yyyy-mm-release_tag-update_tag
 
+With transfer_mode "manifest", only outputs the selection manifest
+/<data_path>/<release>/<source>/level2/<sid-dck>/manifest.json listing the
+included and excluded level1e files.
+
 Before processing starts:
     - checks the existence of input data subdirectory in level1e -> exits if fails
     - checks the existence of the level2 selection file (level2_list) and that
@@ -42,123 +46,259 @@ json file as created by L2_list_create.py.
 
 from __future__ import annotations
 
-import glob
+import errno
 import json
 import logging
 import os
+import re
 import shutil
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from importlib import reload
-from pathlib import Path
 
 from _utilities import paths_exist, script_setup
 
-reload(logging)  # This is to override potential previous config of logging
+from glamod_marine_processing.utilities import manifest_file, save_json
+
+process_options = ["transfer_mode", "transfer_workers"]
+
+# Out of release periods
+left_min_period = 1600
+right_max_period = 2100
+date_pattern = re.compile(r"(\d{4})-..-")
 
 
 # FUNCTIONS -------------------------------------------------------------------
-def copyfiles(pattern, dest, mode="excluded"):
-    """Copy file pattern to dest."""
-    file_list = glob.glob(pattern)
-    for file_ in file_list:
-        file_name = Path(file_).name
-        shutil.copyfile(file_, os.path.join(dest, file_name))
+def list_files(path, ext=".pq"):
+    """List non-hidden file names with extension ext in path."""
+    with os.scandir(path) as entries:
+        return sorted(
+            entry.name
+            for entry in entries
+            if entry.is_file()
+            and entry.name.endswith(ext)
+            and not entry.name.startswith(".")
+        )
+
+
+def get_year(file_name):
+    """Get year of yyyy-mm file ID from file name."""
+    match = date_pattern.search(file_name)
+    if match is None:
+        return
+    return int(match.group(1))
+
+
+def select_files(file_names, include_tables, exclude_tables, year_init, year_end):
+    """Assign file names to the included or excluded level2 data.
+
+    Files of excluded tables and files out of the release period are
+    excluded. Files of included tables within the release period are
+    included. Other files are not transferred. Returns dictionaries of
+    file names and selection reasons.
+    """
+    period = f"{year_init}-{year_end}"
+    included = {}
+    excluded = {}
+    for file_name in file_names:
+        year = get_year(file_name)
+        if any(file_name.startswith(table) for table in exclude_tables):
+            excluded[file_name] = "params_exclude"
+        elif year is None:
+            continue
+        elif year_init <= year <= year_end:
+            if any(file_name.startswith(f"{table}-") for table in include_tables):
+                included[file_name] = f"in release period {period}"
+        elif left_min_period <= year <= right_max_period:
+            excluded[file_name] = f"out of release period {period}"
+    return included, excluded
+
+
+def copy_file(src, dst):
+    """Copy src to dst within the kernel.
+
+    Filesystems supporting it share the data blocks (reflink) or copy
+    server-side.
+    """
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            while size > 0:
+                n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size)
+                if n == 0:
+                    break
+                size -= n
+    except (AttributeError, OSError):
+        shutil.copyfile(src, dst)
+
+
+def link_file(src, dst):
+    """Hardlink src to dst, copy if both are on different filesystems."""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError as err:
+        if err.errno not in [errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP]:
+            raise
+        copy_file(src, dst)
+
+
+def write_manifest(included, excluded, params):
+    """Write selection manifest instead of transferring files.
+
+    Readers of the level2 data resolve the included files to the level1e
+    directory through the manifest.
+    """
+    manifest = {
+        "sid_dck": params.sid_dck,
+        "source_directory": os.path.abspath(params.prev_level_path),
+        "level2_list": params.level2_list,
+        "included": included,
+        "excluded": excluded,
+    }
+    manifest_path = os.path.join(params.level_path, manifest_file)
+    save_json(manifest, manifest_path, indent=2)
+    logging.info(
+        f"{len(included)} files included and {len(excluded)} files excluded "
+        f"from level2 in {manifest_path}"
+    )
+
+
+def transfer_files(
+    file_names, source, dest, transfer_mode="copy", n_workers=8, mode="excluded"
+):
+    """Transfer file names from source to dest in parallel."""
+    transfer = link_file if transfer_mode == "link" else copy_file
+
+    def _transfer(file_name):
+        transfer(
+            os.path.join(source, file_name),
+            os.path.join(dest, file_name),
+        )
         logging.info(f"{file_name} {mode} from level2 in {dest}")
 
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        list(executor.map(_transfer, file_names))
 
-# MAIN ------------------------------------------------------------------------
 
-# Process input and set up some things and make sure we can do something-------
-logging.basicConfig(
-    format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
-    level=logging.INFO,
-    datefmt="%Y%m%d %H:%M:%S",
-    filename=None,
-)
+def get_release_period(include_list, params):
+    """Get first and last year of the release period of sid-dck."""
+    if not include_list.get(params.sid_dck):
+        logging.warning(
+            f"sid-dck {params.sid_dck} not registered in level2 list {params.level2_list}"
+        )
+        year_init = int(include_list.get("year_init"))
+        year_end = int(include_list.get("year_end"))
+    else:
+        # See if global release period has been changed for level 2 and apply to sid-dck
+        # For some strange reason the years are strings in the periods files...
+        year_init = int(include_list[params.sid_dck].get("year_init"))
+        year_end = int(include_list[params.sid_dck].get("year_end"))
 
-params = script_setup([], sys.argv)
+    init_global = int(include_list.get("year_init"))
+    end_global = int(include_list.get("year_end"))
 
-# These to build the brace expansions for the out of release periods
-left_min_period = 1600
-right_max_period = 2100
+    if init_global:
+        year_init = year_init if year_init >= int(init_global) else int(init_global)
+    if end_global:
+        year_end = year_end if year_end <= int(end_global) else int(end_global)
 
-paths_exist([params.level_excluded_path, params.level_reports_path])
+    if params.year_init:
+        year_init = int(params.year_init)
+    if params.year_end:
+        year_end = int(params.year_end)
+    return year_init, year_end
 
-# DO THE DATA SELECTION -------------------------------------------------------
-# -----------------------------------------------------------------------------
-cdm_tables = params.cdm_tables
-obs_tables = [x for x in cdm_tables if x != "header"]
 
-with open(params.level2_list) as fileObj:
-    include_list = json.load(fileObj)
+def run(params):
+    """Select level2 data of one sid-dck month, return exit status."""
+    transfer_mode = params.transfer_mode or "copy"
+    if transfer_mode not in ["copy", "link", "manifest"]:
+        logging.error(
+            f"Unknown transfer_mode: {transfer_mode}. Use 'copy', 'link' or 'manifest'."
+        )
+        return 1
+    n_workers = int(params.transfer_workers or 8)
 
-if not include_list.get(params.sid_dck):
-    logging.warning(
-        f"sid-dck {params.sid_dck} not registered in level2 list {params.level2_list}"
+    paths_exist([params.level_excluded_path, params.level_reports_path])
+
+    # DO THE DATA SELECTION ---------------------------------------------------
+    # -------------------------------------------------------------------------
+    cdm_tables = params.cdm_tables
+    obs_tables = [x for x in cdm_tables if x != "header"]
+
+    with open(params.level2_list) as fileObj:
+        include_list = json.load(fileObj)
+
+    year_init, year_end = get_release_period(include_list, params)
+
+    exclude_sid_dck = include_list.get(params.sid_dck, {}).get("exclude")
+
+    exclude_param_global_list = include_list.get("params_exclude", [])
+    exclude_param_sid_dck_list = include_list.get(params.sid_dck, {}).get(
+        "params_exclude", []
     )
-    year_init = int(include_list.get("year_init"))
-    year_end = int(include_list.get("year_end"))
-else:
-    # See if global release period has been changed for level 2 and apply to sid-dck
-    # For some strange reason the years are strings in the periods files...
-    year_init = int(include_list[params.sid_dck].get("year_init"))
-    year_end = int(include_list[params.sid_dck].get("year_end"))
-
-init_global = int(include_list.get("year_init"))
-end_global = int(include_list.get("year_end"))
-
-if init_global:
-    year_init = year_init if year_init >= int(init_global) else int(init_global)
-if end_global:
-    year_end = year_end if year_end <= int(end_global) else int(end_global)
-
-if params.year_init:
-    year_init = int(params.year_init)
-if params.year_end:
-    year_end = int(params.year_end)
-
-exclude_sid_dck = include_list.get(params.sid_dck, {}).get("exclude")
-
-exclude_param_global_list = include_list.get("params_exclude", [])
-exclude_param_sid_dck_list = include_list.get(params.sid_dck, {}).get(
-    "params_exclude", []
-)
-
-exclude_param_list = list(set(exclude_param_global_list + exclude_param_sid_dck_list))
-include_param_list = [x for x in obs_tables if x not in exclude_param_list]
-
-# Check that inclusion list makes sense
-if not exclude_sid_dck and len(include_param_list) == 0:
-    logging.error(
-        f"sid-dck {params.sid_dck} is to be included, but include parameter list is empty"
+
+    exclude_param_list = list(
+        set(exclude_param_global_list + exclude_param_sid_dck_list)
     )
-    sys.exit(1)
-try:
-    include_param_list.append("header")
-    if exclude_sid_dck:
-        for table in cdm_tables:
-            pattern = os.path.join(params.prev_level_path, table + "*.pq")
-            copyfiles(pattern, params.level_excluded_path)
-    else:
-        for table in exclude_param_list:
-            pattern = os.path.join(params.prev_level_path, table + "*.pq")
-            copyfiles(pattern, params.level_excluded_path)
-        for table in include_param_list:
-            for year in range(year_init, year_end + 1):
-                pattern = os.path.join(
-                    params.prev_level_path, f"{table}-*{str(year)}-??-*.pq"
+    include_param_list = [x for x in obs_tables if x not in exclude_param_list]
+
+    # Check that inclusion list makes sense
+    if not exclude_sid_dck and len(include_param_list) == 0:
+        logging.error(
+            f"sid-dck {params.sid_dck} is to be included, but include parameter list is empty"
+        )
+        return 1
+    try:
+        include_param_list.append("header")
+        file_names = list_files(params.prev_level_path)
+        if exclude_sid_dck:
+            included = {}
+            excluded = {
+                file_name: "exclude"
+                for file_name in file_names
+                if any(file_name.startswith(table) for table in cdm_tables)
+            }
+        else:
+            included, excluded = select_files(
+                file_names, include_param_list, exclude_param_list, year_init, year_end
+            )
+        if transfer_mode == "manifest":
+            write_manifest(included, excluded, params)
+        else:
+            manifest_path = os.path.join(params.level_path, manifest_file)
+            if os.path.isfile(manifest_path):
+                os.remove(manifest_path)
+            for file_names, dest, mode in [
+                (included, params.level_path, "included"),
+                (excluded, params.level_excluded_path, "excluded"),
+            ]:
+                transfer_files(
+                    file_names,
+                    params.prev_level_path,
+                    dest,
+                    transfer_mode=transfer_mode,
+                    n_workers=n_workers,
+                    mode=mode,
                 )
-                copyfiles(pattern, params.level_path, mode="included")
-
-        # Send out of release period to excluded
-        for year in range(left_min_period, year_init):
-            pattern = os.path.join(params.prev_level_path, f"*{str(year)}-??-*.pq")
-            copyfiles(pattern, params.level_excluded_path)
-        for year in range(year_end + 1, right_max_period + 1):
-            pattern = os.path.join(params.prev_level_path, f"*{str(year)}-??-*.pq")
-            copyfiles(pattern, params.level_excluded_path)
-
-    logging.info("Level2 data successfully created")
-except Exception:
-    logging.error("Error creating level2 data", exc_info=True)
-    logging.info(f"Level2 data {params.sid_dck} removed")
+
+        logging.info("Level2 data successfully created")
+    except Exception:
+        logging.error("Error creating level2 data", exc_info=True)
+        logging.info(f"Level2 data {params.sid_dck} removed")
+        return 1
+    return 0
+
+
+# MAIN ------------------------------------------------------------------------
+if __name__ == "__main__":
+    reload(logging)  # This is to override potential previous config of logging
+    logging.basicConfig(
+        format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
+        level=logging.INFO,
+        datefmt="%Y%m%d %H:%M:%S",
+        filename=None,
+    )
+    sys.exit(run(script_setup(process_options, sys.argv)))
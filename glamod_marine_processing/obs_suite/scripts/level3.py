@@ -7,6 +7,11 @@ Outputs included data to /<data_path>/<release>/<source>/level3/<sid-dck>/table[
 
 where fileID is yyyy-mm-release_tag-update_tag
 
+With output_mode "dataset", outputs are written to the hive-partitioned
+parquet dataset of the release instead:
+
+/<data_path>/<release>/<source>/level3/dataset/year=yyyy/month=m/observed_variable=v/
+
 Before processing starts:
     - checks the existence of input data subdirectory in level2 -> exits if fails
     - checks the existence of the level3 selection file (level3_list) and that
@@ -28,96 +33,185 @@ source: source dataset identifier
 
 from __future__ import annotations
 
-import datetime
 import logging
 import os
 import sys
 from importlib import reload
 
-import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from _utilities import (
     level3_columns,
     level3_conversions,
+    level3_fields,
     level3_mappings,
+    level3_schema,
     read_cdm_tables,
     script_setup,
-    write_cdm_tables,
 )
 
-reload(logging)  # This is to override potential previous config of logging
+from glamod_marine_processing.dataset import write_partitions
+from glamod_marine_processing.dataset.dataset import remove_partitions
+
+process_options = ["output_mode"]
 
 
 # FUNCTIONS -------------------------------------------------------------------
-def process_table(table_df):
-    """Process table."""
-    tables = table_df.columns.get_level_values(0).unique().tolist()
-    header_mappings = level3_mappings["header"]
-    observations_mappings = level3_mappings["observations"]
+def cast_level3_columns(table):
+    """Cast level3 columns of arrow table to the level3 types."""
+    fields = [
+        level3_fields.field(name) if name in level3_fields.names else field
+        for name, field in zip(table.column_names, table.schema)
+    ]
+    return table.cast(pa.schema(fields))
 
-    insitu_df = None
 
-    header_df = table_df["header"][list(header_mappings.values())].copy()
-    header_df.columns = [c for c in header_mappings.keys()]
+def get_header_table(header_df):
+    """Map and convert header columns to a level3 arrow table.
 
+    The header_position column holds the row order of the reports.
+    """
+    header_mappings = level3_mappings["header"]
+    header_df = header_df[list(header_mappings.values())].copy()
+    header_df.columns = list(header_mappings.keys())
     for column, func in level3_conversions.items():
         header_df[column] = func(header_df[column])
+    table = cast_level3_columns(pa.Table.from_pandas(header_df, preserve_index=False))
+    return table.append_column("header_position", pa.array(np.arange(len(table))))
+
+
+def get_observations_table(header_table, obs_df):
+    """Join level3 observations with the header table by report_id.
+
+    Rows are ordered as the header reports, followed by reports only
+    available in the observations table. Observations without a value
+    are dropped.
+    """
+    observations_mappings = level3_mappings["observations"]
+    obs_df = obs_df[["report_id"] + list(observations_mappings.values())].copy()
+    obs_df.columns = ["report_id"] + list(observations_mappings.keys())
+    table = cast_level3_columns(pa.Table.from_pandas(obs_df, preserve_index=False))
+    table = table.append_column("obs_position", pa.array(np.arange(len(table))))
+    table = table.filter(pc.is_valid(table["observation_value"]))
+    table = table.join(header_table, "report_id", join_type="left outer")
+    table = table.sort_by(
+        [
+            ("header_position", "ascending", "at_end"),
+            ("obs_position", "ascending", "at_end"),
+        ]
+    )
+    return table.select(level3_columns).cast(level3_schema)
+
+
+def get_dataset_table(table, params):
+    """Add the dataset partition columns to level3 observations."""
+    table = table.append_column(
+        "year", pa.array(np.full(len(table), int(params.year), dtype="int16"))
+    )
+    return table.append_column(
+        "month", pa.array(np.full(len(table), int(params.month), dtype="int8"))
+    )
+
+
+def process_dataset(header_df, tables, params):
+    """Process table into the level3 dataset.
+
+    Observations tables are joined with the header one by one and
+    written to the partitions of the deck and month. Partition files
+    of a previous run are removed first.
+    """
+    header_table = get_header_table(header_df)
+
+    basename = "-".join([params.dataset, params.sid_dck, params.fileID])
+    remove_partitions(params.level_dataset_path, basename)
 
     for table in tables:
         if table == "header":
             continue
 
-        obs_df = table_df[table][list(observations_mappings.values())].copy()
-        obs_df.columns = [c for c in observations_mappings.keys()]
-        obs_df = pd.concat([header_df, obs_df], axis=1)
-        obs_df = obs_df[level3_columns]
-        obs_df = obs_df.dropna(subset=["observation_value"], ignore_index=True)
+        obs_db = read_cdm_tables(params, table)
+        if obs_db.empty:
+            continue
+
+        obs_table = get_observations_table(header_table, obs_db[table])
+        if obs_table.num_rows == 0:
+            continue
+
+        write_partitions(
+            get_dataset_table(obs_table, params),
+            params.level_dataset_path,
+            f"{basename}-{table}",
+        )
 
-        if insitu_df is None:
-            insitu_df = obs_df
-        else:
-            insitu_df = pd.concat([insitu_df, obs_df], axis=0)
 
-    insitu_df[insitu_df.select_dtypes("int").columns] = insitu_df.select_dtypes(
-        "int"
-    ).astype("Int64")
-    insitu_df[insitu_df.select_dtypes("float").columns] = insitu_df.select_dtypes(
-        "float"
-    ).astype("Float64")
+def process_table(header_df, tables, params):
+    """Process table.
+
+    Observations tables are joined with the header one by one and
+    written to the level3 file as one row group per observations table.
+    """
+    header_table = get_header_table(header_df)
 
     outname = os.path.join(
         params.level_path,
-        f"insitu-surface-marine_{params.year}-{params.month}",
+        f"insitu-surface-marine_{params.year}-{params.month}.pq",
     )
 
-    write_cdm_tables(
-        params,
-        insitu_df,
-        tables="all_observations",
-        outname=outname,
-    )
+    writer = None
+    try:
+        for table in tables:
+            if table == "header":
+                continue
 
+            obs_db = read_cdm_tables(params, table)
+            if obs_db.empty:
+                continue
 
-# MAIN ------------------------------------------------------------------------
+            obs_table = get_observations_table(header_table, obs_db[table])
+            if obs_table.num_rows == 0:
+                continue
+
+            if writer is None:
+                writer = pq.ParquetWriter(outname, level3_schema, compression="snappy")
+            writer.write_table(obs_table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        logging.warning(f"No observations available for: {params.prev_fileID}.")
+        return
+    logging.info(f"Output file written: {outname}.")
 
-# Process input and set up some things and make sure we can do something-------
-logging.basicConfig(
-    format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
-    level=logging.INFO,
-    datefmt="%Y%m%d %H:%M:%S",
-    filename=None,
-)
 
-params = script_setup([], sys.argv)
+def run(params):
+    """Write level3 observations of one sid-dck month, return exit status."""
+    output_mode = params.output_mode or "file"
+    if output_mode not in ["file", "dataset"]:
+        logging.error(f"Unknown output_mode: {output_mode}. Use 'file' or 'dataset'.")
+        return 1
 
-# DO THE DATA SELECTION -------------------------------------------------------
-# -----------------------------------------------------------------------------
-try:
-    history_tstmp = datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%d %H:%M:%S")
-except AttributeError:  # for python < 3.11
-    history_tstmp = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    header_db = read_cdm_tables(params, "header")
+    if header_db.empty:
+        logging.warning(f"No CDM tables available for: {params.prev_fileID}.")
+        return 0
 
-table_df = read_cdm_tables(params, params.cdm_tables)
-if not table_df.empty:
-    process_table(table_df)
-else:
-    logging.warning(f"No CDM tables available for: {params.prev_fileID}.")
+    if output_mode == "dataset":
+        process_dataset(header_db["header"], params.cdm_tables, params)
+    else:
+        process_table(header_db["header"], params.cdm_tables, params)
+    return 0
+
+
+# MAIN ------------------------------------------------------------------------
+if __name__ == "__main__":
+    reload(logging)  # This is to override potential previous config of logging
+    logging.basicConfig(
+        format="%(levelname)s\t[%(asctime)s](%(filename)s)\t%(message)s",
+        level=logging.INFO,
+        datefmt="%Y%m%d %H:%M:%S",
+        filename=None,
+    )
+    sys.exit(run(script_setup(process_options, sys.argv)))
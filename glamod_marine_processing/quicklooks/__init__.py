@@ -0,0 +1,5 @@
+"""GLAMOD marine processing quicklook plotting package."""
+
+from __future__ import annotations
+
+from .quicklooks import plot_quicklooks  # noqa
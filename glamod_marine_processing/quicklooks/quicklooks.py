@@ -0,0 +1,203 @@
+"""Bin QC outcomes and render quicklook plots off the main processing path."""
+
+from __future__ import annotations
+
+import glob
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+plot_suffix = "_plot.pq"
+
+flag_categories = ["0", "1", "other"]
+
+colours = {
+    "0": "#55ff55",
+    "1": "#ff5555",
+    "other": "#808080",
+}
+
+plot_settings = {
+    "lat_lon": {
+        "xlabel": "Longitude",
+        "ylabel": "Latitude",
+        "xlim": [-180.0, 180.0],
+        "ylim": [-90.0, 90.0],
+    },
+    "lat_var": {
+        "xlabel": "Variable",
+        "ylabel": "Latitude",
+        "xlim": None,
+        "ylim": [-90.0, 90.0],
+    },
+}
+
+
+def get_flag_category(flags):
+    """Map QC flags to flag categories 0, 1 and other."""
+    flags = pd.Series(flags)
+    category = pd.Series("other", index=flags.index)
+    category[flags == 0] = "0"
+    category[flags == 1] = "1"
+    return category
+
+
+def bin_counts(xvalue, yvalue, category, xbins, ybins, plot):
+    """Count observations per x bin, y bin and flag category."""
+    xcenters = (xbins[:-1] + xbins[1:]) / 2
+    ycenters = (ybins[:-1] + ybins[1:]) / 2
+    valid = np.isfinite(xvalue) & np.isfinite(yvalue)
+    counts = []
+    for flag in flag_categories:
+        mask = valid & (category == flag)
+        hist, _, _ = np.histogram2d(xvalue[mask], yvalue[mask], bins=[xbins, ybins])
+        ix, iy = np.nonzero(hist)
+        counts.append(
+            pd.DataFrame(
+                {
+                    "plot": plot,
+                    "flag": flag,
+                    "x": xcenters[ix],
+                    "y": ycenters[iy],
+                    "count": hist[ix, iy].astype("int64"),
+                }
+            )
+        )
+    return pd.concat(counts, ignore_index=True)
+
+
+def bin_qc_outcomes(lat, lon, value, flags, nbins_value=200):
+    """Bin QC outcomes of one observations table for quicklook plots.
+
+    Parameters
+    ----------
+    lat: pd.Series
+        Latitudes in degrees.
+    lon: pd.Series
+        Longitudes in degrees.
+    value: pd.Series
+        Observation values.
+    flags: pd.Series
+        QC flags.
+    nbins_value: int
+        Number of observation value bins.
+
+    Returns
+    -------
+    pd.DataFrame
+        Counts per plot, bin centers (x, y) and flag category.
+    """
+    lat = pd.to_numeric(pd.Series(lat), errors="coerce").to_numpy()
+    lon = pd.to_numeric(pd.Series(lon), errors="coerce").to_numpy()
+    lon = (lon + 180.0) % 360.0 - 180.0
+    value = pd.to_numeric(pd.Series(value), errors="coerce").to_numpy()
+    category = get_flag_category(flags).to_numpy()
+
+    lat_bins = np.arange(-90.0, 91.0, 1.0)
+    lon_bins = np.arange(-180.0, 181.0, 1.0)
+    binned = [bin_counts(lon, lat, category, lon_bins, lat_bins, "lat_lon")]
+
+    valid = np.isfinite(value)
+    if valid.any():
+        vmin = np.min(value[valid])
+        vmax = np.max(value[valid])
+        if vmin == vmax:
+            vmin, vmax = vmin - 0.5, vmax + 0.5
+        value_bins = np.linspace(vmin, vmax, nbins_value + 1)
+        binned.append(bin_counts(value, lat, category, value_bins, lat_bins, "lat_var"))
+
+    return pd.concat(binned, ignore_index=True)
+
+
+def write_binned_qc_outcomes(lat, lon, value, flags, filename):
+    """Bin QC outcomes and write them to parquet file."""
+    binned = bin_qc_outcomes(lat, lon, value, flags)
+    binned.to_parquet(filename, index=False, engine="pyarrow")
+    logging.info(f"Quicklook plot input written: {filename}.")
+
+
+def render_binned_qc_outcomes(binned, plot, filename):
+    """Render binned QC outcomes in the layout of marine_qc quicklook plots."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib import lines
+
+    settings = plot_settings[plot]
+    binned = binned[binned["plot"] == plot]
+    totals = binned.groupby("flag")["count"].sum()
+
+    fig, axes = plt.subplots(2, 2, figsize=(16, 9), sharex=True, sharey=True)
+    axes = axes.flatten()
+    titles = ["QC == 0 (Passed)", "QC == 1 (Failed)", "QC == Other", "All Points"]
+    selections = [["0"], ["1"], ["other"], flag_categories]
+
+    for ax, title, selection in zip(axes, titles, selections):
+        for flag in selection:
+            subset = binned[binned["flag"] == flag]
+            ax.scatter(subset["x"], subset["y"], c=colours[flag], s=1)
+        ax.set_title(title)
+        ax.set_xlabel(settings["xlabel"])
+        ax.set_ylabel(settings["ylabel"])
+        if settings["xlim"]:
+            ax.set_xlim(*settings["xlim"])
+        if settings["ylim"]:
+            ax.set_ylim(*settings["ylim"])
+
+    legend_elements = [
+        lines.Line2D(
+            [0],
+            [0],
+            marker="o",
+            color="w",
+            label=f"{flag}: {int(totals.get(flag, 0))}",
+            markerfacecolor=colours[flag],
+        )
+        for flag in flag_categories
+    ]
+    fig.legend(
+        handles=legend_elements,
+        loc="center",
+        ncol=len(legend_elements),
+        bbox_to_anchor=(0.5, 0.53),
+    )
+    plt.tight_layout(rect=(0.0, 0.05, 1.0, 1.0))
+    plt.savefig(filename)
+    plt.close(fig)
+
+
+def render_file(ifile, overwrite=False):
+    """Render all quicklook plots of one binned QC outcome file."""
+    prefix = ifile[: -len(plot_suffix)]
+    binned = pd.read_parquet(ifile)
+    for plot in plot_settings.keys():
+        filename = f"{prefix}_{plot}.png"
+        if overwrite is False and os.path.isfile(filename):
+            continue
+        render_binned_qc_outcomes(binned, plot, filename)
+        logging.info(f"Quicklook plot written: {filename}.")
+
+
+def plot_quicklooks(idir, n_jobs=1, overwrite=False):
+    """Render quicklook plots from binned QC outcome files.
+
+    Parameters
+    ----------
+    idir: str
+        Quicklook directory. Binned QC outcome files are searched recursively.
+    n_jobs: int
+        Number of files rendered in parallel.
+    overwrite: bool
+        If True, overwrite already existing plots.
+    """
+    file_list = sorted(
+        glob.glob(os.path.join(idir, "**", f"*{plot_suffix}"), recursive=True)
+    )
+    logging.info(f"Render quicklook plots of {len(file_list)} files in {idir}")
+    Parallel(n_jobs=int(n_jobs))(
+        delayed(render_file)(ifile, overwrite=overwrite) for ifile in file_list
+    )
@@ -3,146 +3,147 @@
 from __future__ import annotations
 
 import glob
-import itertools
 import os
 from pathlib import Path
+from warnings import warn
 
 import pandas as pd
-from cdm_reader_mapper import read_tables
-from cdm_reader_mapper.cdm_mapper import properties
 from joblib import Parallel, delayed
 
+from ..merge.merge import data_formats
+from ..utilities import load_json
 
-def get_year_month(df, time_axis):
-    """Group dataframe by year-month."""
-    dates = df[time_axis]
-    dates_pd = pd.DatetimeIndex(dates)
-    return dates_pd.to_period("M")
+deck_pattern = r"(\d{3}-\d{3})"
 
 
-def get_file_dict(file_list):
-    """Convert data file list to data file dict. Keys: file names."""
-    file_dict = {}
-    for ifile in file_list:
-        ifile_name = Path(ifile).name
-        if ifile_name in file_dict.keys():
-            file_dict[ifile_name].append(ifile)
-        else:
-            file_dict[ifile_name] = [ifile]
-    return file_dict
+def read_file(ifile):
+    """Read table file, text files as strings."""
+    if data_formats.get(Path(ifile).suffix) == "parquet":
+        return pd.read_parquet(ifile)
+    return pd.read_csv(ifile, sep="|", dtype="object", keep_default_na=False)
 
 
-def concat_unknow_date_files(idir, odir, table, release, update, prev_deck_list):
-    """Open files and concat them."""
-    if table == "header":
-        time_axis = "report_timestamp"
+def write_file(df, oname):
+    """Write table file, choose format from file extension."""
+    if data_formats.get(Path(oname).suffix) == "parquet":
+        df.to_parquet(oname, index=False)
     else:
-        time_axis = "date_time"
-    for prev_deck in prev_deck_list:
-        table_dir = os.path.join(idir, prev_deck)
-        table_df = read_tables(table_dir, cdm_subset=table)
-        if table_df.empty:
-            continue
-        next = False
-        try:
-            table_df = table_df[table]
-        except KeyError:
-            next = True
-        if next is True:
-            continue
-        year_month = get_year_month(table_df, time_axis)
-        for ym, df in table_df.groupby(year_month):
-            oname = os.path.join(odir, f"{table}-{ym}-{release}-{update}.psv")
-            header = None
-            mode = "a"
-            if not os.path.isfile(oname):
-                mode = "w"
-                header = df.columns
-            df.to_csv(oname, sep="|", header=header, mode=mode, index=False)
-
-
-def concat_known_date_files(idir, odir, table, release, update, prev_deck_list):
-    """Concat file with subprocess."""
-    file_list = [
-        glob.glob(os.path.join(idir, prev_deck, f"{table}-*"))
-        for prev_deck in prev_deck_list
-    ]
-    file_list = list(itertools.chain(*file_list))
-    file_dict = get_file_dict(file_list)
-    for name, flist in file_dict.items():
-        with open(os.path.join(odir, name), "w") as outfile:
-            i = 0
-            for fname in flist:
-                if i > 0:
-                    skip = 1
-                else:
-                    skip = 0
-                with open(fname) as infile:
-                    for line in itertools.islice(infile, skip, None):
-                        outfile.write(line)
-                i += 1
+        df.to_csv(oname, sep="|", index=False)
+
+
+def load_mapping(mapping):
+    """Load report_id to sid-dck mapping.
+
+    mapping is either a dictionary, a JSON file or a table file with
+    columns report_id and sid_dck.
+    """
+    if mapping is None or isinstance(mapping, pd.Series):
+        return mapping
+    if isinstance(mapping, dict):
+        return pd.Series(mapping)
+    if Path(mapping).suffix == ".json":
+        return pd.Series(load_json(mapping))
+    return read_file(mapping).set_index("report_id")["sid_dck"]
+
+
+def get_decks(header_df, mapping=None, column="source_id", pattern=deck_pattern):
+    """Get sid-dck of each report, indexed by report_id.
+
+    Without mapping, sid-dck is extracted from column with pattern.
+    """
+    if mapping is not None:
+        decks = header_df["report_id"].map(mapping)
+    else:
+        decks = header_df[column].astype("string").str.extract(pattern, expand=False)
+    decks.index = header_df["report_id"]
+    return decks[~decks.index.duplicated()]
+
+
+def split_df(df, odir, name, decks, deck_list):
+    """Write rows of table to the sid-dck directories of their reports."""
+    if "report_id" not in df.columns:
+        warn(f"No report_id column in {name}. Skip splitting.")
+        return
+    df_decks = df["report_id"].map(decks)
+    for sid_dck, group in df.groupby(df_decks, sort=False):
+        if sid_dck in deck_list:
+            write_file(group, os.path.join(odir, sid_dck, name))
+
+
+def split_file_id(idir, odir, header_name, deck_list, mapping, column, pattern):
+    """Split header file and all table files of the same file ID."""
+    header_df = read_file(os.path.join(idir, header_name))
+    decks = get_decks(header_df, mapping=mapping, column=column, pattern=pattern)
+    n_unknown = (~decks.isin(deck_list)).sum()
+    if n_unknown > 0:
+        warn(f"{n_unknown} reports of {header_name} not assigned to any sid-dck.")
+
+    split_df(header_df, odir, header_name, decks, deck_list)
+    suffix = header_name[len("header-") :]
+    for ifile in sorted(glob.glob(os.path.join(idir, f"*-{suffix}"))):
+        name = Path(ifile).name
+        if name != header_name:
+            split_df(read_file(ifile), odir, name, decks, deck_list)
 
 
 def split(
     idir,
     odir,
-    release=None,
-    update=None,
-    prev_deck_list=None,
-    date_avail=False,
-    cdm_tables=True,
+    deck_list,
+    mapping=None,
+    column="source_id",
+    pattern=deck_pattern,
     parallel=False,
     overwrite=False,
 ):
-    """Split decks from single deck into new multiple deck list.
+    """Split single deck into new multiple deck list.
+
+    Reports are routed to their sid-dck via a report_id to sid-dck mapping
+    or via a header column. Rows of all other tables follow by report_id.
+    Each file ID (header-<file ID>) is read once and written to all decks.
 
     Parameters
     ----------
     idir: str
-        Input data directory
+        Input data directory of the single deck.
     odir: str
-        Output data directory
-    release: str
-        Release name.
-    update: str
-        Update name.
-    prev_deck_list: list
-        List of previous level1a decks.
-    date_avail, bool
-        Set True if date information is in file names.
-    cdm_tables: bool
-        Use cdm table names.
+        Output data directory holding the sid-dck directories.
+    deck_list: list
+        List of new decks.
+    mapping: dict or str, optional
+        report_id to sid-dck mapping or file holding it
+        (JSON or table with columns report_id and sid_dck).
+    column: str
+        Header column to extract sid-dck from if no mapping is given.
+    pattern: str
+        Regular expression to extract sid-dck from column.
     parallel: bool
-        Compute tables in parallel.
+        Compute file IDs in parallel.
     overwrite: bool
         If True, overwrite already existing files.
     """
-    if prev_deck_list is None:
-        prev_deck_list = [
-            Path(x).name for x in glob.glob(os.path.join(idir, "log", "*"))
+    if isinstance(deck_list, str):
+        deck_list = [deck_list]
+    for sid_dck in deck_list:
+        os.makedirs(os.path.join(odir, sid_dck), exist_ok=True)
+    mapping = load_mapping(mapping)
+
+    header_names = []
+    for ifile in sorted(glob.glob(os.path.join(idir, "header-*"))):
+        header_name = Path(ifile).name
+        exist = [
+            os.path.isfile(os.path.join(odir, sid_dck, header_name))
+            for sid_dck in deck_list
         ]
-    if cdm_tables is True:
-        tables = properties.cdm_tables
-    else:
-        tables = ["*"]
-        parallel = False
+        if overwrite is not True and any(exist):
+            warn(f"{header_name} already split. Use overwrite to split again.")
+            continue
+        header_names.append(header_name)
 
-    if date_avail is True:
-        concat_func = concat_known_date_files
-    else:
-        concat_func = concat_unknow_date_files
-
-    kwargs = {
-        "idir": idir,
-        "odir": odir,
-        "release": release,
-        "update": update,
-        "prev_deck_list": prev_deck_list,
-    }
-
-    if parallel is True:
-        Parallel(n_jobs=len(tables))(
-            delayed(concat_func)(table=table, **kwargs) for table in tables
+    n_jobs = -1 if parallel is True else 1
+    Parallel(n_jobs=n_jobs)(
+        delayed(split_file_id)(
+            idir, odir, header_name, deck_list, mapping, column, pattern
         )
-    else:
-        [concat_func(table=table, **kwargs) for table in tables]
+        for header_name in header_names
+    )
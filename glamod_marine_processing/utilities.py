@@ -4,6 +4,8 @@ from __future__ import annotations
 
 import datetime
 import errno
+import fnmatch
+import glob
 import json
 import os
 from warnings import warn
@@ -29,12 +31,14 @@ level_subdirs = {
     "level1a": ["log", "quicklooks", "invalid", "excluded"],
     "level1b": ["log", "quicklooks"],
     "level1c": ["log", "quicklooks", "invalid"],
-    "level1d": ["log", "quicklooks"],
+    "level1d": ["log", "quicklooks", "context"],
     "level1e": ["log", "quicklooks", "reports"],
     "level2": ["log", "quicklooks", "excluded", "reports"],
     "level3": ["log", "quicklooks"],
 }
 
+manifest_file = "manifest.json"
+
 
 def make_release_source_tree(
     data_path=None,
@@ -136,6 +140,110 @@ def save_simplejson(json_dict, json_file, **kwargs):
         simplejson.dump(json_dict, f, **kwargs)
 
 
+def save_task_table(config, tasks, table_file):
+    """Save task table on disk.
+
+    The first line holds the configuration shared by all tasks, each
+    following line the task specific keys of one task including its
+    pattern.
+    """
+    with open(table_file, "w") as f:
+        f.write(json.dumps(config) + "\n")
+        for task in tasks:
+            f.write(json.dumps(task) + "\n")
+
+
+def load_task_config(config_file, pattern=None):
+    """Load task configuration from json file or from task table by pattern."""
+    if pattern is None:
+        return load_json(config_file)
+    with open(config_file) as f:
+        config = json.loads(f.readline())
+        for line in f:
+            task = json.loads(line)
+            if task["pattern"] == pattern:
+                config.update(task)
+                return config
+    raise KeyError(f"Task {pattern} not found in task table {config_file}.")
+
+
+def load_manifest(path):
+    """Load selection manifest of path if available."""
+    manifest = os.path.join(path, manifest_file)
+    if not os.path.isfile(manifest):
+        return
+    return load_json(manifest)
+
+
+def glob_manifest(path, pattern):
+    """Glob pattern in path.
+
+    If path holds a selection manifest, resolve the included files to
+    its source directory instead.
+    """
+    manifest = load_manifest(path)
+    if manifest is None:
+        return glob.glob(os.path.join(path, pattern))
+    return [
+        os.path.join(manifest["source_directory"], file_name)
+        for file_name in fnmatch.filter(manifest["included"], pattern)
+    ]
+
+
+def split_lines(filename, n_shards, out_dir, block_size=16 * 1024**2):
+    """Split text file into byte-range shards on line boundaries.
+
+    Shard boundaries are moved forward to the next line start, so that
+    each line is in exactly one shard. Empty shards are not written.
+    Returns the shard file names in input order.
+    """
+    size = os.path.getsize(filename)
+    bounds = [0]
+    with open(filename, "rb") as f:
+        for i in range(1, n_shards):
+            f.seek(max(size * i // n_shards, bounds[-1]))
+            if 0 < f.tell() < size:
+                f.seek(f.tell() - 1)
+                f.readline()
+            bounds.append(f.tell())
+        bounds.append(size)
+
+        basename = os.path.basename(filename)
+        shard_files = []
+        for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            if end <= start:
+                continue
+            shard_file = os.path.join(out_dir, f"{basename}.{i:03d}")
+            f.seek(start)
+            with open(shard_file, "wb") as g:
+                remaining = end - start
+                while remaining > 0:
+                    block = f.read(min(block_size, remaining))
+                    g.write(block)
+                    remaining -= len(block)
+            shard_files.append(shard_file)
+    return shard_files
+
+
+def add_counts(counts, other):
+    """Add nested counts of other to counts.
+
+    Numbers are summed, lists concatenated, dictionaries merged
+    recursively and any other values are kept from counts if present
+    there.
+    """
+    for key, value in other.items():
+        if key not in counts:
+            counts[key] = value
+        elif isinstance(value, dict) and isinstance(counts[key], dict):
+            add_counts(counts[key], value)
+        elif isinstance(value, list) and isinstance(counts[key], list):
+            counts[key] = counts[key] + value
+        elif isinstance(value, (int, float)) and isinstance(counts[key], (int, float)):
+            counts[key] = counts[key] + value
+    return counts
+
+
 def read_txt(txt_file):
     """Read txt file from disk."""
     with open(txt_file) as f:
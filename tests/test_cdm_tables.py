@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import os
+from types import SimpleNamespace
+
+import pandas as pd
+
+from glamod_marine_processing.obs_suite.scripts._utilities import (
+    leak_extensions,
+    read_cdm_tables,
+    table_formats,
+    write_cdm_tables,
+)
+from glamod_marine_processing.utilities import save_json
+
+fileID = "2020-01-release_8.0-000000"
+
+
+def make_tables():
+    return {
+        "header": pd.DataFrame(
+            {
+                "report_id": ["R0", "R1", "R2"],
+                "station_name": ["SHIP0", "SHIP1", "SHIP2"],
+                "longitude": [0.0, 1.0, 2.0],
+                "report_type": [0, 1, 0],
+                "report_timestamp": pd.date_range("2020-01-01", periods=3, freq="h"),
+            }
+        ),
+        "observations-at": pd.DataFrame(
+            {
+                "report_id": ["R0", "R2"],
+                "observation_value": [280.0, 281.5],
+            }
+        ),
+        "observations-sst": pd.DataFrame(
+            {
+                "report_id": ["R1"],
+                "observation_value": [290.0],
+            }
+        ),
+    }
+
+
+def write_manifest_level(tmp_path, table_format="parquet"):
+    source = tmp_path / "level1e"
+    level2 = tmp_path / "level2"
+    source.mkdir()
+    level2.mkdir()
+    params = SimpleNamespace(
+        level_path=str(source), fileID=fileID, table_format=table_format
+    )
+    for table, df in make_tables().items():
+        write_cdm_tables(params, df, tables=table)
+    ext = table_formats[table_format]
+    save_json(
+        {
+            "source_directory": str(source),
+            "included": {
+                f"header-{fileID}.{ext}": "in release period 2020-2020",
+                f"observations-at-{fileID}.{ext}": "in release period 2020-2020",
+            },
+            "excluded": {f"observations-sst-{fileID}.{ext}": "params_exclude"},
+        },
+        level2 / "manifest.json",
+    )
+    return SimpleNamespace(prev_level_path=str(level2), prev_fileID=fileID)
+
+
+def test_read_manifest_tables(tmp_path):
+    params = write_manifest_level(tmp_path)
+    tables = make_tables()
+
+    db = read_cdm_tables(params, "header")
+    pd.testing.assert_frame_equal(
+        db["header"], tables["header"], check_dtype=False, check_index_type=False
+    )
+
+    db = read_cdm_tables(params, ["header", "observations-at"])
+    assert list(db.data.columns.levels[0]) == ["header", "observations-at"]
+    assert list(db["header"]["report_id"]) == ["R0", "R1", "R2"]
+    assert list(db["observations-at"]["observation_value"].dropna()) == [
+        280.0,
+        281.5,
+    ]
+
+    assert read_cdm_tables(params, "observations-sst").empty
+    db = read_cdm_tables(params, ["header", "observations-sst"])
+    assert list(db.data.columns.levels[0]) == ["header"]
+
+
+def read_round_trip(tmp_path, table_format):
+    level_path = tmp_path / table_format
+    level_path.mkdir()
+    params = SimpleNamespace(
+        level_path=str(level_path),
+        fileID=fileID,
+        table_format=table_format,
+        prev_level_path=str(level_path),
+        prev_fileID=fileID,
+    )
+    tables = make_tables()
+    for table, df in tables.items():
+        write_cdm_tables(params, df, tables=table)
+    leak_file = str(
+        level_path / f"header-{fileID}-2019-12.{leak_extensions[table_format]}"
+    )
+    write_cdm_tables(
+        params, tables["header"], tables="header", outname=leak_file, mode=table_format
+    )
+    ext = table_formats[table_format]
+    assert sorted(os.listdir(level_path)) == sorted(
+        [f"{table}-{fileID}.{ext}" for table in tables] + [os.path.basename(leak_file)]
+    )
+    manifest_params = write_manifest_level(level_path, table_format)
+    return {
+        "table": read_cdm_tables(params, "observations-at").data,
+        "leak": read_cdm_tables(params, "header", ifile=leak_file).data,
+        "manifest": read_cdm_tables(manifest_params, "header").data,
+        "manifest_tables": read_cdm_tables(
+            manifest_params, ["header", "observations-at"]
+        ).data,
+    }
+
+
+def test_read_cdm_tables_feather(tmp_path):
+    parquet = read_round_trip(tmp_path, "parquet")
+    feather = read_round_trip(tmp_path, "feather")
+    for name, df in parquet.items():
+        assert not df.empty, name
+        pd.testing.assert_frame_equal(feather[name], df, obj=name)
+    header = feather["leak"]["header"]
+    assert list(header["report_id"]) == ["R0", "R1", "R2"]
+    assert header["report_type"].dtype == "int64"
+    assert header["report_timestamp"].dtype == "datetime64[ns]"
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import os
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from glamod_marine_processing.dataset import write_metadata, write_partitions
+from glamod_marine_processing.dataset.dataset import remove_partitions
+
+
+def get_table(n, year=2020, month=1):
+    return pa.table(
+        {
+            "report_id": [f"R{i}" for i in range(n)],
+            "report_timestamp": pa.array(
+                [(n - i) * 3600 * 10**9 for i in range(n)],
+                pa.timestamp("ns", tz="UTC"),
+            ),
+            "observed_variable": pa.array([85 + i % 2 for i in range(n)], pa.int64()),
+            "observation_value": pa.array([float(i) for i in range(n)]),
+            "year": pa.array([year] * n, pa.int16()),
+            "month": pa.array([month] * n, pa.int8()),
+        }
+    )
+
+
+def test_write_partitions(tmp_path):
+    write_partitions(get_table(6), tmp_path, "ICOADS-063-714")
+    write_partitions(get_table(4, month=2), tmp_path, "ICOADS-063-714")
+    write_partitions(get_table(2), tmp_path, "ICOADS-063-715")
+
+    assert sorted(os.listdir(tmp_path / "year=2020")) == ["month=1", "month=2"]
+    assert sorted(os.listdir(tmp_path / "year=2020" / "month=1")) == [
+        "observed_variable=85",
+        "observed_variable=86",
+    ]
+    table = pq.read_table(
+        tmp_path
+        / "year=2020"
+        / "month=1"
+        / "observed_variable=85"
+        / "ICOADS-063-714-0.parquet"
+    )
+    assert table["report_id"].to_pylist() == ["R4", "R2", "R0"]
+
+    remove_partitions(tmp_path, "ICOADS-063-714")
+    dataset = ds.dataset(tmp_path, format="parquet", partitioning="hive")
+    assert dataset.count_rows() == 2
+
+
+def test_write_metadata(tmp_path):
+    write_partitions(get_table(6), tmp_path, "ICOADS-063-714")
+    write_partitions(get_table(4, month=2), tmp_path, "ICOADS-063-715")
+    write_metadata(tmp_path)
+
+    metadata = pq.read_metadata(tmp_path / "_metadata")
+    assert metadata.num_rows == 10
+    assert metadata.num_row_groups == 4
+    assert os.path.isfile(tmp_path / "_common_metadata")
+
+    dataset = ds.parquet_dataset(tmp_path / "_metadata", partitioning="hive")
+    table = dataset.to_table(filter=ds.field("month") == 2)
+    assert table.num_rows == 4
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import time
+
+import pandas as pd
+import pytest
+
+from glamod_marine_processing.history import (
+    fit_task_model,
+    get_task_limits,
+    query_tasks,
+    record_task,
+)
+from glamod_marine_processing.obs_suite.lotus_scripts.task_recorder import (
+    count_rows,
+    get_history_file,
+)
+
+
+def make_task(tmp_path, sid_dck, yyyy, mm, n_rows):
+    source_dir = tmp_path / "r1" / "ds" / "level1c" / sid_dck
+    level_dir = tmp_path / "r1" / "ds" / "level1d"
+    source_dir.mkdir(parents=True, exist_ok=True)
+    (level_dir / sid_dck).mkdir(parents=True, exist_ok=True)
+    filename = source_dir / f"header-{yyyy}-{mm}-r1-u1.psv"
+    filename.write_text("header\n" + "row\n" * n_rows)
+    (source_dir / f"observations-at-{yyyy}-{mm}-r1-u1.psv").write_text("at\n")
+    output = level_dir / sid_dck / f"header-{yyyy}-{mm}-r1-u1.psv"
+    output.write_text("header\n" + "row\n" * (n_rows - 1))
+    return {
+        "level": "level1d",
+        "sid_dck": sid_dck,
+        "yyyy": yyyy,
+        "mm": mm,
+        "filename": str(filename),
+        "paths": {"destination_directory": str(level_dir)},
+    }
+
+
+def test_record_query(tmp_path):
+    for mm, status in [("01", "success"), ("02", "failure")]:
+        config = make_task(tmp_path, "063-714", "2020", mm, 10)
+        record_task(config, status, time.time(), 60.0, 50.0, 500.0)
+    config = make_task(tmp_path, "069-701", "2021", "01", 10)
+    record_task(config, "success", time.time(), 60.0, 50.0, 500.0)
+
+    db_file = get_history_file(str(tmp_path / "r1" / "ds" / "level1d"))
+    assert db_file == str(tmp_path / "r1" / "ds" / "log" / "task_history.sqlite")
+    df = query_tasks(db_file, level="level1d")
+    assert len(df) == 3
+    df = query_tasks(db_file, sid_dck="063-714", year=[2020], status="success")
+    assert len(df) == 1
+    row = df.iloc[0]
+    assert row["month"] == 1
+    assert row["input_rows"] == 10
+    assert row["output_rows"] == 9
+    assert row["input_bytes"] == len("header\n" + "row\n" * 10) + len("at\n")
+    assert len(query_tasks(str(tmp_path / "missing.sqlite"))) == 0
+
+
+def test_fit_task_model(tmp_path):
+    for i, mm in enumerate(["01", "02", "03"]):
+        config = make_task(tmp_path, "063-714", "2020", mm, 10 ** (i + 3))
+        record_task(config, "success", time.time(), 600.0 * (i + 1), 1, 100.0 + i)
+    db_file = get_history_file(str(tmp_path / "r1" / "ds" / "level1d"))
+
+    model = fit_task_model(db_file, "level1d", margin=1.0)
+    assert model["memory_mb"][1] > 0
+    assert model["time_min"][1] > 0
+    assert fit_task_model(db_file, "level1d", min_tasks=4) is None
+    assert get_task_limits(db_file, "level1d", "063-714", margin=2.0) == (
+        pytest.approx(204.0),
+        pytest.approx(60.0),
+    )
+    assert get_task_limits(db_file, "level1d", "069-701") is None
+
+    # Later tasks of pool workers have no peak memory.
+    config = make_task(tmp_path, "069-701", "2020", "01", 10**6)
+    record_task(config, "success", time.time(), 6000.0, 1, None)
+    assert fit_task_model(db_file, "level1d", margin=1.0) == model
+    assert get_task_limits(db_file, "level1d", "069-701") is None
+
+
+def test_count_rows(tmp_path):
+    df = pd.DataFrame({"report_id": ["a", "b", "c"]})
+    df.to_parquet(tmp_path / "header.pq")
+    df.to_feather(tmp_path / "header.feather")
+    (tmp_path / "header.psv").write_text("report_id\na\nb\nc\n")
+    for ext in ["pq", "feather", "psv"]:
+        assert count_rows(str(tmp_path / f"header.{ext}")) == 3
+    assert count_rows(str(tmp_path / "missing.pq")) == 0
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import errno
+import importlib
+import os
+import sys
+
+import pytest
+
+import glamod_marine_processing
+
+scripts_path = os.path.join(
+    os.path.dirname(glamod_marine_processing.__file__), "obs_suite", "scripts"
+)
+
+
+@pytest.fixture(scope="module")
+def level2():
+    sys.path.insert(0, scripts_path)
+    try:
+        return importlib.import_module("level2")
+    finally:
+        sys.path.remove(scripts_path)
+
+
+def write_file(path, content="data"):
+    with open(path, "w") as f:
+        f.write(content)
+    return str(path)
+
+
+def test_list_files(tmp_path, level2):
+    for name in [
+        "header-2020-01-r-000000.pq",
+        "observations-at-2020-01-r-000000.pq",
+        ".observations-at-2020-01-r-000000.pq",
+        "header-2020-01-r-000000.psv",
+    ]:
+        write_file(tmp_path / name)
+    (tmp_path / "subdir.pq").mkdir()
+
+    assert level2.list_files(tmp_path) == [
+        "header-2020-01-r-000000.pq",
+        "observations-at-2020-01-r-000000.pq",
+    ]
+    assert level2.list_files(tmp_path, ext=".psv") == ["header-2020-01-r-000000.psv"]
+
+
+def test_select_files(level2):
+    file_names = [
+        "header-2000-01-r-000000.pq",
+        "observations-at-2000-01-r-000000.pq",
+        "observations-wd-2000-01-r-000000.pq",
+        "observations-slp-2000-01-r-000000.pq",
+        "header-1990-01-r-000000.pq",
+        "header-1500-01-r-000000.pq",
+        "header.pq",
+    ]
+    included, excluded = level2.select_files(
+        file_names, ["header", "observations-at"], ["observations-wd"], 1995, 2010
+    )
+    assert included == {
+        "header-2000-01-r-000000.pq": "in release period 1995-2010",
+        "observations-at-2000-01-r-000000.pq": "in release period 1995-2010",
+    }
+    assert excluded == {
+        "observations-wd-2000-01-r-000000.pq": "params_exclude",
+        "header-1990-01-r-000000.pq": "out of release period 1995-2010",
+    }
+
+
+def test_copy_file(tmp_path, level2):
+    src = write_file(tmp_path / "src.pq", "x" * 10000)
+    dst = str(tmp_path / "dst.pq")
+    level2.copy_file(src, dst)
+    assert open(dst).read() == "x" * 10000
+    assert not os.path.samefile(src, dst)
+
+
+def test_copy_file_fallback(tmp_path, level2, monkeypatch):
+    def copy_file_range(*args):
+        raise OSError(errno.EXDEV, "cross-device")
+
+    monkeypatch.setattr(os, "copy_file_range", copy_file_range, raising=False)
+    src = write_file(tmp_path / "src.pq")
+    dst = str(tmp_path / "dst.pq")
+    level2.copy_file(src, dst)
+    assert open(dst).read() == "data"
+
+
+def test_link_file(tmp_path, level2):
+    src = write_file(tmp_path / "src.pq")
+    dst = write_file(tmp_path / "dst.pq", "old")
+    level2.link_file(src, dst)
+    assert os.path.samefile(src, dst)
+    assert open(dst).read() == "data"
+
+
+@pytest.mark.parametrize("err", [errno.EXDEV, errno.EPERM, errno.EMLINK])
+def test_link_file_copy(tmp_path, level2, monkeypatch, err):
+    def link(src, dst):
+        raise OSError(err, os.strerror(err))
+
+    monkeypatch.setattr(os, "link", link)
+    src = write_file(tmp_path / "src.pq")
+    dst = str(tmp_path / "dst.pq")
+    level2.link_file(src, dst)
+    assert not os.path.samefile(src, dst)
+    assert open(dst).read() == "data"
+
+
+def test_link_file_error(tmp_path, level2, monkeypatch):
+    def link(src, dst):
+        raise OSError(errno.EACCES, os.strerror(errno.EACCES))
+
+    monkeypatch.setattr(os, "link", link)
+    src = write_file(tmp_path / "src.pq")
+    with pytest.raises(PermissionError):
+        level2.link_file(src, str(tmp_path / "dst.pq"))
+
+
+@pytest.mark.parametrize("transfer_mode", ["copy", "link"])
+def test_transfer_files(tmp_path, level2, transfer_mode):
+    source = tmp_path / "level1e"
+    dest = tmp_path / "level2"
+    source.mkdir()
+    dest.mkdir()
+    file_names = [f"header-2000-0{i}-r-000000.pq" for i in range(1, 4)]
+    for file_name in file_names:
+        write_file(source / file_name)
+
+    level2.transfer_files(
+        file_names, source, dest, transfer_mode=transfer_mode, n_workers=2
+    )
+    assert level2.list_files(dest) == file_names
+    linked = [os.path.samefile(source / f, dest / f) for f in file_names]
+    assert all(linked) == (transfer_mode == "link")
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import importlib
+import os
+import sys
+from types import SimpleNamespace
+
+import pandas as pd
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytest
+
+import glamod_marine_processing
+from glamod_marine_processing.obs_suite.scripts._utilities import (
+    level3_columns,
+    level3_schema,
+)
+
+scripts_path = os.path.join(
+    os.path.dirname(glamod_marine_processing.__file__), "obs_suite", "scripts"
+)
+
+fileID = "2020-01-release_8.0-000000"
+
+
+@pytest.fixture(scope="module")
+def level3():
+    sys.path.insert(0, scripts_path)
+    try:
+        return importlib.import_module("level3")
+    finally:
+        sys.path.remove(scripts_path)
+
+
+def make_header(report_ids):
+    n = len(report_ids)
+    return pd.DataFrame(
+        {
+            "report_id": report_ids,
+            "station_name": [f"SHIP{i}" for i in range(n)],
+            "primary_station_id": [f"ID{i}" for i in range(n)],
+            "longitude": [float(i) for i in range(n)],
+            "latitude": [float(-i) for i in range(n)],
+            "height_of_station_above_sea_level": [None] * n,
+            "report_timestamp": pd.date_range("2020-01-01", periods=n, freq="h"),
+            "report_meaning_of_timestamp": [2] * n,
+            "report_duration": [11] * n,
+            "source_id": ["ICOADS-3-0-0T"] * (n - 1) + ["unknown"],
+            "report_type": [0] * n,
+            "platform_type": [2] * n,
+        }
+    )
+
+
+def make_observations(report_ids, values, observed_variable=85):
+    n = len(report_ids)
+    return pd.DataFrame(
+        {
+            "observation_id": [
+                f"{r}-{observed_variable}-{i}" for i, r in enumerate(report_ids)
+            ],
+            "report_id": report_ids,
+            "observation_height_above_station_surface": [10.0] * n,
+            "z_coordinate": [None] * n,
+            "observed_variable": [observed_variable] * n,
+            "units": [5] * n,
+            "observation_value": values,
+            "quality_flag": [0] * n,
+            "data_policy_licence": [0] * n,
+            "value_significance": [2] * n,
+        }
+    )
+
+
+def make_params(tmp_path, output_mode=None):
+    prev_level_path = tmp_path / "level2"
+    level_path = tmp_path / "level3"
+    prev_level_path.mkdir()
+    level_path.mkdir()
+    make_header(["R0", "R1", "R2"]).to_parquet(prev_level_path / f"header-{fileID}.pq")
+    make_observations(["R2", "R0", "R1", "R3"], [1.0, 2.0, None, 4.0]).to_parquet(
+        prev_level_path / f"observations-at-{fileID}.pq"
+    )
+    make_observations(["R1"], [5.0], 58).to_parquet(
+        prev_level_path / f"observations-slp-{fileID}.pq"
+    )
+    return SimpleNamespace(
+        prev_level_path=str(prev_level_path),
+        level_path=str(level_path),
+        level_dataset_path=str(level_path / "dataset"),
+        prev_fileID=fileID,
+        fileID=fileID,
+        dataset="ICOADS_R3.0.2T",
+        sid_dck="063-714",
+        year="2020",
+        month="01",
+        output_mode=output_mode,
+        cdm_tables=["header", "observations-at", "observations-slp", "observations-wd"],
+    )
+
+
+def test_get_observations_table(level3):
+    header_table = level3.get_header_table(make_header(["R0", "R1", "R2"]))
+    obs_df = make_observations(
+        ["R2", "R0", "R1", "R3", "R0"], [1.0, 2.0, None, 4.0, 5.0]
+    )
+    result = level3.get_observations_table(header_table, obs_df)
+
+    assert result.schema.equals(level3_schema)
+    df = result.to_pandas()
+    assert list(df.columns) == level3_columns
+    assert list(df["report_id"]) == ["R0", "R0", "R2", "R3"]
+    assert list(df["observation_value"]) == [2.0, 5.0, 1.0, 4.0]
+    assert list(df["station_name"]) == ["SHIP0", "SHIP0", "SHIP2", None]
+    assert list(df["source_id"]) == [1, 1, pd.NA, pd.NA]
+    assert list(df["report_duration"]) == [8, 8, 8, pd.NA]
+    assert str(df["report_timestamp"].dt.tz) == "UTC"
+
+
+def test_process_table(tmp_path, level3):
+    params = make_params(tmp_path, "file")
+    assert level3.run(params) == 0
+
+    outname = os.path.join(params.level_path, "insitu-surface-marine_2020-01.pq")
+    metadata = pq.ParquetFile(outname).metadata
+    assert metadata.num_row_groups == 2
+    assert [metadata.row_group(i).num_rows for i in range(2)] == [3, 1]
+    assert sorted(os.listdir(params.level_path)) == [os.path.basename(outname)]
+
+    df = pd.read_parquet(outname)
+    assert list(df["report_id"]) == ["R0", "R2", "R3", "R1"]
+    assert list(df["observed_variable"]) == [85, 85, 85, 58]
+    assert df["source_id"].dtype == "Int64"
+    assert df["observation_value"].dtype == "Float64"
+    assert df["station_name"].dtype == object
+    assert df["report_timestamp"].dtype == "datetime64[ns, UTC]"
+
+
+def test_process_dataset(tmp_path, level3):
+    params = make_params(tmp_path, "dataset")
+    assert level3.run(params) == 0
+
+    dataset = ds.dataset(params.level_dataset_path, partitioning="hive")
+    table = dataset.to_table()
+    assert table.num_rows == 4
+    assert set(table["month"].to_pylist()) == {1}
+    assert sorted(table["report_id"].to_pylist()) == ["R0", "R1", "R2", "R3"]
+
+
+def test_process_table_empty(tmp_path, level3):
+    params = make_params(tmp_path, "file")
+    params.cdm_tables = ["header", "observations-wd"]
+    assert level3.run(params) == 0
+    assert os.listdir(params.level_path) == []
+
+
+def test_run_unknown_output_mode(tmp_path, level3):
+    params = make_params(tmp_path, "table")
+    assert level3.run(params) == 1
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import os
+
+from glamod_marine_processing.obs_suite.lotus_scripts._utilities import (
+    estimate_task,
+    get_fingerprint,
+    get_input_size,
+    get_task_workers,
+    get_tasks_per_node,
+    is_up_to_date,
+    pack_tasks,
+    scan_source,
+    select_source,
+)
+from glamod_marine_processing.utilities import save_json
+
+
+def test_estimate_task(tmp_path):
+    for table, size in [("header", 2), ("observations-at", 3), ("header", 5)]:
+        month = "01" if size < 5 else "02"
+        (tmp_path / f"{table}-2020-{month}-r1.pq").write_bytes(b"0" * size * 1024**2)
+
+    size_mb = get_input_size(str(tmp_path / "header-2020-01-r1.pq"))
+    assert size_mb == 5
+    task_model = {"memory_mb": [1000, 10.0], "time_min": [5, 0.5]}
+    assert estimate_task("level1c", size_mb, task_model) == (1050, 7.5)
+
+
+def test_pack_tasks():
+    tasks = [
+        {"command": str(i), "memory_mb": memory_mb, "time_min": i}
+        for i, memory_mb in enumerate([50, 70, 20, 40, 30, 60])
+    ]
+    bins = pack_tasks(tasks, memory_mb=100, n_tasks=2)
+    assert [[t["memory_mb"] for t in bin_["tasks"]] for bin_ in bins] == [
+        [70, 30],
+        [60, 40],
+        [50, 20],
+    ]
+    assert [bin_["time_min"] for bin_ in bins] == [4, 5, 2]
+
+    bins = pack_tasks(tasks, memory_mb=200, n_tasks=40)
+    assert [bin_["memory_mb"] for bin_ in bins] == [200, 70]
+
+    # Sharded tasks count as their number of workers.
+    for task in tasks[:3]:
+        task["workers"] = 20
+    bins = pack_tasks(tasks, memory_mb=200, n_tasks=40)
+    assert [[t["memory_mb"] for t in bin_["tasks"]] for bin_ in bins] == [
+        [70, 60, 40, 30],
+        [50, 20],
+    ]
+    assert [bin_["workers"] for bin_ in bins] == [23, 40]
+
+
+def test_get_task_workers():
+    config = {"shard_workers": 8, "shards": None, "063-714": {"shards": 4}}
+    assert get_task_workers(config, "063-714", "level1a") == 4
+    assert get_task_workers(config, "069-701", "level1a") == 8
+    assert get_task_workers(config, "069-701", "level1b") == 1
+    assert get_task_workers({"shard_size_mb": 500}, "063-714", "level1a") == 1
+    assert get_task_workers({"shards": 100}, "063-714", "level1a") == 40
+    assert get_tasks_per_node("level1a", 1000, 8) == 5
+    assert get_tasks_per_node("level1a", 95000, 8) == 2
+
+
+def test_fingerprint(tmp_path):
+    source_root = tmp_path / "ds" / "level1d"
+    source_dir = source_root / "063-714"
+    source_dir.mkdir(parents=True)
+    for month in ["01", "02", "03"]:
+        (source_dir / f"header-2020-{month}-r1.psv").write_text("header\n")
+    config = {
+        "level": "level1e",
+        "sid_dck": "063-714",
+        "yyyy": "2020",
+        "mm": "01",
+        "filename": str(source_dir / "header-2020-01-r1.psv"),
+        "abbreviations": {"dataset": "ds"},
+        "paths": {"source_directory": str(source_root)},
+        "qc_settings": {
+            "grouped_reports": {"buoy_dataset": "buoy_ds", "buoy_dck": "202412"}
+        },
+        "063-714": {"job_memo_mb": 1000},
+        "069-701": {"job_memo_mb": 1000},
+        "n_max_jobs": 2,
+    }
+    fingerprint = get_fingerprint(config)
+    assert get_fingerprint(config) == fingerprint
+
+    # Options not affecting the result and other sid-dcks are ignored.
+    changed = dict(config, n_max_jobs=8, process_list=["063-714"])
+    changed["069-701"] = {"job_memo_mb": 2000}
+    changed["072-702"] = {"job_memo_mb": 2000}
+    assert get_fingerprint(changed) == fingerprint
+    changed["063-714"] = {"job_memo_mb": 2000}
+    assert get_fingerprint(changed) != fingerprint
+    changed = dict(config, qc_settings={"buoy_dck": "202501"})
+    assert get_fingerprint(changed) != fingerprint
+
+    # Input and next month context changes are detected, other months are not.
+    os.utime(source_dir / "header-2020-03-r1.psv", ns=(0, 0))
+    assert get_fingerprint(config) == fingerprint
+    (source_dir / "observations-at-2020-02-r1.psv").write_text("at\n")
+    assert get_fingerprint(config) != fingerprint
+    fingerprint = get_fingerprint(config)
+    context_dir = source_root / "context" / "063-714"
+    context_dir.mkdir(parents=True)
+    (context_dir / "header-2019-12-r1.psv").write_text("header\n")
+    assert get_fingerprint(config) != fingerprint
+    fingerprint = get_fingerprint(config)
+
+    # Buoy data and context of the previous, current and next month as well.
+    buoy_root = tmp_path / "buoy_ds" / "level1d"
+    for buoy_dir in [buoy_root / "202412", buoy_root / "context" / "202412"]:
+        buoy_dir.mkdir(parents=True)
+        for month in ["2019-12", "2020-01", "2020-02", "2020-03"]:
+            (buoy_dir / f"header-{month}-r1.psv").write_text("header\n")
+            if month == "2020-03":
+                assert get_fingerprint(config) == fingerprint
+            else:
+                assert get_fingerprint(config) != fingerprint
+            fingerprint = get_fingerprint(config)
+    assert get_fingerprint(dict(config, no_qc_suite=True)) != fingerprint
+
+    success_file = tmp_path / "063-714_2020-01.success"
+    assert is_up_to_date(str(success_file), fingerprint) is False
+    success_file.write_text(fingerprint)
+    assert is_up_to_date(str(success_file), fingerprint) is True
+    assert is_up_to_date(str(success_file), "other") is False
+    success_file.write_text("")
+    assert is_up_to_date(str(success_file), "other") is False
+
+    # Fused tasks depend on upstream fingerprint and datetime leak content.
+    fused = get_fingerprint(config, upstream=fingerprint)
+    assert get_fingerprint(config, upstream="other") != fused
+    leak_file = source_dir / "header-2020-01-r1-2020-02.psv"
+    leak_file.write_text("leak\n")
+    assert get_fingerprint(config, upstream=fingerprint) != fused
+    fused = get_fingerprint(config, upstream=fingerprint)
+    os.utime(leak_file, ns=(0, 0))
+    assert get_fingerprint(config, upstream=fingerprint) == fused
+    (source_dir / "observations-at-2020-01-r1-2020-02.feather").write_bytes(b"at")
+    assert get_fingerprint(config, upstream=fingerprint) != fused
+
+
+def test_scan_source(tmp_path):
+    for sid_dck, years in [("063-714", [2019, 2020, 2021]), ("069-701", [2020])]:
+        (tmp_path / sid_dck).mkdir()
+        for yyyy in years:
+            for mm in ["01", "12"]:
+                (tmp_path / sid_dck / f"header-{yyyy}-{mm}-r1.psv").touch()
+                (tmp_path / sid_dck / f"observations-at-{yyyy}-{mm}-r1.psv").touch()
+    (tmp_path / "069-701" / "header.psv").touch()
+    save_json(
+        {
+            "source_directory": str(tmp_path / "069-701"),
+            "included": ["header-2020-01-r1.psv"],
+        },
+        tmp_path / "069-701" / "manifest.json",
+    )
+
+    table = scan_source(tmp_path, ["063-714", "069-701", "missing"], ["header-*"])
+    assert len(table) == 7
+    periods = {
+        "year_init": 2020,
+        "year_end": 2020,
+        "069-701": {"year_init": 1990, "year_end": 2020},
+    }
+    selected = select_source(table, periods)
+    assert selected[["sid_dck", "yyyy", "mm"]].values.tolist() == [
+        ["063-714", "2019", "12"],
+        ["063-714", "2020", "01"],
+        ["063-714", "2020", "12"],
+        ["063-714", "2021", "01"],
+        ["069-701", "2020", "01"],
+    ]
+    periods = {"year_init": 2019, "year_end": 2021}
+    selected = select_source(table, periods, one_task=True)
+    assert selected["filename"].tolist() == [
+        str(tmp_path / "063-714" / "header-2019-01-r1.psv"),
+        str(tmp_path / "069-701" / "header-2020-01-r1.psv"),
+    ]
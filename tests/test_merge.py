@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from glamod_marine_processing.merge.merge import (
+    concat_text_files,
+    copy_remaining,
+    merge,
+)
+from glamod_marine_processing.obs_suite.scripts._utilities import (
+    concat_table_files,
+    read_arrow_file,
+)
+
+
+@pytest.fixture
+def decks(tmp_path):
+    idir = tmp_path / "level1a"
+    header = {
+        "063-714": pd.DataFrame(
+            {
+                "report_id": ["A1", "A2", "A3"],
+                "report_timestamp": pd.to_datetime(
+                    ["2020-01-05", "2020-02-03", "2020-01-20"]
+                ),
+                "platform_sub_type": ["1", "2", "3"],
+            }
+        ),
+        "063-715": pd.DataFrame(
+            {
+                "report_id": ["B1", "B2"],
+                "report_timestamp": pd.to_datetime(["2020-02-10", "2020-01-01"]),
+                "platform_sub_type": [4, 5],
+            }
+        ),
+    }
+    for sid_dck, df in header.items():
+        (idir / sid_dck).mkdir(parents=True)
+        df.to_parquet(idir / sid_dck / f"header-{sid_dck}.pq", index=False)
+        obs = df[["report_id"]].assign(
+            date_time=df["report_timestamp"], observation_value=range(len(df))
+        )
+        obs.to_parquet(idir / sid_dck / f"observations-at-{sid_dck}.pq", index=False)
+    return idir
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_merge_unknown_dates(tmp_path, decks, parallel):
+    odir = tmp_path / "level1a_merged"
+    # Temporary directory of another merge into the same directory
+    (odir / ".merge-other").mkdir(parents=True)
+    merge(
+        decks,
+        odir,
+        release="r1",
+        update="u1",
+        prev_deck_list=["063-714", "063-715"],
+        parallel=parallel,
+    )
+
+    assert sorted(os.listdir(odir)) == [
+        ".merge-other",
+        "header-2020-01-r1-u1.pq",
+        "header-2020-02-r1-u1.pq",
+        "observations-at-2020-01-r1-u1.pq",
+        "observations-at-2020-02-r1-u1.pq",
+    ]
+    header = pd.read_parquet(odir / "header-2020-01-r1-u1.pq")
+    assert header["report_id"].tolist() == ["A1", "A3", "B2"]
+    assert header["platform_sub_type"].tolist() == ["1", "3", "5"]
+    header = pd.read_parquet(odir / "header-2020-02-r1-u1.pq")
+    assert header["report_id"].tolist() == ["A2", "B1"]
+    obs = pd.read_parquet(odir / "observations-at-2020-02-r1-u1.pq")
+    assert obs["report_id"].tolist() == ["A2", "B1"]
+    assert obs["observation_value"].tolist() == [1, 0]
+
+
+@pytest.mark.parametrize("copy_file_range", [True, False])
+def test_concat_text_files(tmp_path, monkeypatch, copy_file_range):
+    if not copy_file_range:
+        monkeypatch.delattr(os, "copy_file_range", raising=False)
+    lines = {
+        "a.psv": "report_id|value\nA1|1\nA2|2\n",
+        "b.psv": "report_id|value\nB1|3\n",
+        "c.psv": "report_id|value\n",
+        "d.psv": "report_id|value\nD1|4",
+    }
+    ifiles = []
+    for name, text in lines.items():
+        (tmp_path / name).write_text(text)
+        ifiles.append(tmp_path / name)
+
+    concat_text_files(ifiles, tmp_path / "out.psv")
+    assert (tmp_path / "out.psv").read_text() == (
+        "report_id|value\nA1|1\nA2|2\nB1|3\nD1|4"
+    )
+
+
+def test_copy_remaining_fallback(tmp_path, monkeypatch):
+    def copy_file_range(*args, **kwargs):
+        raise OSError("cross-device copy")
+
+    monkeypatch.setattr(os, "copy_file_range", copy_file_range, raising=False)
+    (tmp_path / "src").write_bytes(b"header\n" + b"x" * 100)
+    with open(tmp_path / "src", "rb") as fsrc, open(tmp_path / "dst", "wb") as fdst:
+        fdst.write(b"first\n")
+        fsrc.readline()
+        copy_remaining(fsrc, fdst)
+    assert (tmp_path / "dst").read_bytes() == b"first\n" + b"x" * 100
+
+
+def test_merge_known_dates(tmp_path):
+    idir = tmp_path / "level1a"
+    odir = tmp_path / "level1a_merged"
+    odir.mkdir()
+    name = "header-2020-01-r1-u1.pq"
+    (idir / "063-714").mkdir(parents=True)
+    (idir / "063-715").mkdir(parents=True)
+    pd.DataFrame({"report_id": ["A1", "A2"], "latitude": [1.0, 2.0]}).to_parquet(
+        idir / "063-714" / name, index=False, row_group_size=1
+    )
+    pd.DataFrame(
+        {"report_id": ["B1"], "latitude": [3], "station_name": ["ship"]}
+    ).to_parquet(idir / "063-715" / name, index=False)
+
+    merge(
+        idir,
+        odir,
+        release="r1",
+        update="u1",
+        prev_deck_list=["063-714", "063-715"],
+        date_avail=True,
+    )
+
+    assert pq.ParquetFile(odir / name).num_row_groups == 3
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(odir / name),
+        pd.DataFrame(
+            {
+                "report_id": ["A1", "A2", "B1"],
+                "latitude": [1.0, 2.0, 3.0],
+                "station_name": [None, None, "ship"],
+            }
+        ),
+    )
+
+
+@pytest.mark.parametrize("ext", ["pq", "feather"])
+def test_concat_table_files(tmp_path, ext):
+    shards = [
+        pd.DataFrame({"report_id": ["A1", "A2"], "latitude": [1.0, 2.0]}),
+        pd.DataFrame({"report_id": ["A2"], "latitude": [3], "station_name": ["s"]}),
+    ]
+    files = []
+    for i, df in enumerate(shards):
+        files.append(str(tmp_path / f"header-{i}.{ext}"))
+        if ext == "pq":
+            df.to_parquet(files[-1], index=False, row_group_size=1)
+        else:
+            df.to_feather(files[-1], chunksize=1, compression="uncompressed")
+    out_file = str(tmp_path / f"header.{ext}")
+
+    concat_table_files(files, out_file)
+
+    if ext == "pq":
+        assert pq.ParquetFile(out_file).num_row_groups == 3
+    pd.testing.assert_frame_equal(
+        read_arrow_file(out_file).to_pandas(),
+        pd.DataFrame(
+            {
+                "report_id": ["A1", "A2", "A2"],
+                "latitude": [1.0, 2.0, 3.0],
+                "station_name": [None, None, "s"],
+            }
+        ),
+    )
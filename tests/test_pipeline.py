@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+from glamod_marine_processing.obs_suite.lotus_scripts import pipeline
+from glamod_marine_processing.obs_suite.lotus_scripts._utilities import (
+    scan_source as _scan_source,
+)
+from glamod_marine_processing.obs_suite.lotus_scripts.pipeline import (
+    build_graph,
+    get_fused_levels,
+    get_groups,
+    get_task_config,
+    load_level,
+    shift_month,
+)
+from glamod_marine_processing.utilities import save_json
+
+
+def make_level(tmp_path, level):
+    config = {
+        "abbreviations": {"release": "r1", "update": "u1", "dataset": "ds"},
+        "paths": {
+            "config_files_path": str(tmp_path),
+            "scripts_directory": str(tmp_path),
+            "data_directory": str(tmp_path),
+        },
+        "release_periods_file": "periods.json",
+        "release_source": "r1",
+        "release_destination": "r1",
+        "dataset_source": "ds",
+        "dataset_destination": "ds",
+        "level": level,
+        "level_source": None,
+        "level_destination": level,
+        "overwrite": False,
+        "process_list": ["063-714", "202412"],
+        "year_init": None,
+        "year_end": None,
+    }
+    if level == "level1e":
+        config["qc_settings"] = {
+            "grouped_reports": {"buoy_dataset": "ds", "buoy_dck": "202412"}
+        }
+    config_file = tmp_path / f"{level}.json"
+    save_json(config, config_file)
+    return load_level(config_file)
+
+
+def test_shift_month():
+    assert shift_month("2020", "01", -1) == ("2019", "12")
+    assert shift_month("2020", "12", 1) == ("2021", "01")
+    assert shift_month("2020", "06", 0) == ("2020", "06")
+
+
+def test_build_graph(tmp_path):
+    save_json({"year_init": 2020, "year_end": 2020}, tmp_path / "periods.json")
+    for sid_dck in ["063-714", "202412"]:
+        source = tmp_path / "r1" / "ds" / "level1c" / sid_dck
+        source.mkdir(parents=True)
+        for mm in ["01", "02", "03"]:
+            (source / f"header-2020-{mm}-r1-u1.psv").touch()
+
+    levels = {
+        level: make_level(tmp_path, level)
+        for level in ["level1d", "level1e", "level2", "level3"]
+    }
+    nodes = build_graph(levels)
+
+    assert len(nodes) == 2 * (3 + 3 + 1 + 3)
+    node = nodes[("level1e", "063-714", "2020", "01")]
+    assert node["inputs"] == [("level1d", "063-714", "2020", "01")]
+    assert sorted(node["context"]) == [
+        ("level1d", "063-714", "2020", "02"),
+        ("level1d", "202412", "2020", "01"),
+        ("level1d", "202412", "2020", "02"),
+    ]
+    node = nodes[("level2", "063-714", None, None)]
+    assert node["inputs"] == []
+    assert len(node["context"]) == 3
+    node = nodes[("level3", "202412", "2020", "03")]
+    assert node["inputs"] == [("level2", "202412", None, None)]
+    assert all(node["status"] is None for node in nodes.values())
+
+    assert build_graph(levels, sid_dck="063-714") == nodes
+    nodes = build_graph(levels, sid_dck="202412")
+    assert len(nodes) == 3 + 3 + 1 + 3
+    assert {key[1] for key in nodes.keys()} == {"202412"}
+
+
+def test_build_graph_fused(tmp_path):
+    save_json({"year_init": 2020, "year_end": 2020}, tmp_path / "periods.json")
+    source = tmp_path / "r1" / "ds" / "level1a" / "063-714"
+    source.mkdir(parents=True)
+    for mm in ["01", "02"]:
+        (source / f"header-2020-{mm}-r1-u1.psv").touch()
+
+    levels = {
+        level: make_level(tmp_path, level)
+        for level in ["level1b", "level1c", "level1d", "level1e"]
+    }
+    for setup in levels.values():
+        setup["config"]["abbreviations_source"] = {"release_tag": "r1-u1"}
+    fused = get_fused_levels(levels, True)
+    assert fused == ["level1b", "level1c", "level1d"]
+    assert get_fused_levels(levels, False) == []
+    nodes = build_graph(levels, fused)
+
+    node = nodes[("level1c", "063-714", "2020", "01")]
+    assert node["context"] == []
+    assert node["fused_input"] == ("level1b", "063-714", "2020", "01")
+    assert nodes[("level1e", "063-714", "2020", "01")]["fused_input"] is None
+    groups = get_groups(nodes)
+    assert groups[("level1b", "063-714", "2020", "02")] == [
+        ("level1b", "063-714", "2020", "02"),
+        ("level1c", "063-714", "2020", "02"),
+        ("level1d", "063-714", "2020", "02"),
+    ]
+    config = get_task_config(
+        levels["level1d"], nodes[("level1d", "063-714", "2020", "02")]
+    )
+    assert config["filename"] == str(
+        tmp_path / "r1" / "ds" / "level1c" / "063-714" / "header-2020-02-r1-u1.*"
+    )
+
+    # A fused task is up to date only as a whole.
+    key = ("level1b", "063-714", "2020", "01")
+    log_dir = tmp_path / "r1" / "ds" / "level1b" / "log" / "063-714"
+    log_dir.mkdir(parents=True)
+    success_file = log_dir / "063-714_2020-01.success"
+    success_file.write_text("")
+    assert build_graph(levels)[key]["status"] is None
+    nodes = build_graph(levels)
+    success_file.write_text(pipeline.get_node_fingerprint(levels, nodes, key))
+    assert build_graph(levels)[key]["status"] == "success"
+    assert build_graph(levels, fused)[key]["status"] is None
+
+
+def test_build_graph_scans_once(tmp_path, monkeypatch):
+    save_json({"year_init": 2020, "year_end": 2020}, tmp_path / "periods.json")
+    for source_level, level in [("level1c", "level1d"), ("level1d", "level1e")]:
+        source = tmp_path / "r1" / "ds" / source_level / "063-714"
+        source.mkdir(parents=True)
+        log_dir = tmp_path / "r1" / "ds" / level / "log" / "063-714"
+        log_dir.mkdir(parents=True)
+        for mm in ["01", "02", "03"]:
+            (source / f"header-2020-{mm}-r1-u1.psv").touch()
+            (log_dir / f"063-714_2020-{mm}.success").write_text("fingerprint")
+
+    scanned = []
+
+    def scan_source(source_dir, process_list, source_pattern):
+        scanned.append((source_dir, *process_list))
+        return _scan_source(source_dir, process_list, source_pattern)
+
+    monkeypatch.setattr(pipeline, "scan_source", scan_source)
+    monkeypatch.setattr(pipeline, "get_fingerprint", lambda *args, **kw: "fingerprint")
+    levels = {level: make_level(tmp_path, level) for level in ["level1d", "level1e"]}
+    nodes = build_graph(levels)
+
+    assert all(
+        node["status"] == "success"
+        for key, node in nodes.items()
+        if key[1] == "063-714"
+    )
+    assert sorted(scanned) == [
+        (str(tmp_path / "r1" / "ds" / "level1c"), "063-714"),
+        (str(tmp_path / "r1" / "ds" / "level1c"), "202412"),
+        (str(tmp_path / "r1" / "ds" / "level1d"), "063-714"),
+    ]
+
+
+def test_run_graph_fused_order(tmp_path, monkeypatch):
+    save_json({"year_init": 2020, "year_end": 2020}, tmp_path / "periods.json")
+    source = tmp_path / "r1" / "ds" / "level1a" / "063-714"
+    source.mkdir(parents=True)
+    for mm in ["01", "02", "03", "04", "05"]:
+        (source / f"header-2020-{mm}-r1-u1.psv").touch()
+    levels = {
+        level: make_level(tmp_path, level)
+        for level in ["level1b", "level1c", "level1d"]
+    }
+    nodes = build_graph(levels, get_fused_levels(levels, True))
+
+    started = []
+
+    def prepare_group(levels, nodes, members, **kwargs):
+        started.append(members[0][3])
+
+    monkeypatch.setattr(pipeline, "prepare_group", prepare_group)
+    pipeline.run_graph(levels, nodes)
+
+    assert started == ["01", "03", "05", "02", "04"]
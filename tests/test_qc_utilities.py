@@ -0,0 +1,629 @@
+from __future__ import annotations
+
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from marine_qc import qc_grouped_reports
+from marine_qc.external_clim import Climatology
+
+import glamod_marine_processing
+from glamod_marine_processing.obs_suite.scripts._qc_utilities import (
+    GridIndex,
+    QCFlags,
+    concat_dataframes,
+    do_qc,
+    drop_failed_reports,
+    get_combined_input_values,
+    get_flags,
+    get_group_positions,
+    get_positions,
+    set_flags,
+)
+from glamod_marine_processing.obs_suite.scripts._utilities import (
+    create_consistent_datadict,
+    qc_context_columns,
+)
+
+config_file = os.path.join(
+    os.path.dirname(glamod_marine_processing.__file__),
+    "obs_suite",
+    "configuration_files",
+    "release_8.0",
+    "000000",
+    "ICOADS_R3.0.2T",
+    "level1e.json",
+)
+
+scripts_path = os.path.join(
+    os.path.dirname(glamod_marine_processing.__file__), "obs_suite", "scripts"
+)
+
+obs_values = {
+    "observations-at": (288.0, 1.0),
+    "observations-dpt": (283.0, 1.0),
+    "observations-slp": (101300.0, 100.0),
+    "observations-sst": (289.0, 0.5),
+    "observations-wd": (180.0, 90.0),
+    "observations-ws": (6.0, 2.0),
+    "observations-wbt": (285.0, 1.0),
+}
+
+
+def get_climatology_files(qc_settings):
+    """Get file name, variable name and time axis of all climatologies."""
+    files = {}
+
+    def walk(d):
+        if not isinstance(d, dict):
+            return
+        if "file_name" in d:
+            files.setdefault(d["file_name"], {})[d["clim_name"]] = d.get(
+                "time_axis", "time"
+            )
+        for v in d.values():
+            walk(v)
+
+    walk(qc_settings)
+    return files
+
+
+def write_climatology(filename, variables):
+    """Write constant pentad climatologies on a 5x5 degree grid."""
+    lat = np.arange(-87.5, 90, 5.0)
+    lon = np.arange(-177.5, 180, 5.0)
+    data_vars = {}
+    coords = {
+        "latitude": ("latitude", lat, {"standard_name": "latitude"}),
+        "longitude": ("longitude", lon, {"standard_name": "longitude"}),
+    }
+    for clim_name, time_axis in variables.items():
+        value = 0.5 if "stdev" in clim_name or "stdev" in filename else 10.0
+        data_vars[clim_name] = (
+            (time_axis, "latitude", "longitude"),
+            np.full((73, lat.size, lon.size), value, dtype="float32"),
+        )
+        coords[time_axis] = (
+            time_axis,
+            np.arange(73),
+            {"standard_name": "time", "units": "days since 2001-01-01"},
+        )
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    xr.Dataset(data_vars, coords=coords).to_netcdf(filename)
+
+
+@pytest.fixture(scope="module")
+def qc_settings():
+    with open(config_file) as f:
+        return json.load(f)["qc_settings"]
+
+
+@pytest.fixture(scope="module")
+def ext_path(tmp_path_factory, qc_settings):
+    ext_path = tmp_path_factory.mktemp("external_files")
+    for filename, variables in get_climatology_files(qc_settings).items():
+        write_climatology(str(ext_path / filename), variables)
+    return str(ext_path)
+
+
+def make_reports(prefix, ids, start, n_hours, seed):
+    """Make header and observations tables of ship tracks."""
+    rng = np.random.default_rng(seed)
+    header = []
+    for n, station_id in enumerate(ids):
+        hours = np.arange(n_hours)
+        header.append(
+            pd.DataFrame(
+                {
+                    "report_id": [f"{prefix}{station_id}-{h}" for h in hours],
+                    "primary_station_id": station_id,
+                    "latitude": 40.0 + n + 0.05 * hours,
+                    "longitude": -30.0 + 0.05 * hours,
+                    "report_timestamp": pd.Timestamp(start)
+                    + pd.to_timedelta(hours, unit="h"),
+                    "station_speed": 5.0,
+                    "station_course": 45.0,
+                }
+            )
+        )
+    header = pd.concat(header, ignore_index=True)
+    header["report_quality"] = 2
+    header["location_quality"] = 0
+    header["report_time_quality"] = 2
+    header["history"] = None
+    header.index = pd.Index(header["report_id"], name=None)
+
+    data_dict = {"header": header}
+    for table, (mean, std) in obs_values.items():
+        values = rng.normal(mean, std, len(header))
+        values[rng.random(len(header)) < 0.05] = mean + 50 * std
+        values[rng.random(len(header)) < 0.05] = np.nan
+        data_dict[table] = pd.DataFrame(
+            {
+                "report_id": header["report_id"],
+                "latitude": header["latitude"],
+                "longitude": header["longitude"],
+                "date_time": header["report_timestamp"],
+                "observation_value": values,
+                "quality_flag": 2,
+            },
+            index=header.index,
+        )
+    return data_dict
+
+
+def run_do_qc(qc_settings, ext_path, qc_workers, qc_executor=None, duplicates=False):
+    data_dict = make_reports("C", ["SHIP1", "SHIP2", "SHIP3"], "2020-01-30", 36, 1)
+    data_dict_add = make_reports("A", ["SHIP1", "SHIP2"], "2020-02-01", 12, 2)
+    data_dict_buoy = make_reports("B", ["BUOY1"], "2020-01-30", 24, 3)
+    if duplicates is True:
+        # Context reports that are also in the current month, with other values
+        copies = make_reports("C", ["SHIP1", "SHIP2"], "2020-01-30", 36, 4)
+        for table, df in copies.items():
+            df["latitude"] = df["latitude"] + 1.0
+            data_dict_add[table] = pd.concat([copies[table], data_dict_add[table]])
+            data_dict_buoy[table] = pd.concat([data_dict_buoy[table], df])
+    params = SimpleNamespace(
+        qc_settings=qc_settings,
+        history_explain="QC flags added",
+        qc_workers=qc_workers,
+        qc_executor=qc_executor,
+    )
+    qc_flags = do_qc(
+        data_dict_qc={table: df.copy() for table, df in data_dict.items()},
+        qc_flags=QCFlags.from_data_dict(data_dict),
+        params=params,
+        ext_path=ext_path,
+        data_dict_add=data_dict_add,
+        data_dict_buoy=data_dict_buoy,
+        perform_qc=True,
+    )
+    qc_flags.update_data_dict(data_dict)
+    return data_dict
+
+
+@pytest.fixture(scope="module")
+def expected(qc_settings, ext_path):
+    return run_do_qc(qc_settings, ext_path, 1)
+
+
+@pytest.mark.parametrize("qc_executor", ["thread", "process"])
+def test_do_qc_workers(qc_settings, ext_path, expected, qc_executor):
+    result = run_do_qc(qc_settings, ext_path, 2, qc_executor)
+
+    flags = expected["observations-sst"]["quality_flag"]
+    assert {0, 1}.issubset(set(flags))
+    for table, df in expected.items():
+        pd.testing.assert_frame_equal(
+            result[table].drop(columns="history", errors="ignore"),
+            df.drop(columns="history", errors="ignore"),
+        )
+
+
+def test_concat_dataframes():
+    df1 = pd.DataFrame({"value": [1.0, 2.0]}, index=["a", "b"])
+    df2 = pd.DataFrame({"value": [3.0, 4.0, 5.0]}, index=["b", "c", "c"])
+    empty = pd.DataFrame({"value": pd.Series(dtype="float64")})
+
+    result = concat_dataframes(empty, df1, df2)
+    pd.testing.assert_frame_equal(
+        result, pd.DataFrame({"value": [1.0, 2.0, 4.0]}, index=["a", "b", "c"])
+    )
+    pd.testing.assert_frame_equal(concat_dataframes(empty, empty), empty)
+
+
+def test_do_qc_context_duplicates(qc_settings, ext_path, expected):
+    result = run_do_qc(qc_settings, ext_path, 1, duplicates=True)
+
+    for table, df in expected.items():
+        pd.testing.assert_frame_equal(
+            result[table].drop(columns="history", errors="ignore"),
+            df.drop(columns="history", errors="ignore"),
+        )
+
+
+def write_level1d(path, data_dict, fileID):
+    """Write data dictionary as level1d parquet tables."""
+    os.makedirs(path, exist_ok=True)
+    for table, df in data_dict.items():
+        df.to_parquet(os.path.join(path, f"{table}-{fileID}.pq"), index=False)
+
+
+def test_level1e_cli(tmp_path, qc_settings, ext_path, expected):
+    release_path = tmp_path / "release_8.0"
+    source_path = release_path / "ICOADS_R3.0.2T" / "level1d"
+    level_path = release_path / "ICOADS_R3.0.2T" / "level1e"
+    buoy_path = release_path / "C-RAID_1.2" / "level1d" / "202412"
+    for path in ["063-714", "quicklooks/063-714", "log/063-714"]:
+        os.makedirs(level_path / path)
+    shutil.copytree(ext_path, tmp_path / "external_files")
+
+    write_level1d(
+        source_path / "063-714",
+        make_reports("C", ["SHIP1", "SHIP2", "SHIP3"], "2020-01-30", 36, 1),
+        "2020-01-000000",
+    )
+    write_level1d(
+        source_path / "063-714",
+        make_reports("A", ["SHIP1", "SHIP2"], "2020-02-01", 12, 2),
+        "2020-02-000000",
+    )
+    write_level1d(
+        buoy_path,
+        make_reports("B", ["BUOY1"], "2020-01-30", 24, 3),
+        "2020-01-000000",
+    )
+
+    config = {
+        "abbreviations": {"dataset": "ICOADS_R3.0.2T", "release": "release_8.0"},
+        "abbreviations_source": {"release_tag": "000000"},
+        "abbreviations_destination": {"release_tag": "000000"},
+        "paths": {
+            "data_directory": str(tmp_path),
+            "source_directory": str(source_path),
+            "destination_directory": str(level_path),
+        },
+        "level": "level1e",
+        "sid_dck": "063-714",
+        "yyyy": 2020,
+        "mm": 1,
+        "cdm_tables": ["header"] + list(obs_values.keys()),
+        "filename": str(source_path / "063-714" / "header-2020-01-000000.pq"),
+        "qc_settings": qc_settings,
+        "history_explain": "QC flags added",
+        "no_qc_suite": False,
+        "qc_workers": 2,
+        "qc_executor": "process",
+        "quicklook_plots": "none",
+    }
+    config_file = tmp_path / "level1e.json"
+    with open(config_file, "w") as f:
+        json.dump(config, f)
+
+    # Spawned QC workers import the script as a module
+    subprocess.run(
+        [sys.executable, os.path.join(scripts_path, "level1e.py"), str(config_file)],
+        check=True,
+    )
+
+    assert os.path.isfile(level_path / "quicklooks" / "063-714" / "2020-01-000000.json")
+    # Hourly buoy reports are cached in the level1e tree
+    assert not os.path.exists(buoy_path.parent / "context")
+    assert os.path.isfile(
+        level_path / "context" / "C-RAID_1.2" / "202412" / "header-2020-01-000000.pq"
+    )
+    for table, df in expected.items():
+        result = pd.read_parquet(level_path / "063-714" / f"{table}-2020-01-000000.pq")
+        assert sorted(result["report_id"]) == sorted(df["report_id"])
+    sst = pd.read_parquet(level_path / "063-714" / "observations-sst-2020-01-000000.pq")
+    assert {0, 1}.issubset(set(sst["quality_flag"]))
+
+
+@pytest.fixture(scope="module")
+def level1e():
+    sys.path.insert(0, scripts_path)
+    try:
+        return importlib.import_module("level1e")
+    finally:
+        sys.path.remove(scripts_path)
+
+
+@pytest.mark.parametrize("slim", [True, False])
+def test_create_context_dict(tmp_path, level1e, slim):
+    data_dict = make_reports("A", ["SHIP1", "SHIP2"], "2020-02-01", 12, 2)
+    data_dict["header"]["source_id"] = "ICOADS"
+    for table, df in data_dict.items():
+        if table != "header":
+            df["observation_value"] = df["observation_value"].fillna(0.0)
+            df.loc["ASHIP1-0", "quality_flag"] = 1
+            df.loc["ASHIP1-1", "observation_value"] = np.nan
+    write_level1d(tmp_path / "063-714", data_dict, "2020-02-000000")
+    if slim is True:
+        # As written by level1d: QC columns of valid and consistent reports
+        context = {}
+        for table, df in data_dict.items():
+            columns = qc_context_columns[
+                "header" if table == "header" else "observations"
+            ]
+            context[table] = df[columns].copy()
+        context, _ = create_consistent_datadict(context, remove_invalids=True)
+        write_level1d(tmp_path / "context" / "063-714", context, "2020-02-000000")
+
+    params = SimpleNamespace(
+        prev_level_path=str(tmp_path / "063-714"),
+        prev_level_context_path=str(tmp_path / "context" / "063-714"),
+        prev_fileID="2020-02-000000",
+    )
+    result = level1e.create_context_dict(list(data_dict.keys()), params)
+
+    assert sorted(result.keys()) == sorted(data_dict.keys())
+    assert ("source_id" in result["header"].columns) is not slim
+    for table, df in result.items():
+        if slim is True:
+            assert sorted(df.columns) == sorted(context[table].columns)
+        expected_ids = data_dict[table].index.drop(["ASHIP1-0", "ASHIP1-1"])
+        assert sorted(df.index) == sorted(expected_ids)
+
+
+def test_create_hourly_buoy_dict(tmp_path, level1e, monkeypatch):
+    data_dict = make_reports("B", ["BUOY1"], "2020-01-30", 24, 3)
+    for table, df in data_dict.items():
+        if table != "header":
+            df["observation_value"] = df["observation_value"].fillna(0.0)
+    # Half-hourly reports: keep the ones nearest to each whole hour
+    shifted = {table: df.copy() for table, df in data_dict.items()}
+    for table, df in shifted.items():
+        df.index = df["report_id"] = df["report_id"] + "-30"
+        time_axis = "report_timestamp" if table == "header" else "date_time"
+        df[time_axis] = df[time_axis] + pd.Timedelta(minutes=31)
+    write_level1d(
+        tmp_path / "level1d" / "202412",
+        {table: pd.concat([df, shifted[table]]) for table, df in data_dict.items()},
+        "2020-01-000000",
+    )
+
+    cache_path = tmp_path / "level1e" / "context" / "C-RAID_1.2" / "202412"
+    params = SimpleNamespace(
+        prev_level_path=str(tmp_path / "level1d" / "202412"),
+        prev_level_context_path=str(tmp_path / "level1d" / "context" / "202412"),
+        prev_fileID="2020-01-000000",
+        hourly_buoy_path=str(cache_path),
+        cdm_tables=list(data_dict.keys()),
+    )
+    tables_in = ["header", "observations-sst"]
+    result = level1e.create_hourly_buoy_dict(tables_in, params)
+
+    assert sorted(result.keys()) == tables_in
+    for table in tables_in:
+        assert sorted(result[table].index) == sorted(data_dict[table].index)
+        assert os.path.isfile(cache_path / f"{table}-2020-01-000000.pq")
+    assert os.listdir(tmp_path / "level1d") == ["202412"]
+
+    # Second deck of the same month reads the cache
+    monkeypatch.setattr(level1e, "create_context_dict", None)
+    cached = level1e.create_hourly_buoy_dict(tables_in, params)
+    for table in tables_in:
+        pd.testing.assert_index_equal(
+            cached[table].index.sort_values(),
+            result[table].index.sort_values(),
+            check_names=False,
+        )
+
+
+def make_positions(prefix, centres, n, spread, start, days, seed):
+    """Make reports scattered around centres [lat, lon]."""
+    rng = np.random.default_rng(seed)
+    dfs = []
+    for lat, lon in centres:
+        dfs.append(
+            pd.DataFrame(
+                {
+                    "latitude": np.clip(lat + rng.uniform(-spread, spread, n), -90, 90),
+                    "longitude": (lon + rng.uniform(-spread, spread, n) + 180) % 360
+                    - 180,
+                    "date_time": pd.Timestamp(start)
+                    + pd.to_timedelta(rng.uniform(0, days, n), unit="D"),
+                    "observation_value": rng.normal(0, 1, n),
+                }
+            )
+        )
+    df = pd.concat(dfs, ignore_index=True)
+    df.index = [f"{prefix}{i}" for i in range(len(df))]
+    df.loc[df.index[::25], "observation_value"] = 10.0
+    return df
+
+
+@pytest.mark.parametrize("limits", [[[1, 1, 2], [2, 2, 2]], [[2, 2, 4], [4, 4, 0]]])
+def test_select_neighbours(limits):
+    centres = [[0.5, 0.5], [45.0, -30.0], [88.0, 179.0], [-86.0, -179.5]]
+    data = make_positions("C", centres, 40, 2.0, "2020-01-20", 12, 1)
+    data_add = make_positions(
+        "A", centres + [[-40.0, 100.0], [20.0, 60.0]], 60, 6.0, "2019-12-20", 60, 2
+    )
+    grid_index = GridIndex(
+        pd.concat([data["latitude"], data_add["latitude"]]),
+        pd.concat([data["longitude"], data_add["longitude"]]),
+        pd.concat([data["date_time"], data_add["date_time"]]),
+    )
+    selected = grid_index.select_neighbours(
+        data_add, data.index, np.max(limits, axis=0)
+    )
+    assert 0 < len(selected) < len(data_add)
+
+    lat = np.arange(-89.5, 90, 1.0)
+    lon = np.arange(-179.5, 180, 1.0)
+    standard_deviation = Climatology(
+        xr.DataArray(
+            np.ones((73, lat.size, lon.size)),
+            coords={
+                "time": ("time", np.arange(73), {"standard_name": "time"}),
+                "latitude": ("latitude", lat, {"standard_name": "latitude"}),
+                "longitude": ("longitude", lon, {"standard_name": "longitude"}),
+            },
+        )
+    )
+
+    def buddy_check(df_add):
+        df = pd.concat([data, df_add])
+        qc_flags = qc_grouped_reports.do_mds_buddy_check(
+            lat=df["latitude"],
+            lon=df["longitude"],
+            date=df["date_time"],
+            value=df["observation_value"],
+            climatology=np.zeros(len(df)),
+            standard_deviation=standard_deviation,
+            limits=limits,
+            number_of_obs_thresholds=[[0, 5], [0]],
+            multipliers=[[4.0, 3.0], [4.0]],
+            ignore_indexes=np.arange(len(data), len(df)),
+        )
+        return qc_flags.iloc[: len(data)]
+
+    expected = buddy_check(data_add)
+    assert {0, 1}.issubset(set(expected))
+    pd.testing.assert_series_equal(buddy_check(selected), expected)
+
+
+def get_combined_input_values_by_label(tables, names, data_dict, drop_idx=None):
+    """Label-based reference of get_combined_input_values."""
+    inputs = {}
+    for ivar, table in tables.items():
+        series = data_dict[table][names[ivar]]
+        series = series[~series.index.duplicated(keep="first")]
+        if drop_idx is not None:
+            series = series.drop(index=series.index.intersection(drop_idx))
+        inputs[ivar] = series
+    common_indexes = set(inputs["at"].index).intersection(
+        *(series.index for series in inputs.values())
+    )
+    return {ivar: series.loc[sorted(common_indexes)] for ivar, series in inputs.items()}
+
+
+def make_table(report_ids, rng):
+    """Make observations table with shuffled and duplicated report_ids."""
+    report_ids = rng.permutation(report_ids)
+    report_ids = np.append(report_ids, report_ids[:3])
+    return pd.DataFrame(
+        {"observation_value": rng.normal(0, 1, len(report_ids))},
+        index=report_ids,
+    )
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("drop", [False, True])
+def test_get_combined_input_values(seed, drop):
+    rng = np.random.default_rng(seed)
+    report_ids = np.array([f"R{i}" for i in range(100)])
+    data_dict = {
+        table: make_table(rng.choice(report_ids, 70, replace=False), rng)
+        for table in ["observations-at", "observations-dpt"]
+    }
+    tables = {"at": "observations-at", "dpt": "observations-dpt"}
+    names = {"at": "observation_value", "dpt": "observation_value"}
+    drop_idx = pd.Index(rng.choice(report_ids, 20, replace=False)) if drop else None
+
+    result = get_combined_input_values(tables, names, data_dict, drop_idx=drop_idx)
+    expected = get_combined_input_values_by_label(
+        tables, names, data_dict, drop_idx=drop_idx
+    )
+    assert result["at"].index.equals(result["dpt"].index)
+    for ivar, series in result.items():
+        pd.testing.assert_series_equal(series.sort_index(), expected[ivar])
+
+
+def get_groups_by_label(index, group_df, column="primary_station_id"):
+    """Label-based reference of get_group_positions."""
+    group_df = group_df[~group_df.index.duplicated(keep="first")]
+    groups = []
+    for _, subset in group_df.groupby(column):
+        groups.append(sorted(index[index.isin(subset.index)]))
+    return [group for group in groups if group]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_get_group_positions(seed):
+    rng = np.random.default_rng(seed)
+    report_ids = np.array([f"R{i}" for i in range(200)])
+    group_df = pd.DataFrame(
+        {"primary_station_id": rng.choice(["SHIP1", "SHIP2", "SHIP3", None], 150)},
+        index=rng.permutation(report_ids[:150]),
+    )
+    group_df = pd.concat([group_df, group_df.iloc[:5].assign(primary_station_id="X")])
+    # Duplicated report_ids and report_ids missing in group_df
+    index = pd.Index(rng.choice(report_ids, 120, replace=False))
+    index = index.append(index[:10])
+
+    groups = get_group_positions(index, group_df)
+    assert [sorted(index[rows]) for rows in groups] == get_groups_by_label(
+        index, group_df
+    )
+    for rows in groups:
+        assert (np.diff(rows) > 0).all()
+
+
+def test_set_flags():
+    flags = pd.Series([2, 2, -1, 2], index=["R0", "R1", "R2", "R3"], dtype="int8")
+    set_flags(flags, np.array([3, -1, 1]), [1, 5, 0])
+    set_flags(flags, [2, -1], 3)
+    assert flags.dtype == "int8"
+    assert flags.tolist() == [2, 0, 3, 1]
+    assert get_flags(flags, [3, -1, 0]).tolist() == [1, -1, 2]
+
+
+def test_positions():
+    data = pd.DataFrame({"value": [1.0, 2.0, 3.0]}, index=["R0", "R1", "R2"])
+    flags = pd.Series([2, 1, 0], index=data.index, dtype="int8")
+    qc_flags = QCFlags(flags, flags, flags, {}, None)
+    qc_flags.add_positions({"header": data})
+    with pytest.raises(ValueError, match="not aligned"):
+        qc_flags.add_positions({"header": data.iloc[::-1]})
+
+    # Context reports have no positions
+    context = pd.DataFrame({"value": [4.0, 5.0]}, index=["A0", "R1"])
+    window = concat_dataframes(data.iloc[[2, 0]], context)
+    assert get_positions(window).tolist() == [2, 0, -1, -1]
+    assert get_positions(context).tolist() == [-1, -1]
+
+    result = drop_failed_reports(data, flags, 1)
+    assert result.index.tolist() == ["R0", "R2"]
+    assert drop_failed_reports(window, flags, 1) is window
+
+
+def test_qc_flags_update_data_dict():
+    header = pd.DataFrame(
+        {
+            "report_quality": [2, 2, 2, 2],
+            "location_quality": [0, 0, np.nan, 0],
+            "report_time_quality": ["2", "2", "2", "2"],
+            "history": [None, "h0", None, None],
+        },
+        index=["R0", "R1", "R2", "R3"],
+    )
+    at = pd.DataFrame({"quality_flag": [2, np.nan, 2]}, index=["R3", "R1", "R0"])
+    dpt = pd.DataFrame({"quality_flag": [2, 2]}, index=["R1", "R2"])
+    wbt = pd.DataFrame({"quality_flag": [2, 2]}, index=["R2", "R3"])
+    data_dict = {
+        "header": header,
+        "observations-at": at,
+        "observations-dpt": dpt,
+        "observations-wbt": wbt,
+    }
+    qc_flags = QCFlags.from_data_dict(data_dict)
+    assert qc_flags.location_quality.tolist() == [0, 0, -1, 0]
+    assert qc_flags.quality_flags["observations-at"].tolist() == [2, -1, 2]
+
+    set_flags(qc_flags.report_quality, [1], 1)
+    set_flags(qc_flags.location_quality, [1], 2)
+    set_flags(qc_flags.quality_flags["observations-at"], [2, -1], 0)
+    set_flags(qc_flags.quality_flags["observations-dpt"], [0, 1], [1, 0])
+    qc_flags.history.loc["R0"] = "h1"
+    qc_flags.copy_flags("observations-wbt", "observations-dpt")
+
+    # Flags of reports missing in a table are not written to other reports
+    qc_flags.quality_flags["observations-wbt"] = qc_flags.quality_flags[
+        "observations-wbt"
+    ].iloc[::-1]
+    qc_flags.update_data_dict(data_dict)
+
+    header = data_dict["header"]
+    assert header["report_quality"].tolist() == [2, 1, 2, 2]
+    assert header["report_quality"].dtype == "int64"
+    assert header["location_quality"].tolist()[:2] == [0, 2]
+    assert np.isnan(header["location_quality"].iloc[2])
+    assert header["report_time_quality"].tolist() == ["2", "2", "2", "2"]
+    assert header["history"].tolist() == ["h1", "h0", None, None]
+
+    at = data_dict["observations-at"]
+    assert at.index.tolist() == ["R3", "R1", "R0"]
+    assert at["quality_flag"].iloc[[0, 2]].tolist() == [2, 0]
+    assert np.isnan(at["quality_flag"].iloc[1])
+    assert data_dict["observations-dpt"]["quality_flag"].tolist() == [1, 0]
+    assert data_dict["observations-wbt"]["quality_flag"].tolist() == [0, 2]
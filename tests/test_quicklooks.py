@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import os
+
+import pandas as pd
+import pytest
+
+from glamod_marine_processing.quicklooks import plot_quicklooks
+from glamod_marine_processing.quicklooks.quicklooks import (
+    bin_qc_outcomes,
+    write_binned_qc_outcomes,
+)
+
+
+@pytest.fixture
+def qc_outcomes():
+    return {
+        "lat": pd.Series([0.5, 0.7, -45.2, 89.9, None]),
+        "lon": pd.Series([10.5, 10.2, 350.0, -179.9, 0.0]),
+        "value": pd.Series([280.0, 281.0, 275.0, 260.0, 270.0]),
+        "flags": pd.Series([0, 0, 1, 2, 3]),
+    }
+
+
+def test_bin_qc_outcomes(qc_outcomes):
+    binned = bin_qc_outcomes(**qc_outcomes)
+    lat_lon = binned[binned["plot"] == "lat_lon"]
+    assert lat_lon["count"].sum() == 4
+    assert lat_lon.groupby("flag")["count"].sum().to_dict() == {
+        "0": 2,
+        "1": 1,
+        "other": 1,
+    }
+    assert lat_lon[lat_lon["flag"] == "0"][["x", "y"]].values.tolist() == [[10.5, 0.5]]
+    assert lat_lon[lat_lon["flag"] == "1"][["x", "y"]].values.tolist() == [
+        [-9.5, -45.5]
+    ]
+    assert binned[binned["plot"] == "lat_var"]["count"].sum() == 4
+
+
+def test_plot_quicklooks(tmp_path, qc_outcomes):
+    ifile = os.path.join(tmp_path, "observations-at_2022-01_plot.pq")
+    write_binned_qc_outcomes(**qc_outcomes, filename=ifile)
+    plot_quicklooks(tmp_path)
+    for plot in ["lat_lon", "lat_var"]:
+        assert os.path.isfile(
+            os.path.join(tmp_path, f"observations-at_2022-01_{plot}.png")
+        )
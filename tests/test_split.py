@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import os
+
+import pandas as pd
+import pytest
+
+from glamod_marine_processing.split import split
+
+
+@pytest.fixture
+def merged_deck(tmp_path):
+    idir = tmp_path / "063-999"
+    idir.mkdir()
+    header = pd.DataFrame(
+        {
+            "report_id": ["R1", "R2", "R3", "R4"],
+            "source_id": [
+                "ICOADS-3-0-2T-063-714-2020-01",
+                "ICOADS-3-0-2T-063-715-2020-01",
+                "ICOADS-3-0-2T-063-714-2020-01",
+                "ICOADS-3-0-2T-063-716-2020-01",
+            ],
+        }
+    )
+    obs = pd.DataFrame(
+        {"report_id": ["R3", "R1", "R2", "R2"], "observation_value": [1, 2, 3, 4]}
+    )
+    header.to_parquet(idir / "header-2020-01-r1.pq", index=False)
+    obs.to_parquet(idir / "observations-at-2020-01-r1.pq", index=False)
+    header.to_csv(idir / "header-2020-02-r1.psv", sep="|", index=False)
+    return idir
+
+
+def test_split_column(tmp_path, merged_deck):
+    with pytest.warns(UserWarning, match="1 reports"):
+        split(merged_deck, tmp_path, ["063-714", "063-715"])
+
+    header = pd.read_parquet(tmp_path / "063-714" / "header-2020-01-r1.pq")
+    assert header["report_id"].tolist() == ["R1", "R3"]
+    obs = pd.read_parquet(tmp_path / "063-714" / "observations-at-2020-01-r1.pq")
+    assert obs["report_id"].tolist() == ["R3", "R1"]
+    obs = pd.read_parquet(tmp_path / "063-715" / "observations-at-2020-01-r1.pq")
+    assert obs["observation_value"].tolist() == [3, 4]
+    header = pd.read_csv(tmp_path / "063-715" / "header-2020-02-r1.psv", sep="|")
+    assert header["report_id"].tolist() == ["R2"]
+
+
+def test_split_mapping(tmp_path, merged_deck):
+    mapping = {"R1": "063-715", "R2": "063-715", "R3": "063-714", "R4": "063-714"}
+    split(merged_deck, tmp_path, ["063-714", "063-715"], mapping=mapping)
+
+    header = pd.read_parquet(tmp_path / "063-714" / "header-2020-01-r1.pq")
+    assert header["report_id"].tolist() == ["R3", "R4"]
+    obs = pd.read_parquet(tmp_path / "063-714" / "observations-at-2020-01-r1.pq")
+    assert obs["report_id"].tolist() == ["R3"]
+    assert not os.path.isdir(tmp_path / "063-716")
+    with pytest.warns(UserWarning, match="already split"):
+        split(merged_deck, tmp_path, ["063-714", "063-715"], mapping=mapping)
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import sys
+import time
+from types import SimpleNamespace
+
+from glamod_marine_processing.obs_suite.lotus_scripts import task_executor
+
+
+def is_running(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split(")")[-1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def test_run_command_timeout(tmp_path):
+    pid_file = tmp_path / "child.pid"
+    start = time.monotonic()
+    status = task_executor.run_command(
+        f"sleep 30 & echo $! > {pid_file}; wait", timeout=1
+    )
+    assert status is None
+    assert time.monotonic() - start < 15
+    # The child of the shell is terminated with its process group
+    assert not is_running(int(pid_file.read_text()))
+    assert task_executor.running == {}
+
+
+def test_kill_task_grace():
+    proc = task_executor.subprocess.Popen(
+        ["/bin/sh", "-c", "trap '' TERM; sleep 30 & wait; sleep 30"],
+        start_new_session=True,
+    )
+    time.sleep(0.5)
+    start = time.monotonic()
+    task_executor.kill_task(proc, grace=1)
+    assert proc.returncode == -9
+    assert time.monotonic() - start < 15
+
+
+def test_run_task_retry(tmp_path, monkeypatch):
+    delays = []
+    monkeypatch.setattr(
+        task_executor, "time", SimpleNamespace(sleep=delays.append, time=time.time)
+    )
+    count_file = tmp_path / "count"
+    task = {"command": f"echo x >> {count_file}; test $(wc -l < {count_file}) -ge 3"}
+
+    assert task_executor.run_task(task, retries=3, backoff=2) is True
+    assert delays == [2, 4]
+    assert len(count_file.read_text().splitlines()) == 3
+
+    count_file.unlink()
+    delays.clear()
+    assert task_executor.run_task(task, retries=1, backoff=2) is False
+    assert delays == [2]
+
+
+def test_run_task_timeout_retry(monkeypatch):
+    delays = []
+    monkeypatch.setattr(
+        task_executor, "time", SimpleNamespace(sleep=delays.append, time=time.time)
+    )
+    task = {"command": "sleep 30", "timeout": 0.5}
+    assert task_executor.run_task(task, retries=1, backoff=1) is False
+    assert delays == [1]
+
+
+def test_run_command_memory_limit():
+    command = f"{sys.executable} -c 'bytearray(512 * 1024**2)'"
+    assert task_executor.run_command(command) == 0
+    assert task_executor.run_command(command, memory_mb=256) != 0
+
+
+def test_run_tasks():
+    tasks = [{"command": "true"}, {"command": "false"}, {"command": "exit 3"}]
+    assert task_executor.run_tasks(tasks, n_jobs=2) == 2
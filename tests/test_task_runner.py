@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import importlib
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import glamod_marine_processing
+from glamod_marine_processing.obs_suite.lotus_scripts.task_runner import (
+    run_fused,
+    run_pool,
+)
+
+scripts_path = os.path.join(
+    os.path.dirname(glamod_marine_processing.__file__), "obs_suite", "scripts"
+)
+
+script = """
+import os
+import sys
+
+process_options = []
+
+
+def script_setup(process_options, argv):
+    return argv[-1]
+
+
+def run(params):
+    os.write(1, f"run {params}\\n".encode())
+    if params == "crash":
+        os._exit(9)
+    if params == "exit":
+        sys.exit(2)
+    return 0 if params == "success" else 1
+"""
+
+level_script = """
+import json
+from types import SimpleNamespace
+
+from _utilities import read_cdm_tables, write_cdm_tables
+
+process_options = []
+
+
+def script_setup(process_options, argv):
+    with open(argv[1]) as f:
+        return SimpleNamespace(**json.load(f))
+
+
+def run(params):
+    db = read_cdm_tables(params, "header")
+    if db.empty:
+        return 1
+    df = db["header"].copy()
+    df[params.level] = df["report_id"] + "-" + params.level
+    write_cdm_tables(params, df, tables="header")
+"""
+
+fused_levels = ["level1b", "level1c", "level1d"]
+fileID = "2020-01-r1-000000"
+
+
+def get_tasks(tmp_path, patterns):
+    script_file = tmp_path / "level_test.py"
+    script_file.write_text(script)
+    return [
+        {
+            "script": str(script_file),
+            "args": [str(tmp_path / "missing.input.jsonl"), pattern],
+            "log_dir": str(tmp_path),
+            "pattern": pattern,
+        }
+        for pattern in patterns
+    ]
+
+
+def test_run_pool(tmp_path):
+    tasks = get_tasks(tmp_path, ["success", "failure", "exit"])
+    assert run_pool(tasks, n_workers=1) == 0
+    assert os.path.isfile(tmp_path / "success.success")
+    assert os.path.isfile(tmp_path / "failure.failure")
+    assert os.path.isfile(tmp_path / "exit.failure")
+    assert (tmp_path / "success.out").read_text().startswith("run success")
+
+
+def test_run_pool_crash(tmp_path):
+    tasks = get_tasks(tmp_path, ["crash"])
+    assert run_pool(tasks, n_workers=1) == 1
+    assert os.path.isfile(tmp_path / "crash.failure")
+    assert not os.path.isfile(tmp_path / "crash.success")
+
+
+def get_fused_tasks(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(scripts_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    source = tmp_path / "level1a"
+    source.mkdir()
+    pd.DataFrame(
+        {"report_id": ["R0", "R1", "R2"], "longitude": [0.0, 1.0, 2.0]}
+    ).to_parquet(source / f"header-{fileID}.pq")
+
+    tasks = []
+    prev_level = "level1a"
+    for level in fused_levels:
+        script_file = tmp_path / f"fused_{level}.py"
+        script_file.write_text(level_script)
+        log_dir = tmp_path / level / "log"
+        log_dir.mkdir(parents=True)
+        config_file = log_dir / "063-714_2020-01.input"
+        config = {
+            "level": level,
+            "prev_level_path": str(tmp_path / prev_level),
+            "level_path": str(tmp_path / level),
+            "prev_fileID": fileID,
+            "fileID": fileID,
+            "table_format": "parquet",
+        }
+        config_file.write_text(json.dumps(config))
+        tasks.append(
+            {
+                "script": str(script_file),
+                "args": [str(config_file)],
+                "log_dir": str(log_dir),
+                "pattern": "063-714_2020-01",
+            }
+        )
+        prev_level = level
+    return tasks
+
+
+@pytest.mark.parametrize("write_intermediate", [False, True])
+def test_run_fused(tmp_path, monkeypatch, write_intermediate):
+    unfused_path = tmp_path / "unfused"
+    fused_path = tmp_path / "fused"
+    unfused_path.mkdir()
+    fused_path.mkdir()
+
+    for task in get_fused_tasks(unfused_path, monkeypatch):
+        assert run_fused([task]) == 0
+    tasks = get_fused_tasks(fused_path, monkeypatch)
+    assert run_fused(tasks, write_intermediate=write_intermediate) == 0
+    memory = importlib.import_module("_utilities")
+    assert memory.memory_tables == {}
+    assert memory.memory_options == {"keep": False, "write": True}
+
+    outname = f"header-{fileID}.pq"
+    for level in fused_levels:
+        assert os.path.isfile(fused_path / level / "log" / "063-714_2020-01.success")
+        written = os.path.isfile(fused_path / level / outname)
+        assert written == (write_intermediate or level == fused_levels[-1])
+    fused = pd.read_parquet(fused_path / fused_levels[-1] / outname)
+    unfused = pd.read_parquet(unfused_path / fused_levels[-1] / outname)
+    pd.testing.assert_frame_equal(fused, unfused)
+    assert list(fused.columns) == ["report_id", "longitude", *fused_levels]
+
+
+def test_run_fused_failure(tmp_path, monkeypatch):
+    tasks = get_fused_tasks(tmp_path, monkeypatch)
+    os.remove(tmp_path / "level1a" / f"header-{fileID}.pq")
+    assert run_fused(tasks) == 1
+    assert os.path.isfile(tmp_path / "level1b" / "log" / "063-714_2020-01.failure")
+    assert not os.path.isfile(tmp_path / "level1c" / "log" / "063-714_2020-01.out")
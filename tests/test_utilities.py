@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import os
+
+import pytest
+
+from glamod_marine_processing.utilities import (
+    add_counts,
+    glob_manifest,
+    load_task_config,
+    save_json,
+    save_task_table,
+    split_lines,
+)
+
+
+def test_glob_manifest(tmp_path):
+    source = tmp_path / "level1e"
+    level2 = tmp_path / "level2"
+    source.mkdir()
+    level2.mkdir()
+    for table in ["header", "observations-at", "observations-sst"]:
+        (source / f"{table}-2020-01-r1.pq").touch()
+        (level2 / f"{table}-2020-01-r1.pq").touch()
+
+    assert sorted(glob_manifest(level2, "*2020-01-*.pq")) == [
+        os.path.join(level2, f"{table}-2020-01-r1.pq")
+        for table in ["header", "observations-at", "observations-sst"]
+    ]
+
+    save_json(
+        {
+            "source_directory": str(source),
+            "included": {
+                "header-2020-01-r1.pq": "in release period 2020-2020",
+                "observations-at-2020-01-r1.pq": "in release period 2020-2020",
+            },
+            "excluded": {"observations-sst-2020-01-r1.pq": "params_exclude"},
+        },
+        level2 / "manifest.json",
+    )
+    assert sorted(glob_manifest(level2, "*2020-01-*.pq")) == [
+        os.path.join(source, "header-2020-01-r1.pq"),
+        os.path.join(source, "observations-at-2020-01-r1.pq"),
+    ]
+    assert glob_manifest(level2, "observations-sst-*.pq") == []
+
+
+def test_task_table(tmp_path):
+    table_file = tmp_path / "063-714.input.jsonl"
+    tasks = [
+        {"pattern": f"063-714_2020-{mm}", "yyyy": "2020", "mm": mm}
+        for mm in ["01", "02"]
+    ]
+    save_task_table({"level": "level1a", "mm": None}, tasks, table_file)
+
+    config = load_task_config(table_file, "063-714_2020-02")
+    assert config == {
+        "level": "level1a",
+        "mm": "02",
+        "pattern": "063-714_2020-02",
+        "yyyy": "2020",
+    }
+    with pytest.raises(KeyError):
+        load_task_config(table_file, "063-714_2020-03")
+    save_json({"level": "level1a"}, tmp_path / "task.input")
+    assert load_task_config(tmp_path / "task.input") == {"level": "level1a"}
+
+
+def test_split_lines(tmp_path):
+    lines = [f"{i:04d}" + "x" * (i % 7) + "\n" for i in range(100)]
+    filename = tmp_path / "IMMA1_2020-01"
+    filename.write_text("".join(lines))
+    shard_path = tmp_path / "shards"
+    shard_path.mkdir()
+
+    shard_files = split_lines(filename, 3, shard_path)
+    assert [os.path.basename(f) for f in shard_files] == [
+        "IMMA1_2020-01.000",
+        "IMMA1_2020-01.001",
+        "IMMA1_2020-01.002",
+    ]
+    shards = [open(f).read() for f in shard_files]
+    assert "".join(shards) == "".join(lines)
+    assert all(shard.endswith("\n") for shard in shards)
+    assert len(split_lines(filename, 200, shard_path)) == 100
+
+
+def test_add_counts():
+    counts = {"read": {"total": 2}, "invalid": {"core.DY": {"values": [1]}}}
+    other = {
+        "read": {"total": 3},
+        "invalid": {"core.DY": {"values": [2]}, "total": 1},
+        "date processed": "2020-01-01",
+    }
+    assert add_counts(counts, other) == {
+        "read": {"total": 5},
+        "invalid": {"core.DY": {"values": [1, 2]}, "total": 1},
+        "date processed": "2020-01-01",
+    }